@@ -1,24 +1,112 @@
-from flask import Flask, request, jsonify
+import os
+
+from flask import Flask, request, jsonify, Response, stream_with_context
+import numpy as np
 import pandas as pd
 from flask_cors import CORS
 
+import forecast_grid
+import inventory_sim
+from count_distribution import DEFAULT_QUANTILES, DISTRIBUTION_MAX_COUNT
+from coalescer import RequestCoalescer
+import streaming
+from lag_store import load_lag_store
+from model_artifact import ZINB_ARTIFACT_PATH
+from model_registry import ModelRegistry, UnknownModel
+from model_state import ModelNotReady, ModelState
+from prediction_cache import PredictionCache
+from shared_segment import SHARED_SEGMENT, SHARED_SEGMENT_DIR, SharedLagStore, SharedSegment, SharedPredictionCache
+from station_store import StationStore, STATION_FEATURES_PATH, UnknownStation
+from weather_store import WeatherStore
+
+ZINB_MODEL_PATH = os.getenv('ZINB_MODEL_PATH', 'zinb_models.pkl')
+# 仅用于迁移：允许在没有 artifact 时反序列化 pickle（不安全，且冷启动慢）
+ZINB_ALLOW_PICKLE = os.getenv('ZINB_ALLOW_PICKLE', '0') == '1'
+
 print("=" * 60)
 print("Using ZINB (Zero-Inflated Negative Binomial) Model")
 print("=" * 60)
 
-# 尝试加载 ZINB 模型，如果失败则回退到简单预测器
-try:
-    from zinb_predictor import ZINBPredictor
-    model = ZINBPredictor('zinb_models.pkl')
-    print("✓ ZINB Predictor ready")
-    model_type_class = ZINBPredictor
-except Exception as e:
-    print(f"✗ Error loading ZINB model: {e}")
-    print("Falling back to Simple Predictor...")
+
+def build_registry():
+    """
+    模型注册表：MODEL_DIR 中的 artifact + ZINB_ARTIFACT_PATH + 规则模型（始终可用），
+    后台线程监视目录，新版本加载完成后原子替换
+    """
     from simple_predictor import SimpleBikePredictor
-    model = SimpleBikePredictor()
-    model_type_class = SimpleBikePredictor
-    print("✓ Simple Predictor ready (fallback)")
+    registry = ModelRegistry(extra_paths=[ZINB_ARTIFACT_PATH])
+    registry.register('rules', SimpleBikePredictor())
+    if not os.path.exists(ZINB_ARTIFACT_PATH) and os.path.exists(ZINB_MODEL_PATH):
+        if not ZINB_ALLOW_PICKLE:
+            # 有训练好的模型却只能服务规则模型：直接报错，而不是悄悄降级
+            raise RuntimeError(f"{ZINB_MODEL_PATH} exists but {ZINB_ARTIFACT_PATH} does not; run "
+                               f"`make export-model` (or `python model_artifact.py export`), "
+                               f"or set ZINB_ALLOW_PICKLE=1")
+        from zinb_predictor import ZINBPredictor
+        print(f"⚠ Warning: unpickling {ZINB_MODEL_PATH}; run `python model_artifact.py export` instead")
+        registry.register('zinb', ZINBPredictor(ZINB_MODEL_PATH))
+    registry.scan()
+    if registry.default_name == 'rules':
+        print("⚠ No model artifacts found, serving the Simple Predictor (fallback)")
+    print(f"✓ Models: {sorted(e['name'] for e in registry.describe())}, default '{registry.default_name}'")
+    return registry
+
+# 站点特征表：启动时加载一次，请求只需携带 station_id / station_name
+station_store = StationStore.load(STATION_FEATURES_PATH)
+
+# gunicorn：系数、站点特征表、滞后计数和预测缓存放在共享内存段，所有 worker 映射同一份
+segment = SharedSegment(SHARED_SEGMENT_DIR) if SHARED_SEGMENT else None
+
+# 滚动滞后特征（last_hour / last_day ...），由 LAG_REPLAY_PATHS 回放或 /trips 增量写入
+lag_store = load_lag_store(store=SharedLagStore(segment) if segment is not None else None)
+
+# 天气：观测文件启动时加载一次，按 timestamp 批量查找；WEATHER_FORECAST_PATH 可接入预报
+weather_store = WeatherStore.load()
+
+# 预测缓存：按量化后的模型输入向量 + 模型版本缓存结果
+if segment is not None:
+    segment.share('stations', station_store)
+    prediction_cache = SharedPredictionCache(segment)
+    print(f"✓ Shared segment ready at {SHARED_SEGMENT_DIR}")
+else:
+    prediction_cache = PredictionCache()
+
+
+# 模型加载方式由 MODEL_LOAD 决定（eager / background / lazy），见 model_state.py
+model_state = ModelState(build_registry).start()
+
+MODEL_TYPES = {
+    "ZINBPredictor": "ZINB Model",
+    "NBModelPredictor": "NB Model",
+    "ZINBBankPredictor": "ZINB Station Bank",
+}
+
+
+def model_type_name(model):
+    return MODEL_TYPES.get(type(model).__name__, "Simple Predictor")
+
+
+def resolve_model(name=None):
+    """
+    请求选择的模型：?model=<name>（或 batch body 中的 "model"），默认模型兜底
+    """
+    return model_state.get().entry(name or request.args.get("model"))
+
+
+def enrich(data):
+    """
+    Fill request features: lag counts first, then station attributes,
+    weather for each timestamp, and defaults for anything still missing
+    """
+    return weather_store.enrich(station_store.enrich(lag_store.enrich(data)))
+
+# 线程模式（gthread）下合并并发请求，批量打分
+SERVING_MODE = os.getenv('SERVING_MODE', 'sync')
+coalescer = None
+if SERVING_MODE == 'threaded':
+    coalescer = RequestCoalescer(prediction_cache.predict)
+    print(f"✓ Request coalescer enabled (max batch {coalescer.max_batch}, "
+          f"max wait {coalescer.max_wait * 1000:.1f} ms)")
 
 print("=" * 60)
 
@@ -27,22 +115,58 @@ CORS(app)
 
 @app.route("/")
 def home():
-    model_type = "ZINB Model" if model_type_class.__name__ == "ZINBPredictor" else "Simple Predictor (fallback)"
+    if not model_state.ready:
+        model_type = "loading"
+    else:
+        model_type = model_type_name(model_state.model.get())
+        if model_type == "Simple Predictor":
+            model_type = "Simple Predictor (fallback)"
     return {
         "status": "Flask backend running",
         "model": model_type,
+        "stations": len(station_store),
+        "weather_records": len(weather_store),
         "version": "4.0"
     }
 
 @app.route("/predict", methods=["POST"])
 def predict():
+    # Opt-in streaming: Accept: application/x-ndjson or text/csv
+    stream_format = streaming.negotiate(request.accept_mimetypes)
+    if stream_format:
+        try:
+            model = resolve_model().model
+        except ModelNotReady as e:
+            return jsonify({"error": str(e)}), 503
+        except UnknownModel as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            chunk_size = forecast_grid.chunk_size_arg(request.args.get("chunk_size"), streaming.STREAM_CHUNK_SIZE)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        rows = streaming.iter_request_rows(request)
+        mimetype = "application/x-ndjson" if stream_format == "ndjson" else "text/csv"
+        return Response(
+            stream_with_context(streaming.stream_predictions(
+                model, rows, stream_format, chunk_size, enrich=enrich, cache=prediction_cache)),
+            mimetype=mimetype
+        )
+
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data"}), 400
 
-        # Predict
-        result = model.predict(data if isinstance(data, list) else [data])
+        entry = resolve_model()
+
+        # Fill lag counts, station attributes and time features from the stores
+        df = enrich(pd.DataFrame(data if isinstance(data, list) else [data]))
+
+        # Predict (only cache misses reach the model; coalesced in threaded mode)
+        if coalescer is not None:
+            result = coalescer.submit(entry.model, df)
+        else:
+            result = prediction_cache.predict(entry.model, df)
 
         # Format
         predictions = []
@@ -52,18 +176,297 @@ def predict():
                 'departures': int(result['departures'][i])
             })
 
-        model_type = "ZINB Model" if model_type_class.__name__ == "ZINBPredictor" else "Simple Predictor"
         return jsonify({
             "predictions": predictions,
-            "model_type": model_type,
+            "model_type": model_type_name(entry.model),
+            "model_name": entry.name,
+            "model_version": entry.version,
             "num_stations": len(predictions)
         })
 
+    except ModelNotReady as e:
+        return jsonify({"error": str(e)}), 503
+    except (UnknownModel, UnknownStation) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         return jsonify({"error": str(e)}), 500
 
+@app.route("/predict/distribution", methods=["POST"])
+def predict_distribution():
+    """
+    Predictive distribution per row for arrivals and departures
+
+    Body: {"rows": [{...}, ...]} or {"columns": {...}} (as /predict/batch), plus
+          "quantiles": [0.5, 0.9, 0.95], "at_least": [5, 10],
+          "max_count": 100, "pmf": false, "model": "<name>"
+    Returns structural-zero probability, NB mean and dispersion, P(0),
+    quantiles, P(Y >= k) and tail mass beyond max_count (plus the PMF if asked)
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data"}), 400
+        if not isinstance(data, dict):
+            data = {"rows": data}
+
+        entry = resolve_model(data.get("model"))
+        if not hasattr(entry.model, "predict_distribution"):
+            return jsonify({"error": f"Model '{entry.name}' does not provide predictive distributions"}), 400
+
+        if "columns" in data:
+            df = pd.DataFrame(enrich(forecast_grid.columns_from_payload(data["columns"])))
+        else:
+            rows = data.get("rows")
+            if not rows:
+                return jsonify({"error": "Expected 'rows' list or 'columns' object"}), 400
+            df = enrich(pd.DataFrame(rows if isinstance(rows, list) else [rows]))
+
+        result = entry.model.predict_distribution(
+            df,
+            quantiles=data.get("quantiles", DEFAULT_QUANTILES),
+            at_least=data.get("at_least", ()),
+            max_count=data.get("max_count", DISTRIBUTION_MAX_COUNT),
+            include_pmf=bool(data.get("pmf", False)),
+        )
+        return jsonify({
+            **result,
+            "model_type": model_type_name(entry.model),
+            "model_name": entry.name,
+            "model_version": entry.version,
+            "num_rows": len(df)
+        })
+
+    except ModelNotReady as e:
+        return jsonify({"error": str(e)}), 503
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/predict/batch", methods=["POST"])
+def predict_batch():
+    """
+    Columnar batch forecast
+
+    Grid mode:     {"stations": [{...station features...}], "start": "...", "hours": 168}
+                   (or "end" instead of "hours"); stations may be ids only,
+                   e.g. [{"station_id": "M32006"}]
+    Columnar mode: {"columns": {"hour_of_day": [...], "month": [...], ...}}
+                   or {"columns": {"station_id": [...], "timestamp": [...]}}
+    Either mode accepts "model": "<name>" (see /models)
+    """
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data, dict):
+            return jsonify({"error": "No data"}), 400
+
+        entry = resolve_model(data.get("model"))
+        model = entry.model
+        model_info = {
+            "model_type": model_type_name(model),
+            "model_name": entry.name,
+            "model_version": entry.version,
+        }
+        chunk_size = forecast_grid.chunk_size_arg(data.get("chunk_size"))
+
+        if "columns" in data:
+            columns = enrich(forecast_grid.columns_from_payload(data["columns"]))
+            result = forecast_grid.predict_columns(model, columns, chunk_size)
+            return jsonify({
+                "arrivals": result['arrivals'].tolist(),
+                "departures": result['departures'].tolist(),
+                **model_info,
+                "num_rows": len(result['arrivals'])
+            })
+
+        stations = data.get("stations")
+        if not stations or not isinstance(stations, list):
+            return jsonify({"error": "Expected 'stations' list or 'columns' object"}), 400
+        timestamps = forecast_grid.hour_range(data.get("start"), data.get("hours"), data.get("end"))
+        columns = forecast_grid.expand_grid(stations, timestamps)
+        # Absolute hours for the lag lookup
+        columns["timestamp"] = np.tile(timestamps.to_numpy(), len(stations))
+        columns = enrich(columns)
+        result = forecast_grid.predict_columns(model, columns, chunk_size)
+
+        # station-major grid: [station][hour]
+        shape = (len(stations), len(timestamps))
+        station_ids = [s.get("station_id", s.get("station_name", i)) for i, s in enumerate(stations)]
+        return jsonify({
+            "station_ids": station_ids,
+            "timestamps": timestamps.strftime("%Y-%m-%dT%H:%M:%S").tolist(),
+            "arrivals": result['arrivals'].reshape(shape).tolist(),
+            "departures": result['departures'].reshape(shape).tolist(),
+            **model_info,
+            "num_rows": shape[0] * shape[1]
+        })
+
+    except ModelNotReady as e:
+        return jsonify({"error": str(e)}), 503
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/simulate", methods=["POST"])
+def simulate_inventory():
+    """
+    Monte Carlo dock-inventory projection (see inventory_sim.py)
+
+    Body: {"stations": [{"station_id": "M32006", "inventory": 7, "capacity": 19}, ...],
+           "start": "...", "hours": 24 (or "end"), "samples": 2000, "seed": 0,
+           "quantiles": [0.1, 0.5, 0.9], "model": "<name>"}
+    Returns [station][hour] grids of expected inventory, inventory quantiles,
+    P(empty) / P(full) at the end of each hour, cumulative P(stockout) /
+    P(overflow), expected unmet departures / blocked arrivals and expected
+    net flow
+    """
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data, dict):
+            return jsonify({"error": "No data"}), 400
+
+        entry = resolve_model(data.get("model"))
+        model = entry.model
+        if not hasattr(model, "count_params"):
+            return jsonify({"error": f"Model '{entry.name}' does not provide count distributions"}), 400
+
+        stations = data.get("stations")
+        if not stations or not isinstance(stations, list):
+            return jsonify({"error": "Expected 'stations' list"}), 400
+        if any(s.get("inventory") is None or s.get("capacity") is None for s in stations):
+            return jsonify({"error": "Each station needs 'inventory' and 'capacity'"}), 400
+
+        timestamps = forecast_grid.hour_range(data.get("start"), data.get("hours", 24), data.get("end"))
+        features = [{k: v for k, v in s.items() if k not in ("inventory", "capacity")} for s in stations]
+        columns = forecast_grid.expand_grid(features, timestamps)
+        columns["timestamp"] = np.tile(timestamps.to_numpy(), len(stations))
+        mu, pi, alpha = model.count_params(pd.DataFrame(enrich(columns)))
+
+        shape = (len(stations), len(timestamps), 2)
+        quantiles = data.get("quantiles", inventory_sim.INVENTORY_QUANTILES)
+        result = inventory_sim.simulate(
+            mu.reshape(shape), pi.reshape(shape), alpha if np.ndim(alpha) == 1 else np.reshape(alpha, shape),
+            inventory=[s["inventory"] for s in stations],
+            capacity=[s["capacity"] for s in stations],
+            n_samples=data.get("samples", inventory_sim.SIM_SAMPLES),
+            seed=data.get("seed", 0),
+            quantiles=quantiles,
+        )
+        inventory_quantiles = result.pop("inventory_quantiles")
+        return jsonify({
+            "station_ids": [s.get("station_id", s.get("station_name", i)) for i, s in enumerate(stations)],
+            "timestamps": timestamps.strftime("%Y-%m-%dT%H:%M:%S").tolist(),
+            **{name: values.tolist() for name, values in result.items()},
+            "inventory_quantiles": {f"{float(q):g}": inventory_quantiles[:, i].tolist()
+                                    for i, q in enumerate(quantiles)},
+            "samples": int(data.get("samples", inventory_sim.SIM_SAMPLES)),
+            "seed": data.get("seed", 0),
+            "model_type": model_type_name(model),
+            "model_name": entry.name,
+            "model_version": entry.version,
+        })
+
+    except ModelNotReady as e:
+        return jsonify({"error": str(e)}), 503
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/trips", methods=["POST"])
+def ingest_trips():
+    """
+    Feed completed trip records into the lag store
+
+    Body: [{"started_at": "...", "ended_at": "...",
+            "start_station_id": "...", "end_station_id": "..."}, ...]
+    Under gunicorn the store is in the shared segment, so every worker sees
+    the update. Trips ending more than LAG_FUTURE_TOLERANCE_HOURS ahead of
+    now are rejected (counted in "rejected_future").
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data"}), 400
+        trips = pd.DataFrame(data if isinstance(data, list) else [data])
+        rejected = lag_store.add_trips(trips)
+        return jsonify({
+            "ingested": len(trips) - rejected,
+            "rejected_future": rejected,
+            "stations": len(lag_store),
+            "latest_hour": (pd.Timestamp(lag_store.head_hour, unit='h').isoformat()
+                            if lag_store.head_hour >= 0 else None)
+        })
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/cache", methods=["GET"])
+def cache_stats():
+    stats = prediction_cache.stats()
+    if coalescer is not None:
+        stats["coalescer"] = coalescer.stats()
+    return jsonify(stats)
+
+@app.route("/models", methods=["GET"])
+def list_models():
+    try:
+        return jsonify({"models": model_state.get().describe()})
+    except ModelNotReady as e:
+        return jsonify({"error": str(e)}), 503
+
+@app.route("/models/reload", methods=["POST"])
+def reload_models():
+    """
+    Rescan the artifact directory now instead of waiting for the watcher
+    (this worker only; the others pick changes up on their next poll).
+    If the initial load failed, retry it now instead of after the backoff.
+    """
+    try:
+        model_state.retry(force=True)
+        registry = model_state.get()
+        loaded = registry.scan()
+        return jsonify({
+            "loaded": [{"name": name, "version": version} for name, version in loaded],
+            "models": registry.describe()
+        })
+    except ModelNotReady as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        # The load failed again; the status says when the next retry is due
+        return jsonify({"error": str(e), "status": model_state.status()}), 503
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """
+    Readiness probe: 200 once the model is loaded in this process, 503 before
+    (/health only reports that the server is up)
+    """
+    if not model_state.ready and model_state.mode == 'lazy':
+        # Lazy mode loads on demand; a readiness probe counts as demand
+        try:
+            model_state.get()
+        except Exception:
+            pass
+    status = model_state.status()
+    if model_state.ready:
+        entry = model_state.model.entry()
+        status.update(model=entry.name, model_version=entry.version)
+    return jsonify(status), 200 if status["state"] == "ready" else 503
+
 @app.route("/health", methods=["GET"])
 def health():
     return jsonify({"status": "healthy"})
@@ -0,0 +1,259 @@
+"""
+Fast timestamp parsing for Bluebikes `started_at` / `ended_at` columns
+
+The trip exports use a handful of layouts:
+
+    iso      2023-04-01 08:15:42          (2023+ files)
+    iso      2019-01-01 00:09:13.7980     (legacy starttime/stoptime)
+    iso      2023-04-01 8:15:42           (single-digit hour rows)
+    us       4/1/2023 08:15               (older spreadsheet exports)
+
+The layout is detected once per file from a sample. ISO-like layouts go
+through a vectorized fixed-offset path that reads the year/month/day/hour
+digits straight out of a byte matrix and returns integer hour buckets (hours
+since the Unix epoch) without building datetime objects. Rows that fail
+validation, and files with unknown layouts, fall back to pd.to_datetime.
+
+Shared by the pipeline and the Flask lag store (lag_store.py); pipeline
+scripts reach it through flask/ on their import path.
+
+Benchmark against the notebook parsers:
+    python flask/bike_time.py --benchmark --rows 10000000
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+
+NS_PER_HOUR = 3_600_000_000_000
+INVALID = -1
+
+LAYOUTS = {
+    "iso": re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{1,2}:\d{2}"),
+    "us": re.compile(r"^\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{2}"),
+}
+US_FORMATS = ["%m/%d/%Y %H:%M", "%m/%d/%Y %H:%M:%S"]
+
+_DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int64)
+_ZERO = ord("0")
+
+
+def detect_layout(series, sample_size=1000):
+    """
+    Return the layout name matching every non-null value in a sample of
+    `series`, or None if the sample is mixed/unknown.
+    """
+    sample = series.iloc[:sample_size].dropna().astype(str).str.strip()
+    if sample.empty:
+        return None
+    for name, pattern in LAYOUTS.items():
+        if sample.str.match(pattern).all():
+            return name
+    return None
+
+
+def days_from_civil(year, month, day):
+    """
+    Vectorized proleptic Gregorian date -> days since 1970-01-01.
+    """
+    y = year - (month <= 2)
+    era = np.floor_divide(y, 400)
+    yoe = y - era * 400
+    mp = (month + 9) % 12
+    doy = (153 * mp + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def _iso_hour_buckets(values):
+    """
+    Fixed-offset parse of 'YYYY-MM-DD HH' prefixes.
+
+    Args:
+        values: object ndarray of strings
+
+    Returns:
+        tuple: (buckets int64, ok bool mask); non-ASCII rows are not ok
+    """
+    try:
+        raw = values.astype("S13")
+        ascii = None
+    except UnicodeEncodeError:
+        # e.g. a stray '\u200b' (the notebooks strip it): blank those rows
+        # here and leave them to the fallback parser
+        ascii = pd.Series(values, dtype=object).str.isascii().fillna(False).to_numpy(dtype=bool)
+        raw = np.where(ascii, values, "").astype("S13")
+    b = raw.view(np.uint8).reshape(len(raw), 13)
+    # uint8 arithmetic wraps, so any non-digit byte ends up > 9
+    d = b - np.uint8(_ZERO)
+
+    def num(*cols):
+        out = d[:, cols[0]].astype(np.int32)
+        for c in cols[1:]:
+            out = out * 10 + d[:, c]
+        return out
+
+    year = num(0, 1, 2, 3)
+    month = num(5, 6)
+    day = num(8, 9)
+    # ' 8:15' (single-digit hour) -> byte 12 is ':'
+    single = b[:, 12] == ord(":")
+    hour = np.where(single, d[:, 11], num(11, 12))
+
+    ok = (
+        (d[:, [0, 1, 2, 3, 5, 6, 8, 9, 11]] <= 9).all(axis=1)
+        & (b[:, 4] == ord("-")) & (b[:, 7] == ord("-"))
+        & ((b[:, 10] == ord(" ")) | (b[:, 10] == ord("T")))
+        & (single | (d[:, 12] <= 9))
+        & (month >= 1) & (month <= 12) & (day >= 1) & (hour <= 23)
+    )
+    month = np.clip(month, 1, 12)
+    leap = ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+    ok &= day <= _DAYS_IN_MONTH[month - 1] + ((month == 2) & leap)
+    if ascii is not None:
+        ok &= ascii
+
+    buckets = days_from_civil(year.astype(np.int64), month, day) * 24 + hour
+    buckets[~ok] = INVALID
+    return buckets, ok
+
+
+def _to_buckets(dt):
+    values = dt.to_numpy(dtype="datetime64[ns]", na_value=np.datetime64("NaT")).view(np.int64)
+    buckets = np.floor_divide(values, NS_PER_HOUR)
+    buckets[dt.isna().to_numpy()] = INVALID
+    return buckets
+
+
+def _fallback_buckets(series):
+    """
+    Slow path: clean and parse with pandas' mixed-format parser.
+    """
+    s = series.astype(str).str.strip().str.replace("\u200b", "", regex=False)
+    dt = pd.to_datetime(s, format="mixed", errors="coerce")
+    return _to_buckets(dt)
+
+
+def parse_hour_bucket(series, layout=None):
+    """
+    Parse timestamps straight to integer hour buckets.
+
+    Args:
+        series: pd.Series of timestamp strings (or datetime64 values)
+        layout: 'iso', 'us' or None (detect from a sample)
+
+    Returns:
+        ndarray int64: hours since the Unix epoch, -1 where unparseable
+    """
+    series = pd.Series(series)
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        # Already typed (e.g. read from the Parquet cache)
+        return _to_buckets(series)
+    if layout is None:
+        layout = detect_layout(series)
+
+    if layout == "iso":
+        values = series.to_numpy(dtype=object, na_value="")
+        buckets, ok = _iso_hour_buckets(values)
+        bad = ~ok & (values != "")
+        if bad.any():
+            buckets[bad] = _fallback_buckets(series[bad])
+        return buckets
+
+    if layout == "us":
+        for fmt in US_FORMATS:
+            dt = pd.to_datetime(series, format=fmt, errors="coerce")
+            if dt.notna().sum() >= series.notna().sum():
+                return _to_buckets(dt)
+        # mixed minute/second precision within the file
+        return _fallback_buckets(series)
+
+    return _fallback_buckets(series)
+
+
+def parse_bike_time(series, freq="h", layout=None):
+    """
+    Drop-in replacement for the notebook `parse_bike_time`: returns the
+    timestamps floored to the hour as a datetime64 Series.
+    """
+    if freq not in ("h", "H"):
+        dt = pd.to_datetime(series.astype(str).str.strip(), format="mixed", errors="coerce")
+        return dt.dt.floor(freq)
+    buckets = parse_hour_bucket(series, layout)
+    values = np.where(buckets == INVALID, np.iinfo(np.int64).min, buckets * NS_PER_HOUR)
+    return pd.Series(values.astype("datetime64[ns]"), index=series.index)
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def legacy_parse_bike_time(series, freq="h"):
+    """
+    Copy of `parse_bike_time` from ZINB_with_feature.ipynb, kept for the benchmark.
+    """
+    s = series.astype(str).str.strip().str.replace("\u200b", "", regex=False)
+    dt = pd.to_datetime(s, errors="coerce")
+    m = dt.isna()
+    if m.any():
+        s2 = s[m].str.replace(r" (\d):", lambda x: f" 0{x.group(1)}:", regex=True)
+        dt.loc[m] = pd.to_datetime(s2, format="%Y-%m-%d %H:%M:%S", errors="coerce")
+    return dt.dt.floor(freq)
+
+
+def synthetic_timestamps(n, seed=0):
+    """
+    Build `n` 2023-style timestamp strings, with a few single-digit-hour rows.
+    """
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, 365 * 24 * 3600, n)
+    stamps = (np.datetime64("2023-01-01T00:00:00") + seconds.astype("timedelta64[s]"))
+    text = np.datetime_as_string(stamps, unit="s").astype(object)
+    text = pd.Series(text).str.replace("T", " ", regex=False)
+    single = rng.random(n) < 0.001
+    text[single] = text[single].str.replace(r" 0(\d):", r" \1:", regex=True)
+    return text.astype("string")
+
+
+def benchmark(rows):
+    print("=" * 60)
+    print(f"Benchmarking timestamp parsers on {rows:,} synthetic rows...")
+    print("=" * 60)
+    series = synthetic_timestamps(rows)
+
+    t0 = time.perf_counter()
+    fast = parse_hour_bucket(series)
+    t_fast = time.perf_counter() - t0
+    print(f"  parse_hour_bucket (fast path):   {t_fast:8.2f}s")
+
+    t0 = time.perf_counter()
+    mixed = pd.to_datetime(series, format="mixed").dt.floor("h")
+    t_mixed = time.perf_counter() - t0
+    print(f"  pd.to_datetime(format='mixed'):  {t_mixed:8.2f}s  ({t_mixed / t_fast:.1f}x slower)")
+
+    t0 = time.perf_counter()
+    legacy = legacy_parse_bike_time(series)
+    t_legacy = time.perf_counter() - t0
+    print(f"  notebook parse_bike_time:        {t_legacy:8.2f}s  ({t_legacy / t_fast:.1f}x slower)")
+
+    assert np.array_equal(fast, _to_buckets(mixed)), "fast path disagrees with format='mixed'"
+    assert np.array_equal(fast, _to_buckets(legacy)), "fast path disagrees with notebook parser"
+    print("✓ All parsers agree")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bluebikes timestamp parser")
+    parser.add_argument("--benchmark", action="store_true", help="Run the synthetic benchmark")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.rows)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
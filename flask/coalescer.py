@@ -0,0 +1,211 @@
+"""
+Micro-batching request coalescer
+Collects /predict requests that arrive within a few milliseconds of each
+other (threaded workers), scores them as one batch and fans the results back
+out to the waiting request threads
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import pandas as pd
+
+
+COALESCE_MAX_BATCH = int(os.getenv('COALESCE_MAX_BATCH', 1024))
+COALESCE_MAX_WAIT_MS = float(os.getenv('COALESCE_MAX_WAIT_MS', 5))
+# Scoring budget on top of the batch window before a waiting request gives up
+# on the batching thread (kept well under gunicorn's 120 s worker timeout)
+COALESCE_SCORE_TIMEOUT_S = float(os.getenv('COALESCE_SCORE_TIMEOUT_S', 30))
+
+
+class RequestCoalescer:
+    """
+    One background thread per process drains a queue of (model, frame, future)
+    requests into batches of at most `max_batch` rows, waiting at most
+    `max_wait_ms` after the first request of a batch.
+    """
+
+    def __init__(self, score_fn, max_batch=COALESCE_MAX_BATCH, max_wait_ms=COALESCE_MAX_WAIT_MS,
+                 score_timeout=COALESCE_SCORE_TIMEOUT_S):
+        """
+        Args:
+            score_fn: callable(model, DataFrame) -> {'arrivals': [...], 'departures': [...]}
+            max_batch: row limit per model call
+            max_wait_ms: how long the first request of a batch may wait for company
+            score_timeout: seconds a request may wait beyond the batch window
+        """
+        self.score_fn = score_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = self.max_wait + score_timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.timeouts = 0
+
+    def _ensure_worker(self):
+        # Threads do not survive fork (gunicorn preload), so start lazily per process
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    # Fresh queue after fork; after a thread death the queue is
+                    # kept, so requests already waiting are picked up
+                    self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='predict-coalescer', daemon=True)
+                self._thread.start()
+
+    def submit(self, model, df, timeout=None):
+        """
+        Score `df` with `model` as part of the next batch; blocks until the
+        result is ready, at most `timeout` seconds (default: self.timeout).
+
+        A request the batching thread never picked up within the timeout is
+        scored inline; one whose batch is still being scored raises TimeoutError.
+        """
+        if len(df) >= self.max_batch:
+            # Already a full batch on its own
+            return self.score_fn(model, df)
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((model, df, future))
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            if future.cancel():
+                return self.score_fn(model, df)
+            raise
+
+    def _collect(self):
+        """
+        Block for the first request, then gather more until the batch is full
+        or the wait budget is spent.
+        """
+        first = self._queue.get()
+        batch, n_rows = [first], len(first[1])
+        deadline = time.perf_counter() + self.max_wait
+        while n_rows < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            n_rows += len(item[1])
+        return batch
+
+    def _run(self):
+        batch = []
+        try:
+            while True:
+                # Requests whose caller timed out and cancelled are dropped
+                batch = [item for item in self._collect() if item[2].set_running_or_notify_cancel()]
+                # Requests for different models or with different column sets are
+                # scored separately, so pd.concat never introduces NaNs for
+                # features a request omitted
+                groups = {}
+                for model, df, future in batch:
+                    groups.setdefault((id(model), tuple(df.columns)), (model, []))[1].append((df, future))
+                for model, items in groups.values():
+                    self._score_group(model, items)
+                batch = []
+        finally:
+            # Only reached if the loop dies: nobody would complete these futures
+            self._fail_pending(batch, RuntimeError("Request coalescer stopped"))
+
+    def _fail_pending(self, batch, error):
+        futures = [future for _, _, future in batch]
+        while True:
+            try:
+                futures.append(self._queue.get_nowait()[2])
+            except queue.Empty:
+                break
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+    def _score_group(self, model, items):
+        frames = [df for df, _ in items]
+        try:
+            result = self.score_fn(model, pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0])
+        except Exception:
+            # Isolate the failing request(s): score each on its own
+            for df, future in items:
+                try:
+                    future.set_result(self.score_fn(model, df))
+                except Exception as e:
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.requests += len(items)
+        self.rows += sum(len(df) for df in frames)
+        start = 0
+        for df, future in items:
+            stop = start + len(df)
+            future.set_result({
+                'arrivals': list(result['arrivals'][start:stop]),
+                'departures': list(result['departures'][start:stop]),
+            })
+            start = stop
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'rows': self.rows,
+            'mean_requests_per_batch': round(self.requests / self.batches, 2) if self.batches else 0.0,
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'timeout_s': self.timeout,
+            'timeouts': self.timeouts,
+        }
+
+
+if __name__ == "__main__":
+    # Throughput comparison: 64 concurrent single-station requests, scored
+    # one by one vs. coalesced
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+
+    from zinb_predictor import ZINBPredictor
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'zinb_models.pkl'
+    model = ZINBPredictor(model_path)
+    row = {
+        'month': 6, 'start_hour': 17, 'end_hour': 18, 'subway_distance_m': 200.0,
+        'mbta_stops_250m': 3, 'last_day_in': 15, 'last_day_out': 12,
+        'is_night': 0, 'precipitation': 0.0, 'avg_temp': 22.5,
+    }
+    n_requests, concurrency = 4000, 64
+    frames = [pd.DataFrame([dict(row, start_hour=i % 24)]) for i in range(n_requests)]
+
+    print("\n" + "=" * 60)
+    print(f"{n_requests} single-row requests, {concurrency} threads")
+    print("=" * 60)
+    with ThreadPoolExecutor(concurrency) as pool:
+        t0 = time.perf_counter()
+        direct = list(pool.map(model.predict, frames))
+        t_direct = time.perf_counter() - t0
+    print(f"  direct:    {n_requests / t_direct:10.0f} req/s")
+
+    coalescer = RequestCoalescer(lambda m, df: m.predict(df))
+    with ThreadPoolExecutor(concurrency) as pool:
+        t0 = time.perf_counter()
+        batched = list(pool.map(lambda df: coalescer.submit(model, df), frames))
+        t_batched = time.perf_counter() - t0
+    print(f"  coalesced: {n_requests / t_batched:10.0f} req/s  ({t_direct / t_batched:.1f}x)")
+    print(f"  {coalescer.stats()}")
+    assert direct == batched, "coalesced results differ from direct scoring"
+    print("✓ Coalesced results match direct scoring")
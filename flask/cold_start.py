@@ -0,0 +1,80 @@
+"""
+Cold-start benchmark
+Times, in a fresh interpreter per run, how long `import app` takes, when
+/ready first reports ready and when the first /predict returns, for the
+pickle path and the model artifact (see model_artifact.py).
+
+Usage:
+    python cold_start.py [--runs 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Runs inside the child interpreter; prints one JSON line of timings
+CHILD = r'''
+import json, time
+t0 = time.perf_counter()
+import app
+t_import = time.perf_counter() - t0
+client = app.app.test_client()
+while True:
+    ready = client.get("/ready")
+    if ready.status_code == 200:
+        break
+    if ready.get_json()["state"] == "error":
+        raise SystemExit("model failed to load")
+    time.sleep(0.001)
+t_ready = time.perf_counter() - t0
+resp = client.post("/predict", json={"station_id": "M32006", "hour_of_day": 17, "month": 6})
+assert resp.status_code == 200, resp.get_data(as_text=True)
+t_first = time.perf_counter() - t0
+print("TIMINGS " + json.dumps({"import": t_import, "ready": t_ready, "first_prediction": t_first,
+                               "model": ready.get_json()["model"]}))
+'''
+
+
+def run_once(env):
+    out = subprocess.run([sys.executable, '-c', CHILD], env=env, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    for line in out.stdout.splitlines():
+        if line.startswith('TIMINGS '):
+            return json.loads(line[len('TIMINGS '):])
+    raise RuntimeError(f"child failed:\n{out.stdout[-2000:]}\n{out.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=os.getenv('ZINB_MODEL_PATH', 'zinb_models.pkl'))
+    parser.add_argument('--artifact', default=os.getenv('ZINB_ARTIFACT_PATH', 'zinb_model.bin'))
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    configs = {
+        'pickle, eager': {'ZINB_ARTIFACT_PATH': os.devnull + '.missing', 'ZINB_ALLOW_PICKLE': '1',
+                          'MODEL_LOAD': 'eager'},
+        'artifact, eager': {'MODEL_LOAD': 'eager'},
+        'artifact, background': {'MODEL_LOAD': 'background'},
+    }
+    if not os.path.exists(args.artifact):
+        print(f"⚠ {args.artifact} not found; run `python model_artifact.py export` to include the artifact runs")
+        configs = {k: v for k, v in configs.items() if k.startswith('pickle')}
+
+    print("=" * 60)
+    print(f"{'config':<20}{'import':>10}{'ready':>10}{'first pred':>12}  model")
+    print("=" * 60)
+    for name, overrides in configs.items():
+        env = dict(os.environ, ZINB_MODEL_PATH=args.model, ZINB_ARTIFACT_PATH=args.artifact, SHARED_SEGMENT='0')
+        env.update(overrides)
+        runs = [run_once(env) for _ in range(args.runs)]
+        median = {k: statistics.median(r[k] for r in runs) for k in ('import', 'ready', 'first_prediction')}
+        print(f"{name:<20}{median['import']:>9.2f}s{median['ready']:>9.2f}s"
+              f"{median['first_prediction']:>11.2f}s  {runs[0]['model']}")
+
+
+if __name__ == "__main__":
+    main()
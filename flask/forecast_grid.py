@@ -0,0 +1,145 @@
+"""
+Columnar batch forecasting helpers
+Expands station × hour grids server-side and scores them in fixed-size chunks
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', 20000))
+MAX_BATCH_ROWS = int(os.getenv('MAX_BATCH_ROWS', 2_000_000))
+# Longest forecast horizon one request may ask for (default four weeks)
+MAX_BATCH_HOURS = int(os.getenv('MAX_BATCH_HOURS', 24 * 7 * 4))
+
+
+def time_features(timestamps):
+    """
+    Derive the backend time features from a DatetimeIndex
+
+    Args:
+        timestamps: pd.DatetimeIndex of hour starts
+
+    Returns:
+        dict: column name -> ndarray
+    """
+    day_of_week = timestamps.dayofweek.to_numpy()  # 0 = Monday
+    return {
+        'hour_of_day': timestamps.hour.to_numpy(),
+        'day_of_week': day_of_week,
+        'month': timestamps.month.to_numpy(),
+        'is_weekend': (day_of_week >= 5).astype(np.int64),
+    }
+
+
+def hour_range(start, hours=None, end=None, max_hours=MAX_BATCH_HOURS):
+    """
+    Build the hourly forecast horizon from a start time plus either a number
+    of hours or an (inclusive) end time. The horizon is bounded by `max_hours`
+    before anything is allocated; stations x hours is bounded separately by
+    MAX_BATCH_ROWS.
+    """
+    start = pd.Timestamp(start).floor('h')
+    if hours is None and end is not None:
+        hours = (pd.Timestamp(end).floor('h') - start) // pd.Timedelta(hours=1) + 1
+        if hours <= 0:
+            raise ValueError("'end' must not be before 'start'")
+    if hours is None:
+        raise ValueError("Provide either 'hours' or 'end' with 'start'")
+    hours = int(hours)
+    if hours <= 0:
+        raise ValueError("'hours' must be positive")
+    if hours > max_hours:
+        raise ValueError(f"Horizon of {hours} hours exceeds limit of {max_hours}")
+    return pd.date_range(start=start, periods=hours, freq='h')
+
+
+def chunk_size_arg(value, default=DEFAULT_CHUNK_SIZE):
+    """
+    Validate a client-supplied chunk size (None -> `default`).
+    """
+    if value is None:
+        return default
+    try:
+        chunk_size = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'chunk_size' must be an integer, got {value!r}")
+    if chunk_size < 1:
+        raise ValueError("'chunk_size' must be at least 1")
+    return chunk_size
+
+
+def expand_grid(stations, timestamps):
+    """
+    Expand station attributes × timestamps into columnar model input.
+    Rows are station-major: row i * len(timestamps) + j is station i at hour j.
+
+    Args:
+        stations: list of station feature dicts (or a DataFrame)
+        timestamps: pd.DatetimeIndex
+
+    Returns:
+        dict: column name -> ndarray of length len(stations) * len(timestamps)
+    """
+    station_df = stations if isinstance(stations, pd.DataFrame) else pd.DataFrame(stations)
+    if station_df.empty:
+        raise ValueError("'stations' must be a non-empty list")
+
+    n_stations, n_hours = len(station_df), len(timestamps)
+    if n_stations * n_hours > MAX_BATCH_ROWS:
+        raise ValueError(f"Grid of {n_stations * n_hours} rows exceeds limit of {MAX_BATCH_ROWS}")
+
+    columns = {name: np.repeat(station_df[name].to_numpy(), n_hours)
+               for name in station_df.columns}
+    for name, values in time_features(timestamps).items():
+        columns[name] = np.tile(values, n_stations)
+    return columns
+
+
+def columns_from_payload(columns):
+    """
+    Validate a columnar payload ({feature: [values, ...]}) and convert it to
+    NumPy arrays of equal length.
+    """
+    if not isinstance(columns, dict) or not columns:
+        raise ValueError("'columns' must be a non-empty object of arrays")
+    arrays = {name: np.asarray(values) for name, values in columns.items()}
+    lengths = {len(values) for values in arrays.values()}
+    if len(lengths) != 1:
+        raise ValueError("All arrays in 'columns' must have the same length")
+    if lengths.pop() > MAX_BATCH_ROWS:
+        raise ValueError(f"Payload exceeds limit of {MAX_BATCH_ROWS} rows")
+    return arrays
+
+
+def iter_chunks(columns, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield DataFrame slices of at most `chunk_size` rows from columnar input.
+    """
+    if chunk_size < 1:
+        raise ValueError("'chunk_size' must be at least 1")
+    n = len(next(iter(columns.values())))
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        yield pd.DataFrame({name: values[start:stop] for name, values in columns.items()})
+
+
+def predict_columns(model, columns, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Score columnar input through any predictor exposing predict(DataFrame)
+
+    Returns:
+        dict: {'arrivals': ndarray, 'departures': ndarray}
+    """
+    n = len(next(iter(columns.values())))
+    arrivals = np.empty(n, dtype=np.int64)
+    departures = np.empty(n, dtype=np.int64)
+    start = 0
+    for chunk in iter_chunks(columns, chunk_size):
+        result = model.predict(chunk)
+        stop = start + len(chunk)
+        arrivals[start:stop] = result['arrivals']
+        departures[start:stop] = result['departures']
+        start = stop
+    return {'arrivals': arrivals, 'departures': departures}
@@ -5,14 +5,33 @@ Optimized for Render.com deployment
 
 import multiprocessing
 import os
+import shutil
+
+# Model coefficients, station table and prediction cache go into a shared
+# memory segment that all workers map (see shared_segment.py). Set before the
+# app is preloaded so app.py picks it up.
+os.environ.setdefault('SHARED_SEGMENT', '1')
+os.environ.setdefault('SHARED_SEGMENT_DIR', f"/dev/shm/bluebikes-{os.getenv('PORT', '5000')}"
+                      if os.path.isdir('/dev/shm') else f"/tmp/bluebikes-{os.getenv('PORT', '5000')}")
+# Load the model in the preloaded master so workers fork with it in memory
+# (`python app.py` defaults to background loading, see model_state.py)
+os.environ.setdefault('MODEL_LOAD', 'eager')
 
 # Server socket
 bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
 backlog = 2048
 
 # Worker processes
-workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
-worker_class = 'sync'
+# SERVING_MODE=threaded: fewer processes with gthread workers; concurrent
+# /predict calls in a worker are micro-batched by coalescer.py
+SERVING_MODE = os.environ.setdefault('SERVING_MODE', 'sync')
+if SERVING_MODE == 'threaded':
+    workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+    worker_class = 'gthread'
+    threads = int(os.getenv('GUNICORN_THREADS', 32))
+else:
+    workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+    worker_class = 'sync'
 worker_connections = 1000
 timeout = 120
 keepalive = 5
@@ -40,3 +59,9 @@ preload_app = True
 # Restart workers after this many requests (helps prevent memory leaks)
 max_requests = 1000
 max_requests_jitter = 50
+
+
+# Server hooks
+def on_exit(server):
+    # Release the tmpfs segment when the master shuts down
+    shutil.rmtree(os.environ['SHARED_SEGMENT_DIR'], ignore_errors=True)
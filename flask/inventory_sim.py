@@ -0,0 +1,318 @@
+"""
+Monte Carlo dock-inventory simulation
+Projects station occupancy over the next hours from the ZINB IN / OUT
+distributions: starting bikes plus cumulative arrivals - departures, clipped
+to [0, capacity] at the end of every hour (arrivals and departures within
+an hour are netted first). A path that would go below 0 records a stockout
+(departures the station could not serve); one above capacity records an
+overflow (arrivals with no free dock).
+
+Draws for stations × hours × samples are exact inverse-CDF lookups on the
+closed-form PMF (count_distribution.zinb_pmf) through a guide table, so a
+draw costs one gather plus a rare one-step correction. Work is split into
+station chunks of at most SIM_CHUNK_DRAWS draws; every station has its own
+seed, so results do not depend on the chunk size or the number of workers.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from count_distribution import zinb_pmf
+
+
+SIM_SAMPLES = int(os.getenv('SIM_SAMPLES', 2000))
+SIM_MAX_SAMPLES = int(os.getenv('SIM_MAX_SAMPLES', 20000))
+SIM_MAX_HOURS = int(os.getenv('SIM_MAX_HOURS', 168))
+# Draws held in memory per chunk (~12 bytes each while sampling)
+SIM_CHUNK_DRAWS = int(os.getenv('SIM_CHUNK_DRAWS', 4_000_000))
+# Worker processes for large requests (1 = run in the calling process)
+SIM_WORKERS = int(os.getenv('SIM_WORKERS', 1))
+# Per-hour count cap of the sampling tables; the mass above it is drawn as the cap
+SIM_MAX_COUNT = int(os.getenv('SIM_MAX_COUNT', 80))
+GUIDE_SIZE = 256
+
+INVENTORY_QUANTILES = (0.1, 0.5, 0.9)
+
+
+def sample_counts(cdf, u, guide_size=GUIDE_SIZE):
+    """
+    Inverse-CDF draws: for each row r and uniform u[r, j], the smallest k
+    with cdf[r, k] >= u[r, j].
+
+    The guide table maps each cell [j/G, (j+1)/G) to its answer when no CDF
+    step falls inside the cell (one gather per draw); cells with a step are
+    marked negative and only their draws are resolved against the CDF.
+    G is a power of two, so u * G is exact for float32 uniforms too.
+
+    Args:
+        cdf: (R, K+1) nondecreasing CDFs with cdf[:, -1] == 1
+        u: (R, N) uniforms in [0, 1), float32 or float64
+
+    Returns:
+        ndarray: (R, N) counts, int32
+    """
+    n_rows, width = cdf.shape
+    base = np.arange(n_rows, dtype=np.int64) * width
+    offsets = 2.0 * np.arange(n_rows)
+
+    # first[r, j] = smallest k with cdf[r, k] >= j/G = #{k : cdf[r, k] < j/G},
+    # counted with one bincount of floor(cdf * G) + 1 (exact, G a power of two)
+    levels = np.minimum(np.floor(cdf * guide_size).astype(np.int64) + 1, guide_size + 1)
+    keys = (levels + (np.arange(n_rows) * (guide_size + 2))[:, None]).ravel()
+    first = np.bincount(keys, minlength=n_rows * (guide_size + 2)).reshape(n_rows, guide_size + 2)
+    first = np.cumsum(first[:, :guide_size + 1], axis=1)
+    lo, hi = first[:, :-1], first[:, 1:]
+    table = np.where(lo == hi, lo, ~(lo + base[:, None])).astype(np.int32).ravel()
+    # Rows offset by 2r make the flattened CDFs one sorted array for the walk
+    flat_cdf = (cdf + offsets[:, None]).ravel()
+
+    cell = (u * guide_size).astype(np.int32)
+    cell += (np.arange(n_rows, dtype=np.int32) * guide_size)[:, None]
+    draws = table[cell]
+    del cell
+
+    flat_draws, flat_u = draws.reshape(-1), u.reshape(-1)
+    pending = np.flatnonzero(flat_draws < 0)
+    if pending.size:
+        idx = ~flat_draws[pending].astype(np.int64)
+        row = idx // width
+        target = flat_u[pending] + offsets[row]
+        walking = np.flatnonzero(flat_cdf[idx] < target)
+        while walking.size:
+            idx[walking] += 1
+            walking = walking[flat_cdf[idx[walking]] < target[walking]]
+        flat_draws[pending] = idx - base[row]
+    return draws
+
+
+def _simulate_chunk(mu, pi, alpha, inventory, capacity, n_samples, seeds, max_count, quantiles):
+    """
+    Simulate one station chunk.
+
+    Args:
+        mu, pi: (S, H, 2) ZINB parameters per station, hour and head (IN, OUT)
+        alpha: (2,) dispersion, or (S, H, 2) per station and hour
+        inventory, capacity: (S,) starting bikes and docks
+        seeds: S SeedSequences, one per station
+
+    Returns:
+        dict of (S, H) arrays, plus 'inventory_quantiles' (S, Q, H)
+    """
+    n_stations, n_hours = mu.shape[:2]
+    pmf = zinb_pmf(mu, pi, alpha, max_count)
+    cdf = np.cumsum(pmf, axis=-1, out=pmf).reshape(-1, max_count + 1)
+    cdf[:, -1] = 1.0
+
+    u = np.empty((n_stations, n_hours * 2, n_samples), dtype=np.float32)
+    for i, seed in enumerate(seeds):
+        np.random.default_rng(seed).random(out=u[i], dtype=np.float32)
+    counts = sample_counts(cdf, u.reshape(-1, n_samples)).reshape(n_stations, n_hours, 2, n_samples)
+    del u
+    net = counts[:, :, 0] - counts[:, :, 1]
+    del counts
+
+    level = np.repeat(inventory[:, None], n_samples, axis=1).astype(np.int32)
+    cap = capacity[:, None].astype(np.int32)
+    unmet = np.zeros((n_stations, n_samples), dtype=np.int32)
+    blocked = np.zeros((n_stations, n_samples), dtype=np.int32)
+    shortfall = np.empty_like(level)
+
+    # Inventory histogram per station and hour gives mean, P(empty), P(full)
+    # and quantiles without sorting sample paths
+    n_levels = int(capacity.max()) + 1
+    station_keys = (np.arange(n_stations, dtype=np.int32) * n_levels)[:, None]
+    hist = np.empty((n_hours, n_stations, n_levels), dtype=np.int64)
+    p_stockout = np.empty((n_stations, n_hours))
+    p_overflow = np.empty((n_stations, n_hours))
+    unmet_mean = np.empty((n_stations, n_hours))
+    blocked_mean = np.empty((n_stations, n_hours))
+    for h in range(n_hours):
+        level += net[:, h]
+        np.minimum(level, 0, out=shortfall)
+        unmet -= shortfall
+        np.subtract(level, cap, out=shortfall)
+        np.maximum(shortfall, 0, out=shortfall)
+        blocked += shortfall
+        np.clip(level, 0, cap, out=level)
+
+        hist[h] = np.bincount((level + station_keys).ravel(),
+                              minlength=n_stations * n_levels).reshape(n_stations, n_levels)
+        p_stockout[:, h] = np.count_nonzero(unmet, axis=1)
+        p_overflow[:, h] = np.count_nonzero(blocked, axis=1)
+        unmet_mean[:, h] = unmet.sum(axis=1)
+        blocked_mean[:, h] = blocked.sum(axis=1)
+
+    hist = hist.transpose(1, 0, 2)                       # (S, H, levels)
+    cumulative = np.cumsum(hist, axis=2)
+    targets = np.ceil(np.asarray(quantiles) * n_samples)
+    rows = np.arange(n_stations)
+    return {
+        'expected_inventory': hist @ np.arange(n_levels) / n_samples,
+        'p_empty': hist[:, :, 0] / n_samples,
+        'p_full': hist[rows, :, capacity] / n_samples,
+        'p_stockout': p_stockout / n_samples,
+        'p_overflow': p_overflow / n_samples,
+        'expected_unmet_departures': unmet_mean / n_samples,
+        'expected_blocked_arrivals': blocked_mean / n_samples,
+        'inventory_quantiles': (cumulative[:, None] < targets[None, :, None, None]).sum(axis=3),
+    }
+
+
+_pool = None
+_pool_pid = None
+
+
+def _executor(workers):
+    # One pool per process (gunicorn workers each get their own); spawn so
+    # the children never inherit server threads or locks
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid() or _pool._max_workers != workers:
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def simulate(mu, pi, alpha, inventory, capacity, n_samples=SIM_SAMPLES, seed=0,
+             quantiles=INVENTORY_QUANTILES, max_count=SIM_MAX_COUNT,
+             chunk_draws=SIM_CHUNK_DRAWS, workers=SIM_WORKERS):
+    """
+    Monte Carlo inventory paths for S stations over H hours.
+
+    Args:
+        mu, pi: (S, H, 2) NB means and structural-zero probabilities (IN, OUT)
+        alpha: (2,) dispersion, or (S, H, 2) per station and hour
+        inventory: (S,) bikes docked at the start
+        capacity: (S,) docks per station
+        n_samples: sample paths per station
+        seed: base seed; station i uses SeedSequence(seed).spawn(S)[i]
+        quantiles: inventory quantiles to report per hour
+        chunk_draws: bound on draws per chunk (memory)
+        workers: processes to spread chunks over (1 = in process)
+
+    Returns:
+        dict: (S, H) arrays expected_inventory, p_empty, p_full, p_stockout,
+        p_overflow (cumulative: at least once by that hour),
+        expected_unmet_departures, expected_blocked_arrivals (cumulative),
+        expected_net_flow (unclipped E[IN - OUT], cumulative) and
+        inventory_quantiles (S, Q, H)
+    """
+    mu = np.asarray(mu, dtype=np.float64)
+    pi = np.asarray(pi, dtype=np.float64)
+    alpha = np.asarray(alpha, dtype=np.float64)
+    n_stations, n_hours = mu.shape[:2]
+    if alpha.ndim > 1:
+        alpha = np.broadcast_to(alpha, mu.shape)
+    inventory = np.asarray(inventory, dtype=np.int64).reshape(n_stations)
+    capacity = np.asarray(capacity, dtype=np.int64).reshape(n_stations)
+    n_samples = int(n_samples)
+    quantiles = [float(q) for q in quantiles]
+
+    if not 1 <= n_samples <= SIM_MAX_SAMPLES:
+        raise ValueError(f"samples must be between 1 and {SIM_MAX_SAMPLES}")
+    if not 1 <= n_hours <= SIM_MAX_HOURS:
+        raise ValueError(f"hours must be between 1 and {SIM_MAX_HOURS}")
+    if (capacity < 1).any():
+        raise ValueError("capacity must be at least 1")
+    if (inventory < 0).any() or (inventory > capacity).any():
+        raise ValueError("inventory must be between 0 and capacity")
+    if any(not 0 < q < 1 for q in quantiles):
+        raise ValueError("quantiles must be between 0 and 1")
+
+    seeds = np.random.SeedSequence(seed).spawn(n_stations)
+    per_chunk = max(1, chunk_draws // (n_hours * 2 * n_samples))
+    tasks = [
+        (mu[s:s + per_chunk], pi[s:s + per_chunk], alpha if alpha.ndim == 1 else alpha[s:s + per_chunk],
+         inventory[s:s + per_chunk], capacity[s:s + per_chunk], n_samples, seeds[s:s + per_chunk],
+         max_count, quantiles)
+        for s in range(0, n_stations, per_chunk)
+    ]
+    if workers > 1 and len(tasks) > 1:
+        parts = list(_executor(workers).map(_simulate_chunk, *zip(*tasks)))
+    else:
+        parts = [_simulate_chunk(*task) for task in tasks]
+
+    result = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+    result['expected_net_flow'] = np.cumsum((1 - pi) * mu @ np.array([1.0, -1.0]), axis=1)
+    return result
+
+
+if __name__ == "__main__":
+    import time
+
+    print("Testing inventory simulation...")
+    print("=" * 60)
+    rng = np.random.default_rng(7)
+
+    # 1. Sampler reproduces the PMF
+    mu = np.array([[0.4, 3.0], [8.0, 25.0]])
+    pi = np.array([[0.5, 0.1], [0.0, 0.2]])
+    alpha = np.array([0.6, 0.3])
+    pmf = zinb_pmf(mu, pi, alpha, SIM_MAX_COUNT).reshape(-1, SIM_MAX_COUNT + 1)
+    cdf = np.cumsum(pmf, axis=-1)
+    cdf[:, -1] = 1.0
+    n = 400_000
+    draws = sample_counts(cdf, rng.random((len(cdf), n)))
+    for r in range(len(cdf)):
+        freq = np.bincount(draws[r], minlength=SIM_MAX_COUNT + 1) / n
+        err = np.max(np.abs(freq - pmf[r]))
+        assert err < 5 * np.sqrt(pmf[r].max() / n), (r, err)
+    print("  ✓ Inverse-CDF draws match the ZINB PMF")
+
+    # 2. Deterministic, independent of chunking and workers
+    S, H, N = 60, 24, 500
+    mu = rng.gamma(2.0, 1.5, (S, H, 2))
+    pi = rng.uniform(0, 0.3, (S, H, 2))
+    capacity = rng.integers(11, 27, S)
+    inventory = rng.integers(0, capacity + 1)
+    a = simulate(mu, pi, alpha, inventory, capacity, N, seed=3)
+    b = simulate(mu, pi, alpha, inventory, capacity, N, seed=3, chunk_draws=50_000, workers=2)
+    for name in a:
+        assert np.array_equal(a[name], b[name]), name
+    print("  ✓ Same seed -> same result across chunk sizes and worker counts")
+
+    # 3. Summaries match a direct per-path computation on the same draws
+    S3, H3, N3 = 4, 6, 300
+    c = _simulate_chunk(mu[:S3, :H3], pi[:S3, :H3], alpha, inventory[:S3], capacity[:S3], N3,
+                        np.random.SeedSequence(9).spawn(S3), SIM_MAX_COUNT, INVENTORY_QUANTILES)
+    pmf = zinb_pmf(mu[:S3, :H3], pi[:S3, :H3], alpha, SIM_MAX_COUNT)
+    cdf = np.cumsum(pmf, axis=-1).reshape(-1, SIM_MAX_COUNT + 1)
+    cdf[:, -1] = 1.0
+    u = np.stack([np.random.default_rng(sd).random((H3 * 2, N3), dtype=np.float32)
+                  for sd in np.random.SeedSequence(9).spawn(S3)])
+    draws = sample_counts(cdf, u.reshape(-1, N3)).reshape(S3, H3, 2, N3)
+    for s in range(S3):
+        level, unmet, blocked = np.full(N3, inventory[s]), np.zeros(N3), np.zeros(N3)
+        for h in range(H3):
+            level = level + draws[s, h, 0] - draws[s, h, 1]
+            unmet += np.maximum(-level, 0)
+            blocked += np.maximum(level - capacity[s], 0)
+            level = np.clip(level, 0, capacity[s])
+            assert np.isclose(c['expected_inventory'][s, h], level.mean())
+            assert np.isclose(c['p_full'][s, h], (level == capacity[s]).mean())
+            assert np.isclose(c['p_stockout'][s, h], (unmet > 0).mean())
+            assert np.isclose(c['expected_blocked_arrivals'][s, h], blocked.mean())
+            expected_q = np.quantile(level, INVENTORY_QUANTILES, method='inverted_cdf')
+            assert np.array_equal(c['inventory_quantiles'][s, :, h], expected_q)
+    print("  ✓ Histogram summaries match per-path statistics")
+
+    # 4. No capacity pressure: inventory mean follows the net flow
+    big = simulate(mu, pi, alpha, np.full(S, 5000), np.full(S, 10000), 4000, seed=1)
+    drift = big['expected_inventory'] - 5000 - big['expected_net_flow']
+    assert np.abs(drift).max() < 1.0 and big['p_stockout'].max() == 0
+    print("  ✓ Unconstrained inventory tracks the expected net flow")
+
+    # 5. Benchmark: 500 stations x 24 h x 2,000 paths
+    S, N = 500, 2000
+    mu = rng.gamma(2.0, 2.0, (S, H, 2))
+    pi = rng.uniform(0, 0.3, (S, H, 2))
+    capacity = rng.integers(11, 27, S)
+    inventory = capacity // 2
+    t0 = time.perf_counter()
+    result = simulate(mu, pi, alpha, inventory, capacity, N, seed=0)
+    elapsed = time.perf_counter() - t0
+    print(f"\n{S} stations x {H} h x {N:,} paths ({S * H * 2 * N / 1e6:.0f}M draws): {elapsed:.2f} s")
+    print(f"  mean P(stockout within {H} h): {result['p_stockout'][:, -1].mean():.3f}")
+    print("=" * 60)
+    print("✓ Simulation test successful!")
@@ -0,0 +1,299 @@
+"""
+Rolling lag-feature store
+Keeps the last `capacity` hours of per-station IN/OUT counts in a ring buffer,
+fed incrementally from trip records (or a replay of trip CSVs), and answers
+last_hour / last_two_hour / last_three_hour / last_day lookups for a batch of
+stations by array indexing
+
+Under gunicorn the buffer lives in the shared segment (SharedLagStore in
+shared_segment.py), so trips posted to one worker are seen by all of them.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from bike_time import INVALID, NS_PER_HOUR, parse_hour_bucket
+
+
+LAG_CAPACITY_HOURS = int(os.getenv('LAG_CAPACITY_HOURS', 168))
+LAG_REPLAY_PATHS = os.getenv('LAG_REPLAY_PATHS', '')
+# Trip hours later than now + this many hours are rejected: one bad timestamp
+# would otherwise advance the window and wipe every buffered lag. Trip times
+# are Boston wall clock, which runs behind UTC, so this never rejects a real trip.
+LAG_FUTURE_TOLERANCE_HOURS = int(os.getenv('LAG_FUTURE_TOLERANCE_HOURS', 2))
+
+# Feature name -> lag in hours (same names as the training panel)
+LAG_FEATURES = {
+    'last_hour': 1,
+    'last_two_hour': 2,
+    'last_three_hour': 3,
+    'last_day': 24,
+}
+
+# Trip export column names (2023+ first, then pre-2023)
+TRIP_COLUMNS = {
+    'start_time': ['started_at', 'starttime'],
+    'stop_time': ['ended_at', 'stoptime'],
+    'start_station_id': ['start_station_id', 'start station id'],
+    'end_station_id': ['end_station_id', 'end station id'],
+}
+
+
+def hour_bucket(timestamps):
+    """
+    Timestamps -> int64 hours since the Unix epoch (-1 for NaT), via the
+    bike_time fast parser.
+    """
+    values = np.asarray(timestamps)
+    if values.dtype.kind == 'M':
+        values = values.astype('datetime64[ns]')
+    return parse_hour_bucket(pd.Series(values))
+
+
+def latest_valid_hour(tolerance=LAG_FUTURE_TOLERANCE_HOURS):
+    return int(time.time() // 3600) + tolerance
+
+
+class LagStore:
+    """
+    Ring buffer of hourly counts: counts[station, hour % capacity, (IN, OUT)].
+    `slot_hours[slot]` records which absolute hour a slot currently holds, so
+    stale slots are detected without clearing the whole buffer.
+    """
+
+    def __init__(self, capacity=LAG_CAPACITY_HOURS, initial_stations=1024):
+        if capacity <= max(LAG_FEATURES.values()):
+            raise ValueError(f"capacity must exceed the largest lag ({max(LAG_FEATURES.values())}h)")
+        self.capacity = capacity
+        self.counts = np.zeros((initial_stations, capacity, 2), dtype=np.int32)
+        self.future_tolerance = LAG_FUTURE_TOLERANCE_HOURS
+        self.slot_hours = np.full(capacity, -1, dtype=np.int64)
+        self.station_rows = {}
+        self.head_hour = -1
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.station_rows)
+
+    def _rows_for(self, station_ids):
+        """
+        Map station ids to buffer rows, growing the buffer for new stations.
+        """
+        keys = pd.Series(station_ids, dtype='string').fillna('')
+        codes, uniques = pd.factorize(keys)
+        unique_rows = np.empty(len(uniques), dtype=np.int64)
+        for i, key in enumerate(uniques):
+            row = self.station_rows.get(key)
+            if row is None:
+                row = self.station_rows[key] = len(self.station_rows)
+            unique_rows[i] = row
+        if len(self.station_rows) > len(self.counts):
+            grown = np.zeros((max(len(self.station_rows), 2 * len(self.counts)), self.capacity, 2), dtype=np.int32)
+            grown[:len(self.counts)] = self.counts
+            self.counts = grown
+        return unique_rows[codes]
+
+    def _advance(self, hour):
+        """
+        Move the head to `hour`, recycling the slots of hours that fell out of the window.
+        """
+        if hour <= self.head_hour:
+            return
+        first = max(self.head_hour + 1, hour - self.capacity + 1)
+        slots = np.arange(first, hour + 1) % self.capacity
+        self.counts[:, slots, :] = 0
+        self.slot_hours[slots] = np.arange(first, hour + 1)
+        self.head_hour = hour
+
+    def add_counts(self, station_ids, hours, ins, outs):
+        """
+        Add hourly IN/OUT counts (e.g. a replay of the station-hour panel).
+        Hours older than the window, and hours beyond now + future_tolerance,
+        are ignored.
+
+        Returns:
+            int: number of counts dropped for lying in the future
+        """
+        hours = np.asarray(hours, dtype=np.int64)
+        ins = np.asarray(ins, dtype=np.int32)
+        outs = np.asarray(outs, dtype=np.int32)
+        future = hours > latest_valid_hour(self.future_tolerance)
+        with self._lock:
+            rows = self._rows_for(station_ids)
+            valid = (hours != INVALID) & ~future & (rows >= 0)
+            if not valid.any():
+                return int(future.sum())
+            self._advance(int(hours[valid].max()))
+            keep = valid & (hours > self.head_hour - self.capacity)
+            slots = hours[keep] % self.capacity
+            np.add.at(self.counts, (rows[keep], slots, 0), ins[keep])
+            np.add.at(self.counts, (rows[keep], slots, 1), outs[keep])
+        return int(future.sum())
+
+    def add_trips(self, trips):
+        """
+        Count trip records: OUT at the start station/hour, IN at the end station/hour.
+        Trips with either end beyond now + future_tolerance are rejected whole.
+
+        Args:
+            trips: DataFrame with start_time, stop_time, start_station_id,
+                end_station_id (raw export headers are accepted too)
+
+        Returns:
+            int: number of trips rejected as future-dated
+        """
+        trips = _canonical_trips(trips)
+        start, stop = hour_bucket(trips['start_time']), hour_bucket(trips['stop_time'])
+        future = np.maximum(start, stop) > latest_valid_hour(self.future_tolerance)
+        if future.any():
+            trips, start, stop = trips[~future], start[~future], stop[~future]
+        n = len(trips)
+        station_ids = pd.concat([trips['start_station_id'], trips['end_station_id']], ignore_index=True)
+        hours = np.concatenate([start, stop])
+        ins = np.concatenate([np.zeros(n, dtype=np.int32), np.ones(n, dtype=np.int32)])
+        self.add_counts(station_ids, hours, ins, 1 - ins)
+        return int(future.sum())
+
+    def replay_csv(self, path, chunksize=500_000):
+        """
+        Replay a trip CSV in chunks. Only the trailing `capacity` hours survive.
+        """
+        header = pd.read_csv(path, nrows=0).columns
+        usecols = [c for c in header if c.strip() in {a for aliases in TRIP_COLUMNS.values() for a in aliases}]
+        n = 0
+        for chunk in pd.read_csv(path, usecols=usecols, dtype=str, chunksize=chunksize):
+            self.add_trips(chunk)
+            n += len(chunk)
+        return n
+
+    def lookup(self, station_ids, at_hours, features=LAG_FEATURES):
+        """
+        Lag features for each (station, hour) pair, in O(rows) array indexing.
+
+        Args:
+            station_ids: array-like of station ids
+            at_hours: int64 epoch hours of the hour being predicted
+            features: feature name -> lag in hours
+
+        Returns:
+            dict: '<name>_in' / '<name>_out' -> float64 arrays; NaN where the
+            station is unknown or the lagged hour is outside the window
+        """
+        at_hours = np.broadcast_to(np.asarray(at_hours, dtype=np.int64), (len(station_ids),))
+        keys = pd.Series(station_ids, dtype='string').fillna('')
+        rows = keys.map(self.station_rows).fillna(-1).to_numpy(dtype=np.int64)
+
+        result = {}
+        with self._lock:
+            for name, lag in features.items():
+                hours = at_hours - lag
+                slots = hours % self.capacity
+                valid = (rows >= 0) & (at_hours >= 0) & (self.slot_hours[slots] == hours)
+                values = self.counts[np.where(valid, rows, 0), slots].astype(np.float64)
+                values[~valid] = np.nan
+                result[f'{name}_in'] = values[:, 0]
+                result[f'{name}_out'] = values[:, 1]
+        return result
+
+    def enrich(self, data):
+        """
+        Fill lag features for rows carrying `station_id` and `timestamp`.
+        Values the client sent are kept; NaNs are left for the station store
+        defaults to fill.
+
+        Args:
+            data: DataFrame or dict of equal-length arrays
+
+        Returns:
+            same type as `data`
+        """
+        is_frame = isinstance(data, pd.DataFrame)
+        columns = {name: data[name].to_numpy() for name in data.columns} if is_frame else dict(data)
+        if not len(self) or 'station_id' not in columns or 'timestamp' not in columns:
+            return data
+
+        lags = self.lookup(columns['station_id'], hour_bucket(columns['timestamp']))
+        for name, values in lags.items():
+            if name not in columns:
+                columns[name] = values
+            else:
+                sent = pd.to_numeric(pd.Series(columns[name]), errors='coerce').to_numpy(dtype=np.float64)
+                columns[name] = np.where(np.isnan(sent), values, sent)
+
+        if is_frame:
+            return pd.DataFrame(columns, index=data.index)
+        return columns
+
+
+def _canonical_trips(trips):
+    trips = pd.DataFrame(trips)
+    stripped = {c.strip(): c for c in trips.columns}
+    rename = {}
+    for canonical, aliases in TRIP_COLUMNS.items():
+        for alias in [canonical] + aliases:
+            if alias in stripped:
+                rename[stripped[alias]] = canonical
+                break
+        else:
+            raise ValueError(f"Trip records are missing a '{canonical}' column")
+    return trips.rename(columns=rename)
+
+
+def load_lag_store(paths=LAG_REPLAY_PATHS, capacity=LAG_CAPACITY_HOURS, store=None):
+    """
+    Build the store (or take an empty `store`, e.g. a SharedLagStore) and
+    replay the trip CSVs listed in `paths` (comma-separated, oldest first).
+    """
+    store = LagStore(capacity) if store is None else store
+    for path in [p.strip() for p in paths.split(',') if p.strip()]:
+        try:
+            n = store.replay_csv(path)
+            print(f"✓ Replayed {n:,} trips from {path}")
+        except Exception as e:
+            print(f"⚠ Warning: Could not replay {path}: {e}")
+    return store
+
+
+if __name__ == "__main__":
+    import time
+
+    print("Testing LagStore...")
+    print("=" * 60)
+    rng = np.random.default_rng(0)
+    n_trips, n_stations = 200_000, 500
+    start = pd.Timestamp('2024-06-01') + pd.to_timedelta(rng.integers(0, 72 * 3600, n_trips), unit='s')
+    trips = pd.DataFrame({
+        'started_at': start.astype(str),
+        'ended_at': (start + pd.to_timedelta(rng.integers(60, 3600, n_trips), unit='s')).astype(str),
+        'start_station_id': rng.integers(0, n_stations, n_trips).astype(str),
+        'end_station_id': rng.integers(0, n_stations, n_trips).astype(str),
+    })
+
+    store = LagStore(capacity=48)
+    t0 = time.perf_counter()
+    for i in range(0, n_trips, 20_000):
+        store.add_trips(trips.iloc[i:i + 20_000])
+    print(f"Ingested {n_trips:,} trips in {time.perf_counter() - t0:.2f}s")
+
+    at = pd.Timestamp('2024-06-03 18:00')
+    stations = np.arange(n_stations).astype(str)
+    t0 = time.perf_counter()
+    lags = store.lookup(stations, hour_bucket([at])[0])
+    print(f"Lag lookup for {n_stations} stations in {(time.perf_counter() - t0) * 1000:.2f} ms")
+
+    # Cross-check against a direct groupby of the raw trips
+    hour = pd.to_datetime(trips['ended_at']).dt.floor('h')
+    expected = trips[hour == at - pd.Timedelta(hours=24)].groupby('end_station_id').size()
+    expected = expected.reindex(stations, fill_value=0).to_numpy()
+    assert np.array_equal(lags['last_day_in'], expected), "last_day_in mismatch"
+    print("✓ last_day_in matches a direct groupby")
+
+    # A far-future trip must not advance the window
+    head = store.head_hour
+    bad = trips.iloc[:1].assign(ended_at='2099-01-01 00:00:00')
+    assert store.add_trips(bad) == 1 and store.head_hour == head
+    assert np.array_equal(store.lookup(stations, hour_bucket([at])[0])['last_day_in'], expected)
+    print("✓ Future-dated trip rejected, lags intact")
@@ -0,0 +1,424 @@
+"""
+Versioned model artifact
+A single binary file replacing the full-results pickles on the serving path:
+
+    magic (8 bytes) | header length (uint32 LE) | JSON header | padding | arrays
+
+The JSON header carries the schema version, model kind and version, feature
+order and link functions, plus dtype / shape / offset of each array. Arrays
+are little-endian and 64-byte aligned, so `read_artifact` returns zero-copy
+views into one np.memmap; loading never executes code from the file.
+
+Usage:
+    python model_artifact.py export zinb_models.pkl -o zinb_model.bin
+    python model_artifact.py export nb_in_model.pkl --kind nb -o models/nb.bin
+    python model_artifact.py export nb_boost_model.pkl --kind nb_boost -o models/nb_boost.bin
+    python model_artifact.py export ../data/training/zinb_bank.npz --kind zinb_bank -o models/zinb_bank.bin
+    python model_artifact.py inspect zinb_model.bin
+"""
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+
+MAGIC = b'BBMODEL\0'
+SCHEMA_VERSION = 1
+ALIGNMENT = 64
+
+ZINB_ARTIFACT_PATH = os.getenv('ZINB_ARTIFACT_PATH', 'zinb_model.bin')
+
+# Arrays a ZINB artifact must contain, with their expected dimensions
+# (F = scorer features, K_nb / K_infl = NB / inflation features)
+ZINB_ARRAYS = {
+    'weights': ('F+1', 4),   # folded coefficients used for scoring
+    'alpha': (2,),
+    'beta': (2, 'K_nb+1'),   # raw scaled-space coefficients, kept for audits / refits
+    'gamma': (2, 'K_infl+1'),
+    'nb_mean': ('K_nb',),
+    'nb_scale': ('K_nb',),
+    'infl_mean': ('K_infl',),
+    'infl_scale': ('K_infl',),
+}
+
+NB_ARRAYS = {
+    'params': ('K+1',),      # GLM coefficients, intercept first
+    'fill_values': ('K',),   # SimpleImputer statistics (NaN = no imputer)
+}
+
+# Two-stage NB + boosting: per-head GLM rows plus complete-tree arrays
+# (T = trees over both heads, S = splits per tree, L = S + 1 leaves)
+NB_BOOST_ARRAYS = {
+    'params': (2, 'K+1'),
+    'fill_values': ('K',),
+    'alpha': (2,),
+    'init': (2,),
+    'tree_offsets': (3,),
+    'feature': ('T', 'S'),
+    'threshold': ('T', 'S'),
+    'leaf_value': ('T', 'L'),
+}
+
+# Per-station bank: folded ZINB weights per slot (G slots, slot 0 = global fit)
+# and the slot of each of the N station ids listed in the header
+ZINB_BANK_ARRAYS = {
+    'weights': ('G', 'F+1', 4),
+    'alpha': ('G', 2),
+    'station_slot': ('N',),
+}
+
+
+class ArtifactError(ValueError):
+    """
+    Raised for files that are not a readable model artifact.
+    """
+
+
+def _align(n):
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def write_artifact(path, arrays, metadata):
+    """
+    Write arrays plus JSON-serializable metadata atomically.
+
+    Args:
+        path: output file
+        arrays: name -> ndarray (numeric dtypes only)
+        metadata: dict stored in the header
+    """
+    entries, offset = {}, 0
+    contiguous = {}
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values)
+        if values.dtype.kind not in 'biuf':
+            raise ArtifactError(f"Array '{name}' has non-numeric dtype {values.dtype}")
+        values = values.astype(values.dtype.newbyteorder('<'), copy=False)
+        contiguous[name] = values
+        entries[name] = {'dtype': values.dtype.str, 'shape': list(values.shape), 'offset': offset}
+        offset = _align(offset + values.nbytes)
+
+    header = json.dumps({
+        'schema_version': SCHEMA_VERSION,
+        'metadata': metadata,
+        'arrays': entries,
+    }, sort_keys=True).encode()
+    data_start = _align(len(MAGIC) + 4 + len(header))
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for name, values in contiguous.items():
+            f.seek(data_start + entries[name]['offset'])
+            f.write(values.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+
+
+def read_artifact(path, mmap=True):
+    """
+    Read an artifact written by `write_artifact`.
+
+    Args:
+        path: artifact file
+        mmap: map the file read-only (True) or read it into memory
+
+    Returns:
+        tuple: (arrays dict of read-only views, metadata dict)
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(len(MAGIC) + 4)
+        if len(prefix) < len(MAGIC) + 4 or prefix[:len(MAGIC)] != MAGIC:
+            raise ArtifactError(f"{path} is not a model artifact")
+        (header_len,) = struct.unpack('<I', prefix[len(MAGIC):])
+        try:
+            header = json.loads(f.read(header_len))
+        except ValueError as e:
+            raise ArtifactError(f"{path} has a corrupt header: {e}") from None
+
+    version = header.get('schema_version')
+    if version != SCHEMA_VERSION:
+        raise ArtifactError(f"{path} uses schema version {version}, expected {SCHEMA_VERSION}")
+
+    data_start = _align(len(MAGIC) + 4 + header_len)
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        with open(path, 'rb') as f:
+            buffer = np.frombuffer(f.read(), dtype=np.uint8)
+
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        shape = tuple(entry['shape'])
+        start = data_start + entry['offset']
+        stop = start + dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+        if stop > len(buffer):
+            raise ArtifactError(f"{path} is truncated (array '{name}')")
+        arrays[name] = buffer[start:stop].view(dtype).reshape(shape)
+    return arrays, header['metadata']
+
+
+def read_metadata(path):
+    """
+    Header metadata only (no arrays mapped).
+    """
+    return read_artifact(path, mmap=True)[1]
+
+
+def _check_arrays(arrays, specs, dims, kind):
+    for name, spec in specs.items():
+        if name not in arrays:
+            raise ArtifactError(f"{kind} artifact is missing array '{name}'")
+        expected = tuple(
+            d if isinstance(d, int) else dims[d.split('+')[0]] + (1 if d.endswith('+1') else 0)
+            for d in spec
+        )
+        if arrays[name].shape != expected:
+            raise ArtifactError(f"Array '{name}' has shape {arrays[name].shape}, expected {expected}")
+
+
+def _check_zinb_arrays(arrays, metadata):
+    _check_arrays(arrays, ZINB_ARRAYS, {
+        'F': len(metadata['feature_names']),
+        'K_nb': len(metadata['nb_features']),
+        'K_infl': len(metadata['infl_features']),
+    }, 'ZINB')
+
+
+def _base_metadata(kind, name, model_version, source):
+    return {
+        'kind': kind,
+        'name': name or kind,
+        'model_version': model_version,
+        'source': os.path.basename(source) if source else None,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def export_zinb(predictor, path, source=None, name=None):
+    """
+    Write a ZINB artifact from a pickle-loaded ZINBPredictor.
+    """
+    from zinb_scorer import extract_coefficients
+
+    coefficients = extract_coefficients(
+        predictor.model_in, predictor.model_out,
+        predictor.scaler_nb, predictor.scaler_infl,
+        predictor.nb_features, predictor.infl_features
+    )
+    scorer = predictor.scorer
+    arrays = {name: coefficients[name] for name in ZINB_ARRAYS if name in coefficients}
+    arrays['weights'] = scorer.weights
+    write_artifact(path, arrays, dict(
+        _base_metadata('zinb', name, predictor.model_version, source),
+        feature_names=scorer.feature_names,
+        nb_features=coefficients['nb_features'],
+        infl_features=coefficients['infl_features'],
+        links=list(scorer.links),
+        heads=['in', 'out'],
+    ))
+
+
+def export_nb(predictor, path, source=None, name=None):
+    """
+    Write an NB artifact from a pickle-loaded NBModelPredictor.
+    """
+    fill_values = predictor.fill_values
+    if fill_values is None:
+        fill_values = np.full(len(predictor.feature_columns), np.nan)
+    write_artifact(path, {'params': predictor.params, 'fill_values': fill_values}, dict(
+        _base_metadata('nb', name, predictor.model_version, source),
+        feature_names=list(predictor.feature_columns),
+        alpha=None if predictor.alpha is None else float(predictor.alpha),
+        heads=['in'],
+    ))
+
+
+def export_nb_boost(predictor, path, source=None, name=None):
+    """
+    Write a two-stage artifact from a pickle-loaded BoostedNBPredictor.
+    """
+    fill_values = predictor.fill_values
+    if fill_values is None:
+        fill_values = np.full(len(predictor.feature_columns), np.nan)
+    trees = predictor.trees
+    arrays = {name: trees[name] for name in ('init', 'tree_offsets', 'feature', 'threshold', 'leaf_value')}
+    arrays.update(params=predictor.params, fill_values=fill_values, alpha=predictor.alpha)
+    write_artifact(path, arrays, dict(
+        _base_metadata('nb_boost', name, predictor.model_version, source),
+        feature_names=list(predictor.feature_columns),
+        heads=['in', 'out'],
+    ))
+
+
+def export_zinb_bank(predictor, path, source=None, name=None):
+    """
+    Write a bank artifact from a ZINBBankPredictor.
+    """
+    bank = predictor.scorer
+    write_artifact(path, {
+        'weights': bank.bank_weights, 'alpha': bank.bank_alpha, 'station_slot': bank.station_slot,
+    }, dict(
+        _base_metadata('zinb_bank', name, predictor.model_version, source),
+        feature_names=bank.feature_names,
+        nb_features=list(predictor.nb_features),
+        infl_features=list(predictor.infl_features),
+        links=list(bank.links),
+        station_ids=bank.station_ids,
+        heads=['in', 'out'],
+    ))
+
+
+def load_zinb(path=ZINB_ARTIFACT_PATH, mmap=True):
+    """
+    Build a ZINBPredictor from an artifact; the scorer's weights are views
+    into the mapped file.
+    """
+    from zinb_predictor import ZINBPredictor
+    from zinb_scorer import ZINBScorer
+
+    arrays, metadata = read_artifact(path, mmap=mmap)
+    if metadata.get('kind') != 'zinb':
+        raise ArtifactError(f"{path} holds a '{metadata.get('kind')}' model, expected 'zinb'")
+    _check_zinb_arrays(arrays, metadata)
+    scorer = ZINBScorer(metadata['feature_names'], arrays['weights'], arrays['alpha'], metadata['links'])
+    return ZINBPredictor.from_scorer(scorer, metadata['model_version'],
+                                     metadata['nb_features'], metadata['infl_features'])
+
+
+def load_nb(path, mmap=True):
+    """
+    Build an NBModelPredictor from an artifact.
+    """
+    from model_loader import NBModelPredictor
+
+    arrays, metadata = read_artifact(path, mmap=mmap)
+    if metadata.get('kind') != 'nb':
+        raise ArtifactError(f"{path} holds a '{metadata.get('kind')}' model, expected 'nb'")
+    _check_arrays(arrays, NB_ARRAYS, {'K': len(metadata['feature_names'])}, 'NB')
+    fill_values = arrays['fill_values']
+    return NBModelPredictor.from_coefficients(
+        metadata['feature_names'], arrays['params'],
+        None if np.isnan(fill_values).all() else fill_values,
+        metadata['model_version'], metadata.get('alpha')
+    )
+
+
+def load_nb_boost(path, mmap=True):
+    """
+    Build a BoostedNBPredictor from an artifact; the tree arrays are views
+    into the mapped file.
+    """
+    from boosted_predictor import BoostedNBPredictor
+
+    arrays, metadata = read_artifact(path, mmap=mmap)
+    if metadata.get('kind') != 'nb_boost':
+        raise ArtifactError(f"{path} holds a '{metadata.get('kind')}' model, expected 'nb_boost'")
+    n_trees, n_splits = (arrays['feature'].shape + (0, 0))[:2] if 'feature' in arrays else (0, 0)
+    _check_arrays(arrays, NB_BOOST_ARRAYS, {
+        'K': len(metadata['feature_names']), 'T': n_trees, 'S': n_splits, 'L': n_splits + 1,
+    }, 'NB boost')
+    fill_values = arrays['fill_values']
+    return BoostedNBPredictor.from_arrays(
+        metadata['feature_names'], arrays['params'],
+        None if np.isnan(fill_values).all() else fill_values,
+        arrays['alpha'], {name: arrays[name] for name in NB_BOOST_ARRAYS}, metadata['model_version']
+    )
+
+
+def load_zinb_bank(path, mmap=True):
+    """
+    Build a ZINBBankPredictor from an artifact; the stacked weights are views
+    into the mapped file.
+    """
+    from model_bank import ZINBBankPredictor, ZINBModelBank
+
+    arrays, metadata = read_artifact(path, mmap=mmap)
+    if metadata.get('kind') != 'zinb_bank':
+        raise ArtifactError(f"{path} holds a '{metadata.get('kind')}' model, expected 'zinb_bank'")
+    n_slots = len(arrays['weights']) if 'weights' in arrays else 0
+    _check_arrays(arrays, ZINB_BANK_ARRAYS, {
+        'G': n_slots, 'F': len(metadata['feature_names']), 'N': len(metadata['station_ids']),
+    }, 'ZINB bank')
+    bank = ZINBModelBank(metadata['feature_names'], arrays['weights'], arrays['alpha'],
+                         metadata['station_ids'], arrays['station_slot'], metadata['links'])
+    return ZINBBankPredictor.from_bank(bank, metadata['model_version'],
+                                       metadata['nb_features'], metadata['infl_features'])
+
+
+# Artifact kind -> loader(path); the model registry dispatches on this
+LOADERS = {
+    'zinb': load_zinb,
+    'nb': load_nb,
+    'nb_boost': load_nb_boost,
+    'zinb_bank': load_zinb_bank,
+}
+
+
+def load_model(path):
+    """
+    Load any supported artifact according to its header `kind`.
+    """
+    kind = read_metadata(path).get('kind')
+    if kind not in LOADERS:
+        raise ArtifactError(f"{path} holds an unsupported model kind '{kind}'")
+    return LOADERS[kind](path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help='convert a model pickle to an artifact')
+    export.add_argument('pickle', nargs='?', default='zinb_models.pkl')
+    export.add_argument('-o', '--output', default=ZINB_ARTIFACT_PATH)
+    export.add_argument('--kind', choices=['zinb', 'nb', 'nb_boost', 'zinb_bank'], default='zinb')
+    export.add_argument('--name', help='registry name (default: the kind)')
+    inspect = sub.add_parser('inspect', help='print an artifact header')
+    inspect.add_argument('artifact', nargs='?', default=ZINB_ARTIFACT_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'inspect':
+        arrays, metadata = read_artifact(args.artifact)
+        print(json.dumps(metadata, indent=2))
+        for name, values in arrays.items():
+            print(f"  {name:<12}{values.dtype.str:>6}  {values.shape}")
+        return
+
+    if args.kind == 'nb':
+        from model_loader import NBModelPredictor as predictor_class
+        exporter = export_nb
+    elif args.kind == 'nb_boost':
+        from boosted_predictor import BoostedNBPredictor as predictor_class
+        exporter = export_nb_boost
+    elif args.kind == 'zinb_bank':
+        from model_bank import ZINBBankPredictor as predictor_class
+        exporter = export_zinb_bank
+    else:
+        from zinb_predictor import ZINBPredictor as predictor_class
+        exporter = export_zinb
+
+    t0 = time.perf_counter()
+    predictor = predictor_class(args.pickle)
+    t_pickle = time.perf_counter() - t0
+    exporter(predictor, args.output, source=args.pickle, name=args.name)
+
+    t0 = time.perf_counter()
+    loaded = load_model(args.output)
+    t_artifact = time.perf_counter() - t0
+
+    print("\n" + "=" * 60)
+    print(f"✓ Wrote {args.output} ({loaded.model_version})")
+    print(f"  size: {os.path.getsize(args.pickle):>12,} bytes (pickle) -> "
+          f"{os.path.getsize(args.output):,} bytes")
+    print(f"  load: {t_pickle * 1000:>12.1f} ms (pickle + imports) -> {t_artifact * 1000:.2f} ms")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 """
 Real model loader for Negative Binomial model
 """
+import hashlib
 import pickle
 import numpy as np
 import pandas as pd
 from pathlib import Path
-import statsmodels.api as sm
+
+from count_distribution import DEFAULT_QUANTILES, DISTRIBUTION_MAX_COUNT, summarize
 
 class NBModelPredictor:
     """
@@ -24,7 +26,9 @@ class NBModelPredictor:
 
         print(f"Loading model from {self.model_path}...")
         with open(self.model_path, 'rb') as f:
-            model_dict = pickle.load(f)
+            raw = f.read()
+        model_dict = pickle.loads(raw)
+        self.model_version = f"nb-{hashlib.sha256(raw).hexdigest()[:12]}"
 
         # Extract components from the dictionary
         if isinstance(model_dict, dict):
@@ -68,6 +72,40 @@ class NBModelPredictor:
 
         print(f"  - Feature columns: {self.feature_columns}")
 
+        # GLM (NegativeBinomial family, log link) coefficients and the imputer's
+        # fill values, so predict() is a closed-form exp(X · params)
+        self.params = np.asarray(self.model.params, dtype=np.float64)
+        statistics = getattr(self.imputer, 'statistics_', None)
+        self.fill_values = np.asarray(statistics, dtype=np.float64) if statistics is not None else None
+        if len(self.params) != len(self.feature_columns) + 1:
+            raise ValueError(f"Model has {len(self.params)} coefficients, "
+                             f"expected {len(self.feature_columns) + 1} (const + features)")
+
+    @classmethod
+    def from_coefficients(cls, feature_columns, params, fill_values, model_version, alpha=None):
+        """
+        Build a predictor from exported coefficients (see model_artifact.load_nb),
+        without unpickling statsmodels / sklearn objects.
+        """
+        predictor = cls.__new__(cls)
+        predictor.model_path = None
+        predictor.model = predictor.imputer = None
+        predictor.alpha = alpha
+        predictor.feature_names = predictor.feature_columns = list(feature_columns)
+        predictor.params = np.asarray(params, dtype=np.float64)
+        predictor.fill_values = None if fill_values is None else np.asarray(fill_values, dtype=np.float64)
+        predictor.model_version = model_version
+        return predictor
+
+    def model_inputs(self, df):
+        """
+        The feature columns the model reads, in order (prediction cache key)
+        """
+        missing_features = set(self.feature_columns) - set(df.columns)
+        if missing_features:
+            raise ValueError(f"Missing required features: {missing_features}")
+        return df[self.feature_columns]
+
     def predict(self, input_data):
         """
         Make predictions using the loaded model
@@ -86,32 +124,16 @@ class NBModelPredictor:
         else:
             df = input_data.copy()
 
-        # Validate that all required features are present
-        missing_features = set(self.feature_columns) - set(df.columns)
-        if missing_features:
-            raise ValueError(f"Missing required features: {missing_features}")
-
-        # Select and order features correctly
-        X = df[self.feature_columns].values  # Convert to numpy array
-
-        # Apply imputation if imputer exists
-        # This follows the exact same preprocessing as during training
-        if self.imputer is not None:
-            X_imputed = self.imputer.transform(X)
-        else:
-            X_imputed = X
+        # Validate, select and order features correctly
+        X = self.model_inputs(df).to_numpy(dtype=np.float64)
 
-        # Add constant term for statsmodels
-        # During training: X_train_sm = sm.add_constant(X_train_imp)
-        X_with_const = sm.add_constant(X_imputed, has_constant='add')
+        # Apply imputation: median fill, same as SimpleImputer.transform during training
+        if self.fill_values is not None:
+            X = np.where(np.isnan(X), self.fill_values, X)
 
-        # Make prediction
+        # Make prediction: log link, E[y] = exp(const + X · w)
         try:
-            predictions = self.model.predict(X_with_const)
-
-            # Convert to numpy array if it's a pandas Series
-            if hasattr(predictions, 'values'):
-                predictions = predictions.values
+            predictions = np.exp(self.params[0] + X @ self.params[1:])
 
             # Clip predictions to reasonable range before rounding
             # Bike counts should be between 0 and 100 typically
@@ -120,13 +142,9 @@ class NBModelPredictor:
             # Round to integers (bike counts should be whole numbers)
             predictions = np.round(predictions).astype(int)
 
-            # Ensure non-negative predictions
-            predictions = np.maximum(predictions, 0)
-
         except Exception as e:
             print(f"Error during prediction: {e}")
-            print(f"Input shape: {X_with_const.shape}")
-            print(f"Input sample: {X_with_const[0]}")
+            print(f"Input shape: {X.shape}")
             raise
 
         # Return in the expected format
@@ -137,6 +155,37 @@ class NBModelPredictor:
             'departures': predictions.tolist()  # Using same for now, replace with OUT model
         }
 
+    def count_params(self, input_data):
+        """
+        Per-row NB2 parameters in the ZINB layout (no zero inflation, so pi = 0).
+        Like `predict`, the IN model is reported for departures too.
+
+        Returns:
+            tuple: (mu (n, 2), pi (n, 2), alpha (2,))
+        """
+        if isinstance(input_data, dict):
+            df = pd.DataFrame([input_data])
+        elif isinstance(input_data, list):
+            df = pd.DataFrame(input_data)
+        else:
+            df = input_data.copy()
+
+        X = self.model_inputs(df).to_numpy(dtype=np.float64)
+        if self.fill_values is not None:
+            X = np.where(np.isnan(X), self.fill_values, X)
+        mu = np.exp(self.params[0] + X @ self.params[1:])
+        mu = np.column_stack([mu, mu])
+        alpha = 0.0 if self.alpha is None else float(self.alpha)
+        return mu, np.zeros_like(mu), np.array([alpha, alpha])
+
+    def predict_distribution(self, input_data, quantiles=DEFAULT_QUANTILES, at_least=(),
+                             max_count=DISTRIBUTION_MAX_COUNT, include_pmf=False):
+        """
+        Predictive distribution of the NB2 GLM (see count_params)
+        """
+        return summarize(*self.count_params(input_data), quantiles=quantiles, at_least=at_least,
+                         max_count=max_count, include_pmf=include_pmf)
+
     def predict_single(self, hour_of_day, day_of_week, month, is_weekend,
                       station_lat, station_lng, dist_subway_m, dist_bus_m,
                       dist_university_m, dist_business, dist_residential,
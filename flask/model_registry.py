@@ -0,0 +1,224 @@
+"""
+Model registry with hot reload
+Holds several named predictors (ZINB, NB, rules, ...) loaded from versioned
+artifacts in MODEL_DIR. A watcher thread polls the directory and loads new or
+changed artifacts in the background; the name -> model table is then
+replaced in a single assignment, so in-flight requests finish on the model
+they started with and new requests see the new version.
+
+    models/zinb.bin   -> "zinb"   (name from the artifact header, else its kind)
+    models/nb.bin     -> "nb"
+    built-in          -> "rules"  (SimpleBikePredictor)
+"""
+import os
+import threading
+import time
+
+from model_artifact import load_model, read_metadata
+
+
+MODEL_DIR = os.getenv('MODEL_DIR', 'models')
+MODEL_DEFAULT = os.getenv('MODEL_DEFAULT', '')
+MODEL_WATCH_INTERVAL = float(os.getenv('MODEL_WATCH_INTERVAL', 10))
+ARTIFACT_SUFFIX = '.bin'
+
+# Default model when MODEL_DEFAULT is unset or not loaded: first one available
+DEFAULT_PREFERENCE = ('zinb', 'nb', 'rules')
+
+
+class UnknownModel(ValueError):
+    """
+    Raised when a request asks for a model the registry does not hold.
+    """
+
+
+class ModelEntry:
+    """
+    One registered predictor and where it came from.
+    """
+    __slots__ = ('name', 'model', 'version', 'path', 'signature', 'loaded_at')
+
+    def __init__(self, name, model, version, path=None, signature=None):
+        self.name = name
+        self.model = model
+        self.version = version
+        self.path = path
+        self.signature = signature
+        self.loaded_at = time.time()
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'type': type(self.model).__name__,
+            'version': self.version,
+            'path': self.path,
+            'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.loaded_at)),
+        }
+
+
+def _signature(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class ModelRegistry:
+    """
+    Name -> ModelEntry table, swapped atomically on reload. When several
+    artifacts carry the same name, the most recently loaded one wins and the
+    others take over again if it is deleted.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, extra_paths=(), default=MODEL_DEFAULT,
+                 watch_interval=MODEL_WATCH_INTERVAL):
+        """
+        Args:
+            model_dir: directory of *.bin artifacts to watch
+            extra_paths: individual artifact files to watch as well
+            default: model served when a request names none
+            watch_interval: seconds between directory scans (<= 0 disables the watcher)
+        """
+        self.model_dir = model_dir
+        self.extra_paths = [p for p in extra_paths if p]
+        self.default = default
+        self.watch_interval = watch_interval
+        self._entries = {}
+        self._static = {}
+        self._by_path = {}
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._signatures = {}
+        self._watcher = None
+        self._watcher_pid = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def register(self, name, model, version=None):
+        """
+        Add an in-process model that is not backed by an artifact (e.g. rules).
+        """
+        entry = ModelEntry(name, model, version or getattr(model, 'model_version', type(model).__name__))
+        with self._lock:
+            self._static[name] = entry
+            self._publish()
+        return entry
+
+    def _publish(self):
+        # Caller holds self._lock; readers only ever see a complete table
+        entries = dict(self._static)
+        for entry in self._by_path.values():
+            entries[entry.name] = entry
+        self._entries = entries
+
+    def _artifact_paths(self):
+        paths = list(self.extra_paths)
+        if self.model_dir and os.path.isdir(self.model_dir):
+            paths += sorted(os.path.join(self.model_dir, f) for f in os.listdir(self.model_dir)
+                            if f.endswith(ARTIFACT_SUFFIX))
+        return [p for p in paths if os.path.isfile(p)]
+
+    def scan(self):
+        """
+        Load new or changed artifacts and drop ones whose file disappeared.
+        Requests never wait on the table lock while loading; a file that fails to load is
+        retried only once it changes, and the previous version keeps serving.
+
+        Returns:
+            list of (name, version) that were (re)loaded
+        """
+        with self._scan_lock:
+            loaded, seen = [], set()
+            for path in self._artifact_paths():
+                seen.add(path)
+                try:
+                    signature = _signature(path)
+                except OSError:
+                    continue
+                if self._signatures.get(path) == signature:
+                    continue
+                self._signatures[path] = signature
+                try:
+                    metadata = read_metadata(path)
+                    model = load_model(path)
+                except Exception as e:
+                    print(f"⚠ Warning: Could not load model artifact {path}: {e}")
+                    continue
+                name = metadata.get('name') or metadata.get('kind') or os.path.splitext(os.path.basename(path))[0]
+                loaded.append(ModelEntry(name, model, metadata.get('model_version'), path, signature))
+
+            removed = [p for p in self._signatures if p not in seen]
+            for path in removed:
+                del self._signatures[path]
+            if not loaded and not removed:
+                return []
+
+            with self._lock:
+                for path in removed:
+                    self._by_path.pop(path, None)
+                for entry in loaded:
+                    self._by_path.pop(entry.path, None)
+                    self._by_path[entry.path] = entry
+                self._publish()
+
+        for entry in loaded:
+            print(f"✓ Model '{entry.name}' ready ({entry.version}, {entry.path})")
+        for path in removed:
+            print(f"⚠ Model artifact {path} removed")
+        return [(e.name, e.version) for e in loaded]
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"⚠ Warning: model directory scan failed: {e}")
+
+    def ensure_watcher(self):
+        """
+        Start the polling thread in this process (threads do not survive fork).
+        """
+        if self.watch_interval <= 0:
+            return
+        if self._watcher is not None and self._watcher_pid == os.getpid() and self._watcher.is_alive():
+            return
+        with self._lock:
+            if self._watcher is not None and self._watcher_pid == os.getpid() and self._watcher.is_alive():
+                return
+            self._watcher_pid = os.getpid()
+            self._watcher = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+            self._watcher.start()
+        # A worker forked (or recycled) after a swap catches up before serving
+        self.scan()
+
+    @property
+    def default_name(self):
+        entries = self._entries
+        if self.default in entries:
+            return self.default
+        for name in DEFAULT_PREFERENCE:
+            if name in entries:
+                return name
+        return next(iter(entries), None)
+
+    def entry(self, name=None):
+        """
+        Look up a model by name (None -> the default model).
+
+        Raises:
+            UnknownModel: no such model is registered
+        """
+        self.ensure_watcher()
+        entries = self._entries
+        name = name or self.default_name
+        entry = entries.get(name)
+        if entry is None:
+            raise UnknownModel(f"Unknown model '{name}'. Available: {sorted(entries)}")
+        return entry
+
+    def get(self, name=None):
+        return self.entry(name).model
+
+    def describe(self):
+        default = self.default_name
+        return [dict(e.describe(), default=e.name == default) for e in self._entries.values()]
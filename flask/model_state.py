@@ -0,0 +1,170 @@
+"""
+Deferred model loading
+Holds the serving model behind a loader so the app can bind its port and
+answer /health before the coefficients are in memory. MODEL_LOAD selects:
+
+    eager:      load during import (gunicorn preload: workers fork warm)
+    background: start loading on a thread at import; requests wait up to
+                MODEL_WAIT_SECONDS for it
+    lazy:       load on the first request that needs the model
+
+A failed load (e.g. an artifact still being written at startup) is retried
+by the next request after a backoff that doubles per failure, from
+MODEL_RETRY_SECONDS up to MODEL_RETRY_MAX_SECONDS; /models/reload retries
+at once.
+"""
+import os
+import threading
+import time
+
+
+MODEL_LOAD = os.getenv('MODEL_LOAD', 'background')
+MODEL_WAIT_SECONDS = float(os.getenv('MODEL_WAIT_SECONDS', 30))
+MODEL_RETRY_SECONDS = float(os.getenv('MODEL_RETRY_SECONDS', 5))
+MODEL_RETRY_MAX_SECONDS = float(os.getenv('MODEL_RETRY_MAX_SECONDS', 300))
+
+
+class ModelNotReady(RuntimeError):
+    """
+    Raised when the model is still loading after the wait budget.
+    """
+
+
+class ModelState:
+    """
+    Loads the model at most once per process. Threads do not survive fork,
+    so a worker forked while the master was still loading starts its own load.
+    """
+
+    def __init__(self, loader, on_ready=None, mode=MODEL_LOAD, retry_seconds=MODEL_RETRY_SECONDS,
+                 retry_max_seconds=MODEL_RETRY_MAX_SECONDS):
+        """
+        Args:
+            loader: callable() -> model
+            on_ready: optional callable(model) run once after loading
+            mode: 'eager', 'background' or 'lazy'
+            retry_seconds: backoff after the first failed load (doubles per failure)
+            retry_max_seconds: backoff ceiling
+        """
+        if mode not in ('eager', 'background', 'lazy'):
+            raise ValueError(f"Unknown MODEL_LOAD mode: {mode}")
+        self.loader = loader
+        self.on_ready = on_ready
+        self.mode = mode
+        self.model = None
+        self.error = None
+        self.load_seconds = None
+        self.retry_seconds = retry_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.failures = 0
+        self._retry_at = 0.0
+        self._pid = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.model is not None
+
+    def _load(self):
+        t0 = time.perf_counter()
+        try:
+            model = self.loader()
+            if self.on_ready is not None:
+                self.on_ready(model)
+            self.model = model
+            self.load_seconds = time.perf_counter() - t0
+            self.failures = 0
+        except Exception as e:
+            self.error = e
+            self.failures += 1
+            backoff = min(self.retry_max_seconds, self.retry_seconds * 2 ** (self.failures - 1))
+            self._retry_at = time.monotonic() + backoff
+        finally:
+            self._ready.set()
+
+    def start(self):
+        """
+        Begin loading according to `mode` (no-op for 'lazy').
+        """
+        if self.mode == 'eager':
+            self._start(background=False)
+        elif self.mode == 'background':
+            self._start(background=True)
+        return self
+
+    def _start(self, background, retry=False):
+        with self._lock:
+            # Loaded before fork: the copy inherited from the master is fine
+            if self.model is not None:
+                return
+            if self._pid == os.getpid():
+                # Only a finished, failed load of this process is started again
+                if not (retry and self._ready.is_set() and self.error is not None):
+                    return
+            elif self._pid is not None:
+                # New process: the parent's failure count does not apply
+                self.failures = 0
+            self._pid = os.getpid()
+            self.error = None
+            self._ready = threading.Event()
+            if background:
+                self._thread = threading.Thread(target=self._load, name='model-loader', daemon=True)
+                self._thread.start()
+                return
+        self._load()
+
+    def retry(self, force=False):
+        """
+        Start another load after a failed one once its backoff has passed
+        (right away with `force`). Returns True if a load was started.
+        """
+        if self.model is not None or self.error is None or self._pid != os.getpid():
+            return False
+        if not force and time.monotonic() < self._retry_at:
+            return False
+        self._start(background=self.mode != 'lazy', retry=True)
+        return True
+
+    def get(self, timeout=MODEL_WAIT_SECONDS):
+        """
+        Return the model, loading or waiting for it if necessary.
+
+        Raises:
+            ModelNotReady: still loading after `timeout` seconds
+            Exception: whatever the last load raised (until its retry backoff passes)
+        """
+        if self.model is not None:
+            return self.model
+        if self._pid != os.getpid():
+            self._start(background=self.mode != 'lazy')
+        else:
+            self.retry()
+        ready = self._ready
+        if not ready.wait(timeout):
+            raise ModelNotReady(f"Model is still loading (waited {timeout:.0f}s)")
+        model, error = self.model, self.error
+        if model is None:
+            raise error or ModelNotReady("Model failed to load")
+        return model
+
+    def status(self):
+        if self.model is not None:
+            state = 'ready'
+        elif self.error is not None:
+            state = 'error'
+        elif self._pid == os.getpid():
+            state = 'loading'
+        else:
+            state = 'not_started'
+        return {
+            'state': state,
+            'mode': self.mode,
+            'model': type(self.model).__name__ if self.model is not None else None,
+            'load_seconds': round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            'error': str(self.error) if self.error is not None else None,
+            'failures': self.failures,
+            'retry_in': (round(max(0.0, self._retry_at - time.monotonic()), 1)
+                         if self.error is not None else None),
+        }
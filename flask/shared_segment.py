@@ -0,0 +1,318 @@
+"""
+Shared-memory segment for gunicorn workers
+
+The master process (preload_app = True) writes the station feature table
+once to a tmpfs directory and re-opens it with np.load(mmap_mode='r'), so
+every worker, including ones recycled by max_requests, maps the same physical
+pages read-only. Model artifacts are memory-mapped straight from their files
+(see model_artifact.py), which shares their pages the same way.
+
+The prediction cache lives in the same directory as a fixed-size,
+set-associative table in an np.memmap: a hit computed by one worker is
+visible to all of them and survives worker recycling. The lag store's ring
+buffer is mapped the same way (SharedLagStore), so trips posted to one
+worker update the lags every worker serves.
+
+Enabled by SHARED_SEGMENT=1 (set by gunicorn_config.py); `python app.py`
+keeps everything in-process.
+"""
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from lag_store import LAG_CAPACITY_HOURS, LAG_FEATURES, LagStore
+from prediction_cache import PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PredictionCache
+
+
+def _default_segment_dir():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'bluebikes-segment')
+
+
+SHARED_SEGMENT = os.getenv('SHARED_SEGMENT', '0') == '1'
+SHARED_SEGMENT_DIR = os.getenv('SHARED_SEGMENT_DIR', _default_segment_dir())
+
+# Cache layout: WAYS entries per set, sets = next power of two >= size / WAYS.
+# `key` is written last and `key_check` first (zeroed), so a reader that sees
+# key == key_check == its key saw a complete entry.
+CACHE_WAYS = 4
+CACHE_ENTRY = np.dtype([
+    ('key_check', '<u8'),
+    ('namespace', '<u8'),
+    ('check', '<u8'),
+    ('expires', '<f8'),
+    ('used', '<f8'),
+    ('arrivals', '<i4'),
+    ('departures', '<i4'),
+    ('key', '<u8'),
+])
+COUNTERS = ('hits', 'misses', 'evictions', 'expirations')
+
+# Shared lag store: fixed-size station table (Bluebikes has ~600 stations)
+LAG_MAX_STATIONS = int(os.getenv('LAG_MAX_STATIONS', 4096))
+STATION_ID_WIDTH = 32
+
+
+class SharedSegment:
+    """
+    Directory of .npy arrays shared by all worker processes
+    """
+
+    def __init__(self, segment_dir=SHARED_SEGMENT_DIR):
+        self.segment_dir = segment_dir
+        os.makedirs(segment_dir, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.segment_dir, name)
+
+    def publish(self, name, arrays):
+        """
+        Write `arrays` atomically and return read-only memory-mapped views.
+        """
+        mapped = {}
+        for key, values in arrays.items():
+            path = self.path(f"{name}.{key}.npy")
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                np.save(f, np.ascontiguousarray(values))
+            os.replace(tmp, path)
+            mapped[key] = np.load(path, mmap_mode='r')
+        return mapped
+
+    def share(self, name, obj):
+        """
+        Move an object's arrays (shared_arrays / attach_arrays protocol) into the segment.
+        """
+        obj.attach_arrays(self.publish(name, obj.shared_arrays()))
+        return obj
+
+    def remove(self):
+        shutil.rmtree(self.segment_dir, ignore_errors=True)
+
+
+def _hash_key(namespace, key):
+    """
+    64-bit key (never 0, which marks an empty slot), 64-bit check word and
+    64-bit namespace id.
+    """
+    digest = hashlib.blake2b(namespace.encode() + b'\0' + key, digest_size=16).digest()
+    k = int.from_bytes(digest[:8], 'little') | 1
+    c = int.from_bytes(digest[8:], 'little')
+    ns = int.from_bytes(hashlib.blake2b(namespace.encode(), digest_size=8).digest(), 'little')
+    return k, c, ns
+
+
+class SharedPredictionCache(PredictionCache):
+    """
+    PredictionCache backed by a memory-mapped table shared across processes.
+    Reads are lock-free; writes (cache misses only) are serialized with flock.
+    Counters are shared but updated without locks, so they are approximate
+    under concurrency.
+    """
+
+    def __init__(self, segment, max_entries=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL):
+        super().__init__(max_entries, ttl)
+        n_sets = 1 << max(int(np.ceil(np.log2(max(max_entries, CACHE_WAYS) / CACHE_WAYS))), 0)
+        shape = (n_sets, CACHE_WAYS)
+        table_path = segment.path('prediction_cache.bin')
+        expected = n_sets * CACHE_WAYS * CACHE_ENTRY.itemsize
+        mode = 'r+' if os.path.exists(table_path) and os.path.getsize(table_path) == expected else 'w+'
+        self.table = np.memmap(table_path, dtype=CACHE_ENTRY, mode=mode, shape=shape)
+
+        counters_path = segment.path('prediction_cache.counters')
+        mode = 'r+' if os.path.exists(counters_path) else 'w+'
+        self.counters = np.memmap(counters_path, dtype='<i8', mode=mode, shape=(len(COUNTERS),))
+        self._lock_path = segment.path('prediction_cache.lock')
+        self.max_entries = n_sets * CACHE_WAYS
+
+    def __len__(self):
+        return int(np.count_nonzero((self.table['key'] != 0) & (self.table['expires'] >= time.time())))
+
+    def _count(self, name, n):
+        if n:
+            self.counters[COUNTERS.index(name)] += n
+
+    def _locate(self, namespace, keys):
+        hashed = np.array([_hash_key(namespace, key) for key in keys], dtype=np.uint64).reshape(-1, 3)
+        k, c, ns = hashed[:, 0], hashed[:, 1], hashed[:, 2]
+        sets = (k & np.uint64(self.table.shape[0] - 1)).astype(np.int64)
+        return k, c, ns, sets
+
+    def get_many(self, namespace, keys, now=None):
+        now = time.time() if now is None else now
+        if not keys:
+            return []
+        k, c, _, sets = self._locate(namespace, keys)
+        rows = np.array(self.table[sets])  # snapshot of each key's set
+        same = ((rows['key_check'] == k[:, None]) & (rows['key'] == k[:, None])
+                & (rows['check'] == c[:, None]))
+        live = same & (rows['expires'] >= now)
+        hit = live.any(axis=1)
+        way = live.argmax(axis=1)
+
+        self._count('hits', int(hit.sum()))
+        self._count('misses', int((~hit).sum()))
+        self._count('expirations', int((same.any(axis=1) & ~hit).sum()))
+        if hit.any():
+            # Benign race: approximate LRU timestamps
+            self.table['used'][sets[hit], way[hit]] = now
+
+        entries = rows[np.arange(len(keys)), way]
+        return [(int(e['arrivals']), int(e['departures'])) if h else None
+                for e, h in zip(entries, hit)]
+
+    def put_many(self, namespace, keys, arrivals, departures, now=None):
+        now = time.time() if now is None else now
+        if not keys:
+            return
+        k, c, ns, sets = self._locate(namespace, keys)
+        expires = now + self.ttl
+        evictions = 0
+        with open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                for i in range(len(keys)):
+                    entries = self.table[sets[i]]
+                    match = np.flatnonzero(entries['key'] == k[i])
+                    if len(match):
+                        way = match[0]
+                    else:
+                        free = (entries['key'] == 0) | (entries['expires'] < now)
+                        way = np.flatnonzero(free)[0] if free.any() else int(np.argmin(entries['used']))
+                        evictions += int(not free.any())
+                    slot = self.table[sets[i]]
+                    slot['key_check'][way] = 0
+                    slot['key'][way] = 0
+                    slot['namespace'][way] = ns[i]
+                    slot['check'][way] = c[i]
+                    slot['expires'][way] = expires
+                    slot['used'][way] = now
+                    slot['arrivals'][way] = int(arrivals[i])
+                    slot['departures'][way] = int(departures[i])
+                    slot['key_check'][way] = k[i]
+                    slot['key'][way] = k[i]
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._count('evictions', evictions)
+
+    def clear(self, namespace=None):
+        with open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if namespace is None:
+                    self.table['key'] = 0
+                else:
+                    ns = _hash_key(namespace, b'')[2]
+                    self.table['key'][self.table['namespace'] == ns] = 0
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def stats(self):
+        hits, misses, evictions, expirations = (int(v) for v in self.counters)
+        lookups = hits + misses
+        return {
+            'size': len(self),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'evictions': evictions,
+            'expirations': expirations,
+            'shared': True,
+        }
+
+
+class FileLock:
+    """
+    Exclusive flock on `path`. The file is opened per acquisition, so the lock
+    excludes other threads of this process as well as other processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def __enter__(self):
+        lock = open(self.path, 'a')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        self._local.file = lock
+        return self
+
+    def __exit__(self, *exc):
+        lock = self._local.file
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+
+
+class SharedLagStore(LagStore):
+    """
+    LagStore whose ring buffer, slot hours, head hour and station-id table
+    are np.memmaps in the segment. Built fresh in the preloaded master;
+    workers inherit the mappings over fork, so /trips ingested by any worker
+    is seen by all of them. All updates and lookups are serialized with flock.
+
+    The station table is fixed-size: ids beyond `max_stations` (or longer than
+    STATION_ID_WIDTH characters) are not buffered and look up as NaN.
+    """
+
+    def __init__(self, segment, capacity=LAG_CAPACITY_HOURS, max_stations=LAG_MAX_STATIONS):
+        self.header = np.memmap(segment.path('lag_header.bin'), dtype='<i8', mode='w+', shape=(2,))
+        super().__init__(capacity, initial_stations=0)
+        self.counts = np.memmap(segment.path('lag_counts.bin'), dtype=np.int32, mode='w+',
+                                shape=(max_stations, capacity, 2))
+        self.slot_hours = np.memmap(segment.path('lag_slot_hours.bin'), dtype='<i8', mode='w+', shape=(capacity,))
+        self.slot_hours[:] = -1
+        self.station_table = np.memmap(segment.path('lag_stations.bin'), dtype=f'<U{STATION_ID_WIDTH}',
+                                       mode='w+', shape=(max_stations,))
+        self._lock = FileLock(segment.path('lag_store.lock'))
+
+    @property
+    def head_hour(self):
+        return int(self.header[0])
+
+    @head_hour.setter
+    def head_hour(self, hour):
+        self.header[0] = hour
+
+    def __len__(self):
+        return int(self.header[1])
+
+    def _sync(self):
+        """
+        Pick up stations other workers added since this process last looked.
+        """
+        for row in range(len(self.station_rows), len(self)):
+            self.station_rows[str(self.station_table[row])] = row
+
+    def _rows_for(self, station_ids):
+        """
+        Map station ids to shared rows (called under the lock); -1 when the table is full.
+        """
+        self._sync()
+        keys = pd.Series(station_ids, dtype='string').fillna('')
+        codes, uniques = pd.factorize(keys)
+        unique_rows = np.empty(len(uniques), dtype=np.int64)
+        for i, key in enumerate(uniques):
+            row = self.station_rows.get(key)
+            if row is None:
+                n = len(self)
+                if n >= len(self.station_table) or len(key) > STATION_ID_WIDTH:
+                    row = -1
+                else:
+                    self.station_table[n] = key
+                    self.header[1] = n + 1   # publish after the id is written
+                    row = self.station_rows[key] = n
+            unique_rows[i] = row
+        return unique_rows[codes]
+
+    def lookup(self, station_ids, at_hours, features=LAG_FEATURES):
+        self._sync()
+        return super().lookup(station_ids, at_hours, features)
@@ -5,6 +5,123 @@ Simple bike demand predictor based on common sense rules
 import numpy as np
 import pandas as pd
 
+
+SIMPLE_PREDICTOR_SEED = 42
+
+# Column -> default when a request omits it
+DEFAULTS = {
+    'hour_of_day': 12,
+    'day_of_week': 0,
+    'month': 6,
+    'is_weekend': 0,
+    'station_lat': 42.36,
+    'station_lng': -71.06,
+    'dist_university_m': 500.0,
+    'dist_business': 500.0,
+}
+
+# 基础需求区间 [low, high) by hour: (first hour, last hour) -> bounds; first match wins
+WEEKDAY_DEMAND = [
+    ((7, 9), (20, 35)),     # 早高峰
+    ((17, 19), (20, 35)),   # 晚高峰
+    ((10, 16), (10, 20)),   # 白天
+    ((20, 23), (5, 12)),    # 晚上
+]
+WEEKDAY_DEMAND_DEFAULT = (0, 5)    # 深夜/凌晨 (0-6)
+WEEKEND_DEMAND = [
+    ((10, 18), (15, 25)),   # 周末白天
+    ((19, 23), (8, 15)),    # 周末晚上
+]
+WEEKEND_DEMAND_DEFAULT = (0, 8)    # 周末深夜/早晨
+
+SEASON_MULTIPLIER = {6: 1.2, 7: 1.2, 8: 1.2,                      # 夏季
+                     3: 1.0, 4: 1.0, 5: 1.0, 9: 1.0, 10: 1.0,     # 春秋
+                     11: 0.7, 12: 0.7, 1: 0.7, 2: 0.7}            # 冬季
+
+# Weekday arrival share: (downtown, elsewhere); weekends draw 0.5 ± 0.15
+WEEKDAY_ARRIVAL_RATIO = [
+    ((7, 9), (0.70, 0.30)),     # 早高峰：进城
+    ((17, 19), (0.30, 0.70)),   # 晚高峰：回家
+    ((12, 14), (0.55, 0.55)),   # 午间
+]
+WEEKDAY_ARRIVAL_RATIO_DEFAULT = (0.50, 0.50)
+
+
+def _hour_table(rules, default):
+    """
+    Expand (first, last) hour rules into a (25, k) lookup table; row 24
+    catches hours outside 0-23, which fall through to the default.
+    """
+    table = np.empty((25, len(default)), dtype=np.float64)
+    table[:] = default
+    for (first, last), value in reversed(rules):
+        table[first:last + 1] = value
+    return table
+
+
+# [is_weekend, hour] -> (low, high)
+DEMAND_TABLE = np.stack([_hour_table(WEEKDAY_DEMAND, WEEKDAY_DEMAND_DEFAULT),
+                         _hour_table(WEEKEND_DEMAND, WEEKEND_DEMAND_DEFAULT)]).astype(np.int64)
+# [hour] -> (downtown, elsewhere)
+RATIO_TABLE = _hour_table(WEEKDAY_ARRIVAL_RATIO, WEEKDAY_ARRIVAL_RATIO_DEFAULT)
+# [month] -> multiplier; row 0 catches months outside 1-12
+SEASON_TABLE = np.array([1.0] + [SEASON_MULTIPLIER[m] for m in range(1, 13)])
+
+# Uniform draws per row: base demand, weekend arrival ratio, arrival / departure noise
+N_DRAWS = 4
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _splitmix64(x):
+    """
+    SplitMix64 finalizer on a uint64 array (counter-based, stateless).
+    """
+    with np.errstate(over='ignore'):
+        x = (x + np.uint64(0x9E3779B97F4A7C15)) & _MASK64
+        x = ((x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)) & _MASK64
+        x = ((x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)) & _MASK64
+        return x ^ (x >> np.uint64(31))
+
+
+def station_hour_draws(columns, station_ids=None, seed=SIMPLE_PREDICTOR_SEED, n_draws=N_DRAWS):
+    """
+    Uniform [0, 1) draws that depend only on the seed and each row's
+    station-hour key (station id plus the normalized rule inputs), so the
+    same row gets the same prediction in every worker, in any batch and at
+    any position.
+
+    Args:
+        columns: column name -> array, as built by SimpleBikePredictor._columns
+        station_ids: optional array of station ids
+
+    Returns:
+        ndarray: (n, n_draws)
+    """
+    n = len(next(iter(columns.values())))
+    h = np.full(n, _splitmix64(np.uint64(seed)), dtype=np.uint64)
+    if station_ids is not None:
+        # Hash each distinct id once
+        codes, uniques = pd.factorize(np.asarray(station_ids, dtype=object))
+        unique_hashes = pd.util.hash_array(np.array([str(u) for u in uniques], dtype=object))
+        if len(uniques):
+            h ^= np.where(codes >= 0, unique_hashes[codes], np.uint64(0))
+    with np.errstate(over='ignore'):
+        for name in DEFAULTS:
+            # float64 bit pattern, so 8 and 8.0 hash alike
+            h = _splitmix64(h ^ np.ascontiguousarray(columns[name], dtype=np.float64).view(np.uint64))
+        counters = h[:, None] + np.arange(1, n_draws + 1, dtype=np.uint64)
+    # Top 53 bits -> double in [0, 1)
+    return (_splitmix64(counters) >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+def _integers(u, low, high):
+    """
+    Map uniforms to integers in [low, high), like Generator.integers.
+    """
+    return low + np.floor(u * (high - low)).astype(np.int64)
+
+
 class SimpleBikePredictor:
     """
     Simple predictor based on common sense patterns:
@@ -14,10 +131,22 @@ class SimpleBikePredictor:
     - Location: downtown > suburbs
     """
 
-    def __init__(self):
-        np.random.seed(42)
+    def __init__(self, seed=SIMPLE_PREDICTOR_SEED):
+        self.seed = seed
 
-    def predict(self, data):
+    def _columns(self, data):
+        columns = {}
+        for name, default in DEFAULTS.items():
+            if name in data.columns:
+                values = pd.to_numeric(data[name], errors='coerce').to_numpy(dtype=np.float64)
+                columns[name] = np.where(np.isnan(values), default, values)
+            else:
+                columns[name] = np.full(len(data), default, dtype=np.float64)
+        for name in ('hour_of_day', 'day_of_week', 'month', 'is_weekend'):
+            columns[name] = columns[name].astype(np.int64)
+        return columns
+
+    def predict(self, data, rng=None):
         """
         Predict bike arrivals and departures
 
@@ -35,6 +164,11 @@ class SimpleBikePredictor:
         - dist_residential: distance to residential
         - restaurant_count: number of nearby restaurants
 
+        Args:
+            data: DataFrame, dict or list of dicts
+            rng: optional np.random.Generator; by default the random parts
+                are drawn deterministically per station-hour (see station_hour_draws)
+
         Returns:
         {
             'arrivals': array of predicted arrivals,
@@ -46,110 +180,59 @@ class SimpleBikePredictor:
         elif isinstance(data, list):
             data = pd.DataFrame(data)
 
-        arrivals = []
-        departures = []
-
-        for idx, row in data.iterrows():
-            # Extract features
-            hour = int(row.get('hour_of_day', 12))
-            day = int(row.get('day_of_week', 0))
-            month = int(row.get('month', 6))
-            is_weekend = int(row.get('is_weekend', 0))
-            lat = float(row.get('station_lat', 42.36))
-            lng = float(row.get('station_lng', -71.06))
-            dist_university = float(row.get('dist_university_m', 500))
-            dist_business = float(row.get('dist_business', 500))
-
-
-            if not is_weekend:  # 工作日
-                if 7 <= hour <= 9:  # 早高峰
-                    base_demand = np.random.randint(20, 35)
-                elif 17 <= hour <= 19:  # 晚高峰
-                    base_demand = np.random.randint(20, 35)
-                elif 10 <= hour <= 16:  # 白天
-                    base_demand = np.random.randint(10, 20)
-                elif 20 <= hour <= 23:  # 晚上
-                    base_demand = np.random.randint(5, 12)
-                else:  # 深夜/凌晨 (0-6)
-                    base_demand = np.random.randint(0, 5)
-            else:  # 周末
-                if 10 <= hour <= 18:  # 周末白天
-                    base_demand = np.random.randint(15, 25)
-                elif 19 <= hour <= 23:  # 周末晚上
-                    base_demand = np.random.randint(8, 15)
-                else:  # 周末深夜/早晨
-                    base_demand = np.random.randint(0, 8)
-
-            if month in [6, 7, 8]:  # 夏季
-                season_multiplier = 1.2
-            elif month in [3, 4, 5, 9, 10]:  # 春秋
-                season_multiplier = 1.0
-            elif month in [11, 12, 1, 2]:  # 冬季
-                season_multiplier = 0.7
-            else:
-                season_multiplier = 1.0
-
-            distance_from_center = np.sqrt(
-                (lat - 42.36)**2 + (lng + 71.06)**2
-            )
-
-            # 靠近市中心 = 高活跃度
-            if distance_from_center < 0.02:  # 非常近
-                location_multiplier = 1.3
-            elif distance_from_center < 0.05:  # 比较近
-                location_multiplier = 1.1
-            else:  # 远
-                location_multiplier = 0.9
-
-            # 靠近大学 = 高活跃度
-            if dist_university < 200:
-                location_multiplier *= 1.2
-
-            # 靠近商业区 = 高活跃度
-            if dist_business < 300:
-                location_multiplier *= 1.15
-
-            total_demand = base_demand * season_multiplier * location_multiplier
-
-            is_downtown = distance_from_center < 0.05
-
-            if not is_weekend:
-                if 7 <= hour <= 9:
-                    if is_downtown:
-                        arrival_ratio = 0.70
-                    else:
-                        arrival_ratio = 0.30
-                elif 17 <= hour <= 19:
-                    if is_downtown:
-                        arrival_ratio = 0.30
-                    else:
-                        arrival_ratio = 0.70
-                elif 12 <= hour <= 14:
-                    arrival_ratio = 0.55
-                else:
-                    arrival_ratio = 0.50
-            else:
-                arrival_ratio = 0.50 + np.random.uniform(-0.15, 0.15)
+        columns = self._columns(data)
+        if rng is None:
+            station_ids = data['station_id'].to_numpy() if 'station_id' in data.columns else None
+            draws = station_hour_draws(columns, station_ids, self.seed)
+        else:
+            draws = rng.random((len(data), N_DRAWS))
+        arrivals, departures = _apply_rules(columns, draws)
+        return {
+            'arrivals': arrivals,
+            'departures': departures
+        }
 
-            arrival_count = int(total_demand * arrival_ratio)
-            departure_count = int(total_demand * (1 - arrival_ratio))
 
-            arrival_count += np.random.randint(-3, 4)
-            departure_count += np.random.randint(-3, 4)
+def _apply_rules(c, draws):
+    """
+    The rule table, evaluated with lookup-table gathers and masks.
 
-            arrival_count = max(0, arrival_count)
-            departure_count = max(0, departure_count)
+    Args:
+        c: column name -> array (see SimpleBikePredictor._columns)
+        draws: (n, N_DRAWS) uniforms in [0, 1)
+    """
+    hour = c['hour_of_day']
+    hour_idx = np.where((hour >= 0) & (hour <= 23), hour, 24)
+    weekend = c['is_weekend'] != 0
+    month = c['month']
 
-            arrival_count = min(50, arrival_count)
-            departure_count = min(50, departure_count)
+    bounds = DEMAND_TABLE[weekend.astype(np.intp), hour_idx]
+    base_demand = _integers(draws[:, 0], bounds[:, 0], bounds[:, 1])
 
-            arrivals.append(arrival_count)
-            departures.append(departure_count)
+    season_multiplier = SEASON_TABLE[np.where((month >= 1) & (month <= 12), month, 0)]
 
-        return {
-            'arrivals': np.array(arrivals),
-            'departures': np.array(departures)
-        }
+    distance_from_center = np.sqrt((c['station_lat'] - 42.36) ** 2 + (c['station_lng'] + 71.06) ** 2)
+    # 靠近市中心 = 高活跃度
+    location_multiplier = np.where(distance_from_center < 0.02, 1.3,
+                                   np.where(distance_from_center < 0.05, 1.1, 0.9))
+    # 靠近大学 / 商业区 = 高活跃度
+    location_multiplier *= np.where(c['dist_university_m'] < 200, 1.2, 1.0)
+    location_multiplier *= np.where(c['dist_business'] < 300, 1.15, 1.0)
+
+    total_demand = base_demand * season_multiplier * location_multiplier
+
+    is_downtown = distance_from_center < 0.05
+    arrival_ratio = RATIO_TABLE[hour_idx, np.where(is_downtown, 0, 1)]
+    arrival_ratio = np.where(weekend, 0.50 + (draws[:, 1] * 0.30 - 0.15), arrival_ratio)
+
+    # int() 截断（需求非负，等同于向下取整）
+    arrival_count = (total_demand * arrival_ratio).astype(np.int64)
+    departure_count = (total_demand * (1 - arrival_ratio)).astype(np.int64)
+
+    arrival_count += _integers(draws[:, 2], -3, 4)
+    departure_count += _integers(draws[:, 3], -3, 4)
+
+    return np.clip(arrival_count, 0, 50), np.clip(departure_count, 0, 50)
 
 
 if __name__ == "__main__":
@@ -254,5 +337,93 @@ if __name__ == "__main__":
     print(f"  Summer (July): Arrivals={result_summer['arrivals'][0]}, Departures={result_summer['departures'][0]}")
     print(f"  Pattern: Summer demand > Winter demand")
 
+    print("\nTest 6: Rule table matches the original row-by-row rules")
+
+    def reference_row(row, u):
+        # The pre-vectorization loop body, drawing from `u` instead of np.random
+        hour, month, is_weekend = int(row['hour_of_day']), int(row['month']), int(row['is_weekend'])
+        lat, lng = float(row['station_lat']), float(row['station_lng'])
+        randint = lambda i, lo, hi: lo + int(np.floor(u[i] * (hi - lo)))
+        if not is_weekend:
+            if 7 <= hour <= 9 or 17 <= hour <= 19:
+                base_demand = randint(0, 20, 35)
+            elif 10 <= hour <= 16:
+                base_demand = randint(0, 10, 20)
+            elif 20 <= hour <= 23:
+                base_demand = randint(0, 5, 12)
+            else:
+                base_demand = randint(0, 0, 5)
+        else:
+            if 10 <= hour <= 18:
+                base_demand = randint(0, 15, 25)
+            elif 19 <= hour <= 23:
+                base_demand = randint(0, 8, 15)
+            else:
+                base_demand = randint(0, 0, 8)
+        season = 1.2 if month in [6, 7, 8] else 0.7 if month in [11, 12, 1, 2] else 1.0
+        distance = np.sqrt((lat - 42.36) ** 2 + (lng + 71.06) ** 2)
+        location = 1.3 if distance < 0.02 else 1.1 if distance < 0.05 else 0.9
+        if row['dist_university_m'] < 200:
+            location *= 1.2
+        if row['dist_business'] < 300:
+            location *= 1.15
+        total = base_demand * season * location
+        downtown = distance < 0.05
+        if not is_weekend:
+            if 7 <= hour <= 9:
+                ratio = 0.70 if downtown else 0.30
+            elif 17 <= hour <= 19:
+                ratio = 0.30 if downtown else 0.70
+            elif 12 <= hour <= 14:
+                ratio = 0.55
+            else:
+                ratio = 0.50
+        else:
+            ratio = 0.50 + (u[1] * 0.30 - 0.15)
+        a = int(total * ratio) + randint(2, -3, 4)
+        d = int(total * (1 - ratio)) + randint(3, -3, 4)
+        return min(50, max(0, a)), min(50, max(0, d))
+
+    import time
+    rng = np.random.default_rng(0)
+    n = 100_000
+    grid = pd.DataFrame({
+        'station_id': rng.integers(0, 500, n).astype(str),
+        'hour_of_day': rng.integers(0, 24, n),
+        'day_of_week': rng.integers(0, 7, n),
+        'month': rng.integers(1, 13, n),
+        'station_lat': 42.36 + rng.normal(0, 0.04, n),
+        'station_lng': -71.06 + rng.normal(0, 0.04, n),
+        'dist_university_m': rng.uniform(0, 1500, n),
+        'dist_business': rng.uniform(0, 1500, n),
+    })
+    grid['is_weekend'] = (grid['day_of_week'] >= 5).astype(int)
+
+    columns = predictor._columns(grid)
+    draws = station_hour_draws(columns, grid['station_id'].to_numpy(), predictor.seed)
+    fast = predictor.predict(grid)
+    sample = rng.choice(n, 5000, replace=False)
+    t0 = time.perf_counter()
+    expected = [reference_row(grid.iloc[i], draws[i]) for i in sample]
+    t_reference = (time.perf_counter() - t0) / len(sample) * n
+    assert [(fast['arrivals'][i], fast['departures'][i]) for i in sample] == expected
+    print(f"  ✓ {len(sample)} sampled rows match the scalar rules")
+
+    print("\nTest 7: Deterministic per station-hour")
+    shuffled = grid.iloc[::-1].reset_index(drop=True)
+    again = SimpleBikePredictor().predict(shuffled)
+    assert np.array_equal(again['arrivals'][::-1], fast['arrivals'])
+    assert np.array_equal(again['departures'][::-1], fast['departures'])
+    print("  ✓ Same predictions in a new instance and in reverse order")
+
+    print("\nBenchmark: 100k rows")
+    timings = []
+    for _ in range(5):
+        t0 = time.perf_counter()
+        predictor.predict(grid)
+        timings.append(time.perf_counter() - t0)
+    print(f"  row-by-row (extrapolated): {t_reference * 1000:8.0f} ms")
+    print(f"  vectorized (best of 5):    {min(timings) * 1000:8.1f} ms")
+
     print("\n" + "=" * 60)
     print("✓ All tests completed!")
@@ -8,5 +8,14 @@ export PORT=${PORT:-5000}
 
 echo "Binding to port $PORT"
 
+# Serving only reads the versioned artifact; convert a missing or stale pickle
+# export once, outside the workers, and stop if that fails
+ARTIFACT=${ZINB_ARTIFACT_PATH:-zinb_model.bin}
+PICKLE=${ZINB_MODEL_PATH:-zinb_models.pkl}
+if [ -f "$PICKLE" ] && { [ ! -f "$ARTIFACT" ] || [ "$PICKLE" -nt "$ARTIFACT" ]; }; then
+    echo "Exporting $PICKLE to $ARTIFACT..."
+    python model_artifact.py export "$PICKLE" -o "$ARTIFACT" || exit 1
+fi
+
 # Start Gunicorn with the configuration file
 exec gunicorn --config gunicorn_config.py wsgi:app
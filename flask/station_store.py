@@ -0,0 +1,274 @@
+"""
+Array-backed station feature store
+Loads per-station attributes once at startup and enriches requests that only
+carry a station_id / station_name (+ timestamp) by vectorized gather
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from forecast_grid import time_features
+
+
+STATION_FEATURES_PATH = os.getenv('STATION_FEATURES_PATH', 'station_features.csv')
+
+# Feature columns served by the store, with the values used for rows that carry no station key
+# (same defaults the Next.js route and SimpleBikePredictor used to assume)
+DEFAULT_FEATURES = {
+    'station_lat': 42.36,
+    'station_lng': -71.06,
+    'dist_subway_m': 200.0,
+    'dist_bus_m': 50.0,
+    'dist_university_m': 500.0,
+    'dist_business': 300.0,
+    'dist_residential': 300.0,
+    'restaurant_count': 15.0,
+    'subway_distance_m': 200.0,
+    'mbta_stops_250m': 2.0,
+    'last_day_in': 10.0,
+    'last_day_out': 10.0,
+}
+FEATURE_COLUMNS = list(DEFAULT_FEATURES)
+
+# Alternative column names found in pipeline outputs
+COLUMN_ALIASES = {
+    'latitude': 'station_lat',
+    'lat': 'station_lat',
+    'longitude': 'station_lng',
+    'lng': 'station_lng',
+    'lon': 'station_lng',
+    'bus_distance_m': 'dist_bus_m',
+    'university_distance_m': 'dist_university_m',
+}
+
+
+class UnknownStation(ValueError):
+    """
+    Raised when a request names a station the table does not have; scoring it
+    from DEFAULT_FEATURES would return a made-up forecast.
+    """
+
+
+def estimate_mbta_stops(dist_bus_m):
+    """
+    Heuristic MBTA stop count within 250 m from the nearest bus-stop distance:
+    < 50 m -> 3, < 100 m -> 2, < 200 m -> 1, otherwise 0
+    """
+    dist = np.asarray(dist_bus_m, dtype=np.float64)
+    return np.select([dist < 50, dist < 100, dist < 200], [3, 2, 1], default=0)
+
+
+def to_float(values):
+    return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def derive_distance_features(columns):
+    """
+    subway_distance_m / mbta_stops_250m from dist_subway_m / dist_bus_m, in
+    place (dict of arrays or DataFrame). Shared by request enrichment,
+    StationStore.from_frame and the training pipeline's station table.
+    Explicitly given values win; rows without a source value stay NaN so the
+    caller can fill them.
+    """
+    derived = {}
+    if 'dist_subway_m' in columns:
+        derived['subway_distance_m'] = to_float(columns['dist_subway_m'])
+    if 'dist_bus_m' in columns:
+        dist = to_float(columns['dist_bus_m'])
+        derived['mbta_stops_250m'] = np.where(np.isnan(dist), np.nan, estimate_mbta_stops(dist))
+    for name, values in derived.items():
+        if name in columns:
+            sent = to_float(columns[name])
+            values = np.where(np.isnan(sent), values, sent)
+        columns[name] = values
+    return columns
+
+
+class StationStore:
+    """
+    Station attributes as one float64 matrix plus hash indexes on id and name.
+    The last row holds DEFAULT_FEATURES, so a failed lookup (-1) gathers defaults.
+    """
+
+    def __init__(self, station_ids, station_names, values, columns=FEATURE_COLUMNS):
+        self.columns = list(columns)
+        self.column_index = {name: j for j, name in enumerate(self.columns)}
+        self.ids = pd.Index(pd.Series(station_ids, dtype='string').fillna(''))
+        self.names = pd.Index(pd.Series(station_names, dtype='string').fillna('').str.strip().str.lower())
+        defaults = np.array([[DEFAULT_FEATURES[c] for c in self.columns]], dtype=np.float64)
+        self.values = np.vstack([np.asarray(values, dtype=np.float64).reshape(-1, len(self.columns)), defaults])
+
+    def __len__(self):
+        return len(self.values) - 1
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Build the store from a per-station DataFrame (station_id and/or
+        station_name plus any subset of FEATURE_COLUMNS).
+        """
+        df = derive_distance_features(df.rename(columns={k: v for k, v in COLUMN_ALIASES.items()
+                                                         if k in df.columns and v not in df.columns}))
+
+        values = np.empty((len(df), len(FEATURE_COLUMNS)), dtype=np.float64)
+        for j, name in enumerate(FEATURE_COLUMNS):
+            if name in df.columns:
+                column = pd.to_numeric(df[name], errors='coerce')
+                values[:, j] = column.fillna(DEFAULT_FEATURES[name]).to_numpy(dtype=np.float64)
+            else:
+                values[:, j] = DEFAULT_FEATURES[name]
+
+        ids = df['station_id'] if 'station_id' in df.columns else [''] * len(df)
+        names = df['station_name'] if 'station_name' in df.columns else [''] * len(df)
+        return cls(ids, names, values)
+
+    @classmethod
+    def load(cls, path=STATION_FEATURES_PATH):
+        """
+        Load a station table (.csv or .parquet). A missing file yields an
+        empty store that serves defaults only.
+        """
+        path = Path(path)
+        if not path.exists():
+            print(f"⚠ Warning: Station feature table not found at {path}, using defaults")
+            return cls([], [], np.empty((0, len(FEATURE_COLUMNS))))
+        if path.suffix == '.parquet':
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_csv(path, dtype={'station_id': 'string'})
+        store = cls.from_frame(df)
+        print(f"✓ Station feature store loaded: {len(store)} stations from {path}")
+        return store
+
+    def lookup(self, station_ids=None, station_names=None):
+        """
+        Row positions for the given keys; ids take priority, names fill the
+        gaps, unknown stations map to -1 (the defaults row).
+        """
+        rows = None
+        if station_ids is not None:
+            keys = pd.Series(station_ids, dtype='string').fillna('')
+            rows = np.where(keys == '', -1, self._indexer(self.ids, keys))
+        if station_names is not None:
+            keys = pd.Series(station_names, dtype='string').fillna('').str.strip().str.lower()
+            by_name = np.where(keys == '', -1, self._indexer(self.names, keys))
+            rows = by_name if rows is None else np.where(rows >= 0, rows, by_name)
+        return rows
+
+    def shared_arrays(self):
+        """
+        Arrays to place in a shared-memory segment (see shared_segment.py).
+        Keys are stored as fixed-width unicode so they can be memory-mapped.
+        """
+        return {
+            'values': self.values,
+            'ids': self.ids.to_numpy(dtype=str),
+            'names': self.names.to_numpy(dtype=str),
+        }
+
+    def attach_arrays(self, arrays):
+        """
+        Swap the feature matrix for a (read-only, mmap-backed) shared copy.
+        """
+        self.values = arrays['values']
+        self.ids = pd.Index(pd.Series(arrays['ids'], dtype='string'))
+        self.names = pd.Index(pd.Series(arrays['names'], dtype='string'))
+
+    @staticmethod
+    def _indexer(index, keys):
+        if index.is_unique:
+            return index.get_indexer(keys)
+        # Duplicate keys (e.g. blank ids, renamed stations): first occurrence wins
+        first = ~index.duplicated()
+        positions = np.flatnonzero(first)
+        found = index[first].get_indexer(keys)
+        return np.where(found >= 0, positions[found], -1)
+
+    def gather(self, rows, columns=None):
+        """
+        Gather feature columns for row positions in one fancy-indexing pass.
+
+        Returns:
+            dict: column name -> ndarray
+        """
+        columns = self.columns if columns is None else columns
+        block = self.values[np.asarray(rows)][:, [self.column_index[c] for c in columns]]
+        return {name: block[:, j] for j, name in enumerate(columns)}
+
+    def enrich(self, data):
+        """
+        Fill station attributes and time features a request did not send.
+
+        Rows are matched on `station_id` (then `station_name`); values the
+        client did send are kept. A row naming a station the store does not
+        know raises UnknownStation (rows without a station key are scored
+        from what they sent plus defaults). A `timestamp` column expands to
+        hour_of_day / day_of_week / month / is_weekend.
+
+        Args:
+            data: DataFrame or dict of equal-length arrays (columnar payload)
+
+        Returns:
+            same type as `data`, with the missing columns added
+        """
+        is_frame = isinstance(data, pd.DataFrame)
+        columns = {name: data[name].to_numpy() for name in data.columns} if is_frame else dict(data)
+        if not columns:
+            return data
+
+        if 'timestamp' in columns and 'hour_of_day' not in columns:
+            timestamps = pd.DatetimeIndex(pd.to_datetime(columns['timestamp']))
+            for name, values in time_features(timestamps).items():
+                columns.setdefault(name, values)
+
+        if 'station_id' in columns or 'station_name' in columns:
+            derive_distance_features(columns)
+            rows = self.lookup(columns.get('station_id'), columns.get('station_name'))
+            keys = [pd.Series(columns[name], dtype='string').fillna('').str.strip()
+                    for name in ('station_id', 'station_name') if name in columns]
+            unknown = (rows < 0) & np.any([(key != '').to_numpy() for key in keys], axis=0)
+            if unknown.any():
+                names = pd.unique(np.where(keys[0][unknown] != '', keys[0][unknown], keys[-1][unknown]))
+                raise UnknownStation(f"Unknown station(s): {', '.join(names[:5])}"
+                                     + (f" and {len(names) - 5} more" if len(names) > 5 else ""))
+            for name, values in self.gather(rows).items():
+                if name not in columns:
+                    columns[name] = values
+                else:
+                    sent = to_float(columns[name])
+                    columns[name] = np.where(np.isnan(sent), values, sent)
+
+        if is_frame:
+            return pd.DataFrame(columns, index=data.index)
+        return columns
+
+
+if __name__ == "__main__":
+    import time
+
+    print("Testing StationStore...")
+    print("=" * 60)
+    store = StationStore.load()
+
+    n = 100_000
+    rng = np.random.default_rng(0)
+    request = pd.DataFrame({
+        'station_name': rng.choice(list(store.names[:max(len(store), 1)]), n),
+        'timestamp': pd.Timestamp('2024-06-01') + pd.to_timedelta(rng.integers(0, 24 * 30, n), unit='h'),
+    })
+    t0 = time.perf_counter()
+    enriched = store.enrich(request)
+    elapsed = time.perf_counter() - t0
+    print(f"Enriched {n:,} rows in {elapsed * 1000:.1f} ms")
+    print(enriched.head())
+
+    try:
+        store.enrich({'station_id': np.array(['', 'NOPE']), 'hour_of_day': np.array([8, 8])})
+        raise AssertionError("unknown station_id was scored from defaults")
+    except UnknownStation as e:
+        print(f"✓ {e}")
+    blank = store.enrich({'station_id': np.array(['', None], dtype=object), 'dist_bus_m': np.array([40.0, 300.0])})
+    assert blank['mbta_stops_250m'].tolist() == [3.0, 0.0]
+    print("✓ Test successful!")
@@ -0,0 +1,104 @@
+"""
+Streaming response mode for /predict
+Scores input in fixed-size chunks and yields NDJSON or CSV as it goes,
+so large requests never materialize the full result in memory
+"""
+import json
+import os
+from itertools import islice
+
+import pandas as pd
+
+
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 2000))
+
+# Accept header -> stream format (application/json keeps the buffered response)
+STREAM_MIMETYPES = {
+    'application/x-ndjson': 'ndjson',
+    'text/csv': 'csv',
+}
+CSV_HEADER = "index,arrivals,departures\n"
+
+
+def negotiate(accept_mimetypes):
+    """
+    Pick a stream format from the request's Accept header.
+    Returns None unless the client explicitly prefers NDJSON or CSV.
+    """
+    best = accept_mimetypes.best_match(['application/json'] + list(STREAM_MIMETYPES))
+    return STREAM_MIMETYPES.get(best)
+
+
+def iter_request_rows(request):
+    """
+    Yield input rows one at a time.
+    NDJSON request bodies are read line by line from the socket; JSON
+    bodies (a list or a single object) are parsed as usual.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        for line in request.stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+        return
+
+    data = request.get_json()
+    if not data:
+        raise ValueError("No data")
+    yield from (data if isinstance(data, list) else [data])
+
+
+def iter_chunks(rows, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Group an iterable of row dicts into lists of at most `chunk_size`.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_predictions(model, rows, fmt, chunk_size=STREAM_CHUNK_SIZE, enrich=None, cache=None):
+    """
+    Generator that scores `rows` chunk by chunk and yields encoded output
+
+    Args:
+        model: predictor exposing predict(DataFrame)
+        rows: iterable of input dicts
+        fmt: 'ndjson' or 'csv'
+        chunk_size: rows per model call
+        enrich: optional callable applied to each chunk DataFrame before scoring
+        cache: optional PredictionCache consulted before the model
+    """
+    if fmt == 'csv':
+        yield CSV_HEADER
+
+    index = 0
+    try:
+        for chunk in iter_chunks(rows, chunk_size):
+            frame = pd.DataFrame(chunk)
+            if enrich is not None:
+                frame = enrich(frame)
+            result = cache.predict(model, frame) if cache is not None else model.predict(frame)
+            lines = []
+            for arrivals, departures in zip(result['arrivals'], result['departures']):
+                if fmt == 'csv':
+                    lines.append(f"{index},{int(arrivals)},{int(departures)}\n")
+                else:
+                    lines.append(json.dumps({
+                        'index': index,
+                        'arrivals': int(arrivals),
+                        'departures': int(departures)
+                    }) + "\n")
+                index += 1
+            yield "".join(lines)
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        import traceback
+        print(traceback.format_exc())
+        if fmt == 'ndjson':
+            yield json.dumps({'error': str(e), 'index': index}) + "\n"
+        else:
+            yield f"# error at row {index}: {e}\n"
@@ -0,0 +1,370 @@
+"""
+Weather feature store
+Loads every YYYYMM-weather.csv once into one sorted array of record start
+times (int64 ns) and a (records x 2) matrix of [precipitation, avg_temp].
+Record i covers [start_i, start_i + resolution): one day for the `date`
+files, one hour for files with a `timestamp` column. A batch of timestamps
+is joined with a single np.searchsorted, for any grid (request rows, a
+forecast horizon, or a training panel). When every start lies on the
+resolution grid (whole days / hours) the search becomes an integer divide
+into a dense record index.
+
+Timestamps no observation covers go to an optional forecast provider: any
+object with `lookup(timestamps) -> (n, 2)` (NaN = unknown).
+FileForecastProvider is the local stand-in; it re-reads its file when the
+file changes. Rows neither source covers get the observed mean of their
+calendar month.
+"""
+import glob
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+WEATHER_PATHS = os.getenv(
+    'WEATHER_PATHS', '../data/2023_data/Weather/*-weather.csv,../data/2024_data/Weather/*-weather.csv')
+WEATHER_FORECAST_PATH = os.getenv('WEATHER_FORECAST_PATH', '')
+WEATHER_FORECAST_CHECK_SECONDS = float(os.getenv('WEATHER_FORECAST_CHECK_SECONDS', 60))
+# Timezone the weather dates are local to; tz-aware request timestamps are converted to it
+WEATHER_TZ = os.getenv('WEATHER_TZ', 'America/New_York')
+
+WEATHER_COLUMNS = ('precipitation', 'avg_temp')
+# Used only when neither observations nor a forecast know anything
+# (same defaults ZINBPredictor._transform_features assumes)
+WEATHER_DEFAULTS = {'precipitation': 0.0, 'avg_temp': 20.0}
+# Client spellings ZINBPredictor._transform_features also accepts
+WEATHER_ALIASES = {'precipitation': 'rainfall', 'avg_temp': 'temperature'}
+
+NS_PER_HOUR = 3_600_000_000_000
+NS_PER_DAY = 24 * NS_PER_HOUR
+NAT = np.iinfo(np.int64).min
+# Largest span (in records) indexed densely; longer or irregular tables use searchsorted
+MAX_DENSE_RECORDS = 10_000_000
+
+
+def expand_paths(paths):
+    """
+    Comma-separated string or list of paths / glob patterns -> sorted file list.
+    """
+    if isinstance(paths, str):
+        paths = [p.strip() for p in paths.split(',') if p.strip()]
+    found = []
+    for pattern in paths:
+        found.extend(sorted(glob.glob(str(pattern))) or ([str(pattern)] if os.path.exists(pattern) else []))
+    return found
+
+
+def to_ns(timestamps, tz=WEATHER_TZ):
+    """
+    Timestamps (strings, datetimes, datetime64, or int64 ns as returned here)
+    -> int64 ns of local wall time (NAT for missing).
+    """
+    values = timestamps if isinstance(timestamps, (pd.Series, pd.Index)) else np.asarray(timestamps)
+    if values.dtype.kind == 'i':
+        return np.asarray(values, dtype=np.int64)
+    if values.dtype.kind == 'M' and getattr(values.dtype, 'tz', None) is None:
+        return np.asarray(values, dtype='datetime64[ns]').view(np.int64)
+    index = pd.DatetimeIndex(pd.to_datetime(values, format='mixed', errors='coerce'))
+    if index.tz is not None:
+        index = index.tz_convert(tz).tz_localize(None)
+    return index.to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+def clean_weather(df):
+    """
+    One raw weather frame -> (starts int64 ns, values (n, 2), resolution ns).
+    Trace precipitation ('T') counts as 0.0, as in transform_weather_data.
+    """
+    df = df.rename(columns=lambda c: str(c).strip())
+    if 'timestamp' in df.columns:
+        times, resolution = df['timestamp'], NS_PER_HOUR
+    elif 'date' in df.columns:
+        times, resolution = df['date'], NS_PER_DAY
+    else:
+        raise ValueError("Weather data needs a 'date' or 'timestamp' column")
+    starts = pd.to_datetime(times, errors='coerce').to_numpy(dtype='datetime64[ns]').view(np.int64)
+    values = np.column_stack([
+        pd.to_numeric(df['precipitation'].replace('T', '0.0'), errors='coerce') if 'precipitation' in df
+        else np.full(len(df), np.nan),
+        pd.to_numeric(df['avg_temp'], errors='coerce') if 'avg_temp' in df else np.full(len(df), np.nan),
+    ]).astype(np.float64)
+    keep = starts != NAT
+    return starts[keep], values[keep], resolution
+
+
+class WeatherTable:
+    """
+    Sorted weather records of one resolution, answering batched lookups
+    """
+
+    def __init__(self, starts, values, resolution=NS_PER_DAY):
+        """
+        Args:
+            starts: int64 ns start of each record (any order; first of duplicates wins)
+            values: (n, 2) [precipitation, avg_temp]
+            resolution: record length in ns
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(starts), len(WEATHER_COLUMNS))
+        order = np.argsort(starts, kind='stable')
+        starts, values = starts[order], values[order]
+        first = np.concatenate([[True], starts[1:] != starts[:-1]]) if len(starts) else np.zeros(0, dtype=bool)
+        self.starts = starts[first]
+        self.values = values[first]
+        self.resolution = int(resolution)
+        # Lookups gather from values plus a trailing NaN row that uncovered times point at
+        self._padded = np.vstack([self.values, np.full((1, len(WEATHER_COLUMNS)), np.nan)])
+
+        # Dense index: record of each resolution step from the first start (-1 = gap)
+        self._dense = None
+        if len(self.starts):
+            offsets = self.starts - self.starts[0]
+            if not (offsets % self.resolution).any() and offsets[-1] // self.resolution < MAX_DENSE_RECORDS:
+                self._dense = np.full(offsets[-1] // self.resolution + 1, -1, dtype=np.int64)
+                self._dense[offsets // self.resolution] = np.arange(len(self.starts))
+
+    @classmethod
+    def from_frames(cls, frames):
+        """
+        Build a table from raw weather frames (all daily or all hourly).
+        """
+        parts = [clean_weather(df) for df in frames]
+        resolutions = {resolution for _, _, resolution in parts}
+        if len(resolutions) > 1:
+            raise ValueError("Cannot mix daily and hourly weather in one table")
+        if not parts:
+            return cls(np.zeros(0, dtype=np.int64), np.zeros((0, len(WEATHER_COLUMNS))))
+        return cls(np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]),
+                   resolutions.pop())
+
+    @classmethod
+    def load(cls, paths=WEATHER_PATHS):
+        """
+        Load weather CSVs (comma-separated paths or globs). Unreadable files are skipped.
+        """
+        frames = []
+        for path in expand_paths(paths):
+            try:
+                frames.append(pd.read_csv(path, skipinitialspace=True))
+            except Exception as e:
+                print(f"⚠ Warning: Could not read weather file {path}: {e}")
+        return cls.from_frames(frames)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def coverage(self):
+        """
+        (first start, last end) as Timestamps, or None when empty.
+        """
+        if not len(self):
+            return None
+        return pd.Timestamp(self.starts[0]), pd.Timestamp(self.starts[-1] + self.resolution)
+
+    def lookup(self, timestamps):
+        """
+        Weather for each timestamp.
+
+        Returns:
+            ndarray: (n, 2) [precipitation, avg_temp], NaN where no record covers the time
+        """
+        t = to_ns(timestamps)
+        if not len(self):
+            return np.full((len(t), len(WEATHER_COLUMNS)), np.nan)
+        if self._dense is not None:
+            steps = np.floor_divide(t - self.starts[0], self.resolution)
+            covered = (steps >= 0) & (steps < len(self._dense)) & (t != NAT)
+            i = self._dense[np.where(covered, steps, 0)]
+            covered &= i >= 0
+        else:
+            i = np.searchsorted(self.starts, t, side='right') - 1
+            covered = (i >= 0) & (t != NAT)
+            i = np.maximum(i, 0)
+            covered &= t < self.starts[i] + self.resolution
+        return np.take(self._padded, np.where(covered, i, len(self.starts)), axis=0)
+
+    def monthly_means(self):
+        """
+        (12, 2) mean weather per calendar month (NaN for months without data).
+        """
+        means = np.full((12, len(WEATHER_COLUMNS)), np.nan)
+        if len(self):
+            months = pd.DatetimeIndex(self.starts).month.to_numpy() - 1
+            for j in range(len(WEATHER_COLUMNS)):
+                valid = ~np.isnan(self.values[:, j])
+                totals = np.bincount(months[valid], weights=self.values[valid, j], minlength=12)
+                counts = np.bincount(months[valid], minlength=12)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    means[:, j] = np.where(counts > 0, totals / counts, np.nan)
+        return means
+
+
+class FileForecastProvider:
+    """
+    Forecast provider backed by a local weather file (daily `date` or hourly
+    `timestamp` rows), reloaded when the file's mtime changes. Stand-in for a
+    real forecast API client with the same `lookup` method.
+    """
+
+    def __init__(self, path, check_interval=WEATHER_FORECAST_CHECK_SECONDS):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked = 0.0
+        self.table = WeatherTable.from_frames([])
+        self._refresh(force=True)
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                return
+            if mtime != self._mtime:
+                self.table = WeatherTable.load([self.path])
+                self._mtime = mtime
+
+    def lookup(self, timestamps):
+        self._refresh()
+        return self.table.lookup(timestamps)
+
+
+class WeatherStore:
+    """
+    Observed weather plus an optional forecast provider, with calendar-month fallback
+    """
+
+    def __init__(self, observations, forecast=None):
+        self.observations = observations
+        self.forecast = forecast
+        self._monthly = observations.monthly_means()
+
+    @classmethod
+    def load(cls, paths=WEATHER_PATHS, forecast_path=WEATHER_FORECAST_PATH):
+        forecast = FileForecastProvider(forecast_path) if forecast_path else None
+        return cls(WeatherTable.load(paths), forecast)
+
+    def __len__(self):
+        return len(self.observations)
+
+    def lookup(self, timestamps):
+        """
+        Weather for each timestamp: observations, then the forecast, then the
+        observed calendar-month mean.
+
+        Returns:
+            dict: column -> float64 array (NaN only when nothing is known)
+        """
+        t = to_ns(timestamps)
+        values = self.observations.lookup(t)
+        missing = np.isnan(values).any(axis=1)
+        if self.forecast is not None and missing.any():
+            forecast = self.forecast.lookup(t[missing])
+            values[missing] = np.where(np.isnan(values[missing]), forecast, values[missing])
+            missing = np.isnan(values).any(axis=1)
+        if missing.any():
+            valid = missing & (t != NAT)
+            months = pd.DatetimeIndex(t[valid]).month.to_numpy() - 1
+            values[valid] = np.where(np.isnan(values[valid]), self._monthly[months], values[valid])
+        return {name: values[:, j] for j, name in enumerate(WEATHER_COLUMNS)}
+
+    def enrich(self, data):
+        """
+        Fill precipitation / avg_temp from a `timestamp` column. Values the
+        client sent, under either name or its alias (rainfall / temperature),
+        are kept; rows nothing is known about get WEATHER_DEFAULTS.
+
+        Args:
+            data: DataFrame or dict of equal-length arrays (columnar payload)
+
+        Returns:
+            same type as `data`, with the weather columns added
+        """
+        is_frame = isinstance(data, pd.DataFrame)
+        if 'timestamp' not in data or (not len(self) and self.forecast is None):
+            return data
+        columns = {name: data[name].to_numpy() for name in data.columns} if is_frame else dict(data)
+
+        for name, values in self.lookup(columns['timestamp']).items():
+            values = np.where(np.isnan(values), WEATHER_DEFAULTS[name], values)
+            # The canonical name wins over the alias when a row has both
+            for source in (WEATHER_ALIASES[name], name):
+                if source in columns:
+                    sent = pd.to_numeric(pd.Series(columns[source]), errors='coerce').to_numpy(dtype=np.float64)
+                    values = np.where(np.isnan(sent), values, sent)
+            columns[name] = values
+
+        if is_frame:
+            return pd.DataFrame(columns, index=data.index)
+        return columns
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    print("Testing WeatherStore...")
+    print("=" * 60)
+    rng = np.random.default_rng(0)
+    days = pd.date_range('2024-01-01', '2024-08-31', freq='D')
+    daily = pd.DataFrame({
+        'date': days.strftime('%Y-%m-%d'),
+        'precipitation': np.where(rng.random(len(days)) < 0.1, 'T', rng.exponential(0.1, len(days)).round(2)),
+        'avg_temp': rng.normal(55, 15, len(days)).round(1),
+    })
+    with tempfile.TemporaryDirectory() as tmp:
+        for month, part in daily.groupby(days.strftime('%Y%m')):
+            part.to_csv(os.path.join(tmp, f"{month}-weather.csv"), index=False)
+        forecast_path = os.path.join(tmp, 'forecast.csv')
+        hours = pd.date_range('2024-09-01', periods=48, freq='h')
+        pd.DataFrame({'timestamp': hours.astype(str), 'precipitation': 0.3, 'avg_temp': 61.0}).to_csv(
+            forecast_path, index=False)
+        store = WeatherStore.load(os.path.join(tmp, '*-weather.csv'), forecast_path)
+    print(f"  {len(store)} daily records, coverage {store.observations.coverage}")
+
+    # Reference: the notebooks' merge on the calendar date
+    reference = daily.assign(date=pd.to_datetime(daily['date']),
+                             precipitation=pd.to_numeric(daily['precipitation'].replace('T', '0.0')))
+    grid = pd.date_range('2024-01-01', '2024-08-31 23:00', freq='h')
+    merged = pd.DataFrame({'date': grid.normalize()}).merge(reference, on='date', how='left')
+    looked = store.lookup(grid)
+    for name in WEATHER_COLUMNS:
+        assert np.allclose(looked[name], merged[name].to_numpy(dtype=np.float64))
+    print("  ✓ hourly lookups match a per-date merge")
+
+    future = store.lookup(pd.DatetimeIndex(['2024-09-01 05:00', '2024-12-25 12:00']))
+    assert future['avg_temp'][0] == 61.0                                   # forecast file
+    assert np.isnan(future['avg_temp'][1])                                 # no December data at all
+    utc = store.lookup(pd.DatetimeIndex(['2024-05-02 03:00']).tz_localize('UTC'))
+    assert utc['avg_temp'][0] == reference['avg_temp'][reference['date'] == '2024-05-01'].item()  # 23:00 EDT
+    request = store.enrich({'timestamp': np.array(['2024-03-05T08:00', '2024-12-25T08:00']),
+                            'precipitation': np.array([np.nan, 1.5])})
+    assert request['precipitation'][1] == 1.5 and request['avg_temp'][1] == WEATHER_DEFAULTS['avg_temp']
+    aliased = store.enrich(pd.DataFrame({'timestamp': ['2024-03-05T08:00'] * 2, 'temperature': [-3.0, np.nan],
+                                         'rainfall': [2.0, 2.0], 'precipitation': [np.nan, 0.5]}))
+    assert aliased['avg_temp'].tolist() == [-3.0, store.lookup(pd.DatetimeIndex(['2024-03-05 08:00']))['avg_temp'][0]]
+    assert aliased['precipitation'].tolist() == [2.0, 0.5]
+    print("  ✓ forecast, timezone and default fallbacks")
+
+    n = 1_000_000
+    timestamps = pd.Timestamp('2024-01-01').value + rng.integers(0, len(days) * NS_PER_DAY, n)
+    t0 = time.perf_counter()
+    store.lookup(timestamps.view('datetime64[ns]'))
+    t_lookup = time.perf_counter() - t0
+    frame = pd.DataFrame({'date': pd.DatetimeIndex(timestamps).normalize()})
+    t0 = time.perf_counter()
+    frame.merge(reference, on='date', how='left')
+    t_merge = time.perf_counter() - t0
+    print(f"\n{n:,} timestamps:")
+    print(f"  pandas merge on date: {t_merge * 1000:7.1f} ms")
+    print(f"  WeatherStore.lookup:  {t_lookup * 1000:7.1f} ms")
+    print("=" * 60)
+    print("✓ Weather store test successful!")
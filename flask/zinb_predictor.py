@@ -2,12 +2,37 @@
 ZINB (Zero-Inflated Negative Binomial) Model Predictor
 实现特征选择、标准化和预测功能
 """
+import hashlib
 import pickle
 import numpy as np
 import pandas as pd
 from pathlib import Path
-import statsmodels.api as sm
-from sklearn.preprocessing import StandardScaler
+
+# statsmodels / sklearn 只在加载 pickle 或校验时才需要，延迟导入以加快冷启动
+from count_distribution import DEFAULT_QUANTILES, DISTRIBUTION_MAX_COUNT, summarize
+from station_store import estimate_mbta_stops
+from zinb_scorer import ZINBScorer
+
+
+# Negative Binomial features (7 features)
+NB_FEATURES = [
+    "month",
+    "start_hour",
+    "end_hour",
+    "subway_distance_m",
+    "mbta_stops_250m",
+    "last_day_in",
+    "last_day_out"
+]
+
+# Inflation features (5 features)
+INFL_FEATURES = [
+    "is_night",
+    "precipitation",
+    "avg_temp",
+    "last_day_in",
+    "last_day_out"
+]
 
 
 class ZINBPredictor:
@@ -29,7 +54,10 @@ class ZINBPredictor:
         
         print(f"Loading ZINB models from {self.model_path}...")
         with open(self.model_path, 'rb') as f:
-            model_dict = pickle.load(f)
+            raw = f.read()
+        model_dict = pickle.loads(raw)
+        # 模型版本：文件内容哈希，用于预测缓存的命名空间
+        self.model_version = f"zinb-{hashlib.sha256(raw).hexdigest()[:12]}"
         
         # 打印模型文件中的所有键，用于调试
         print(f"Available keys in model file: {list(model_dict.keys())}")
@@ -63,6 +91,8 @@ class ZINBPredictor:
             raise ValueError("IN model not found in model file. Available keys: " + str(list(model_dict.keys())))
         
         # ===== 修改验证逻辑：添加警告而不是抛出错误 =====
+        if self.scaler_nb is None or self.scaler_infl is None:
+            from sklearn.preprocessing import StandardScaler
         if self.scaler_nb is None:
             print("⚠ Warning: NB scaler not found, creating default scaler")
             self.scaler_nb = StandardScaler()
@@ -92,25 +122,15 @@ class ZINBPredictor:
                 print(f"✓ Inflation scaler is fitted (mean shape: {self.scaler_infl.mean_.shape})")
         
         # 定义特征列表
-        # Negative Binomial features (7 features)
-        self.nb_features = [
-            "month",
-            "start_hour",
-            "end_hour",
-            "subway_distance_m",
-            "mbta_stops_250m",
-            "last_day_in",
-            "last_day_out"
-        ]
-        
-        # Inflation features (5 features)
-        self.infl_features = [
-            "is_night",
-            "precipitation",
-            "avg_temp",
-            "last_day_in",
-            "last_day_out"
-        ]
+        self.nb_features = list(NB_FEATURES)
+        self.infl_features = list(INFL_FEATURES)
+        
+        # 预先提取系数和 scaler 统计量，预测时不再调用 statsmodels
+        self.scorer = ZINBScorer.from_statsmodels(
+            self.model_in, self.model_out,
+            self.scaler_nb, self.scaler_infl,
+            self.nb_features, self.infl_features
+        )
         
         print(f"✓ ZINB models loaded successfully!")
         print(f"  - OUT model: {type(self.model_out).__name__ if self.model_out else 'None'}")
@@ -120,6 +140,26 @@ class ZINBPredictor:
         print(f"  - NB features: {self.nb_features}")
         print(f"  - Infl features: {self.infl_features}")
     
+    @classmethod
+    def from_scorer(cls, scorer, model_version, nb_features=NB_FEATURES, infl_features=INFL_FEATURES):
+        """
+        精简路径：只用预先提取的系数构建预测器，不反序列化 statsmodels 结果
+        （因此没有 _predict_statsmodels_mean 参考实现），见 model_artifact.load_zinb
+        
+        Args:
+            scorer: ZINBScorer
+            model_version: 预测缓存命名空间
+        """
+        predictor = cls.__new__(cls)
+        predictor.model_path = None
+        predictor.model_in = predictor.model_out = None
+        predictor.scaler_nb = predictor.scaler_infl = None
+        predictor.nb_features = list(nb_features)
+        predictor.infl_features = list(infl_features)
+        predictor.scorer = scorer
+        predictor.model_version = model_version
+        return predictor
+    
     def _transform_features(self, df):
         """
         将前端发送的特征转换为 ZINB 模型需要的特征格式
@@ -145,14 +185,11 @@ class ZINBPredictor:
         if 'subway_distance_m' not in df_transformed.columns and 'dist_subway_m' in df_transformed.columns:
             df_transformed['subway_distance_m'] = df_transformed['dist_subway_m']
         
-        # mbta_stops_250m: 如果没有，使用默认值或基于 dist_bus_m 估算
+        # mbta_stops_250m: 如果没有（且站点特征表未提供），基于 dist_bus_m 估算
         if 'mbta_stops_250m' not in df_transformed.columns:
-            # 基于距离估算：距离越近，站点越多
             if 'dist_bus_m' in df_transformed.columns:
                 # 简单的启发式：距离 < 50m = 3个站点, < 100m = 2个, < 200m = 1个, >= 200m = 0个
-                df_transformed['mbta_stops_250m'] = df_transformed['dist_bus_m'].apply(
-                    lambda x: 3 if x < 50 else (2 if x < 100 else (1 if x < 200 else 0))
-                )
+                df_transformed['mbta_stops_250m'] = estimate_mbta_stops(df_transformed['dist_bus_m'])
             else:
                 df_transformed['mbta_stops_250m'] = 1  # 默认值
         
@@ -269,11 +306,50 @@ class ZINBPredictor:
         # 添加常数项
         # X_train_const = sm.add_constant(X_train_nb_scaled) → 8 features (const + 7)
         # X_train_infl = sm.add_constant(X_train_infl_scaled) → 6 features (const + 5)
+        import statsmodels.api as sm
         nb_with_const = sm.add_constant(nb_scaled, has_constant='add')
         infl_with_const = sm.add_constant(infl_scaled, has_constant='add')
         
         return nb_with_const, infl_with_const
     
+    def _predict_statsmodels_mean(self, df):
+        """
+        参考实现：通过 statsmodels predict(which='mean') 计算期望值，
+        用于校验 ZINBScorer 的闭式结果
+        
+        Args:
+            df: 输入 DataFrame
+            
+        Returns:
+            ndarray: (n, 2)，第 0 列为 IN，第 1 列为 OUT
+        """
+        nb_features_df, infl_features_df = self._extract_features(df)
+        nb_scaled, infl_scaled = self._normalize_features(nb_features_df, infl_features_df)
+        nb_with_const, infl_with_const = self._add_constants(nb_scaled, infl_scaled)
+        
+        predictions = []
+        for results in (self.model_in, self.model_out):
+            pred = results.predict(exog=nb_with_const, exog_infl=infl_with_const, which='mean')
+            predictions.append(np.asarray(pred, dtype=np.float64).flatten())
+        return np.column_stack(predictions)
+    
+    def model_inputs(self, df):
+        """
+        转换特征并只保留模型实际读取的列（scorer 的特征顺序），
+        同时作为预测缓存的键
+        
+        Args:
+            df: 输入 DataFrame
+            
+        Returns:
+            DataFrame: 模型输入列
+        """
+        df_transformed = self._transform_features(df)
+        missing_features = set(self.scorer.feature_names) - set(df_transformed.columns)
+        if missing_features:
+            raise ValueError(f"Missing required features after transformation: {missing_features}")
+        return df_transformed[self.scorer.feature_names]
+    
     def predict(self, input_data):
         """
         使用 ZINB 模型进行预测
@@ -292,66 +368,23 @@ class ZINBPredictor:
         else:
             df = input_data.copy()
         
-        # 1. 提取特征
-        nb_features_df, infl_features_df = self._extract_features(df)
-        
-        # 2. 处理特征（当前使用原始特征，不进行标准化）
-        nb_scaled, infl_scaled = self._normalize_features(nb_features_df, infl_features_df)
-        
-        # 3. 添加常数项
-        nb_with_const, infl_with_const = self._add_constants(nb_scaled, infl_scaled)
+        # 1. 转换特征
+        inputs = self.model_inputs(df)
         
-        # 4. 预测
+        # 2. 闭式计算 (1 - π) * μ，IN 和 OUT 一次完成
         try:
-            # Model 1 (OUT): ZeroInflatedNegativeBinomialP
-            if self.model_out is not None:
-                predictions_out = self.model_out.predict(
-                    exog=nb_with_const,
-                    exog_infl=infl_with_const,
-                    which='mean'
-                )
-            else:
-                predictions_out = np.zeros(len(df))
-            
-            # Model 2 (IN): ZeroInflatedNegativeBinomialP
-            if self.model_in is not None:
-                predictions_in = self.model_in.predict(
-                    exog=nb_with_const,
-                    exog_infl=infl_with_const,
-                    which='mean'
-                )
-            else:
-                predictions_in = np.zeros(len(df))
-            
-            # 转换为 numpy 数组
-            if hasattr(predictions_out, 'values'):
-                predictions_out = predictions_out.values
-            if hasattr(predictions_in, 'values'):
-                predictions_in = predictions_in.values
-            
-            # 确保是 numpy 数组
-            predictions_out = np.array(predictions_out).flatten()
-            predictions_in = np.array(predictions_in).flatten()
-            
-            # 裁剪到合理范围并取整
-            predictions_out = np.clip(predictions_out, 0, 100)
-            predictions_in = np.clip(predictions_in, 0, 100)
-            
-            predictions_out = np.round(predictions_out).astype(int)
-            predictions_in = np.round(predictions_in).astype(int)
-            
-            # 确保非负
-            predictions_out = np.maximum(predictions_out, 0)
-            predictions_in = np.maximum(predictions_in, 0)
-            
+            scores = self.scorer.score_frame(inputs)
         except Exception as e:
             print(f"Error during prediction: {e}")
-            print(f"NB features shape: {nb_with_const.shape}")
-            print(f"Infl features shape: {infl_with_const.shape}")
             import traceback
             traceback.print_exc()
             raise
         
+        # 裁剪到合理范围并取整
+        scores = np.round(np.clip(scores, 0, 100)).astype(int)
+        predictions_in = scores[:, 0]
+        predictions_out = scores[:, 1]
+        
         # 返回预测结果
         # OUT = departures (离开/出发)
         # IN = arrivals (到达/到达)
@@ -360,6 +393,47 @@ class ZINBPredictor:
             'departures': predictions_out.tolist()
         }
 
+    
+    def count_params(self, input_data):
+        """
+        每行 IN / OUT 的 ZINB 参数（分布输出与库存模拟共用）
+        
+        Args:
+            input_data: DataFrame, dict 或 list，包含所需特征
+            
+        Returns:
+            tuple: (mu (n, 2), pi (n, 2), alpha (2,))，列 0 = IN，1 = OUT
+        """
+        if isinstance(input_data, dict):
+            df = pd.DataFrame([input_data])
+        elif isinstance(input_data, list):
+            df = pd.DataFrame(input_data)
+        else:
+            df = input_data.copy()
+        
+        X = self.scorer.design_matrix(self.model_inputs(df))
+        mu, pi = self.scorer.components(X)
+        return mu, pi, np.asarray(self.scorer.alpha, dtype=np.float64)
+    
+    def predict_distribution(self, input_data, quantiles=DEFAULT_QUANTILES, at_least=(),
+                             max_count=DISTRIBUTION_MAX_COUNT, include_pmf=False):
+        """
+        完整的 ZINB 预测分布：结构零概率 π、NB 均值 μ 与离散度 α、
+        分位数、P(Y >= k)，以及可选的 0..max_count 概率质量函数。
+        整个批次闭式计算（见 count_distribution），不逐行调用 scipy
+        
+        Args:
+            input_data: DataFrame, dict 或 list，包含所需特征
+            quantiles: 分位数概率
+            at_least: 计算 P(Y >= k) 的 k
+            max_count: PMF 截断上限
+            include_pmf: 是否返回完整 PMF
+            
+        Returns:
+            dict: {'arrivals': {...}, 'departures': {...}}
+        """
+        return summarize(*self.count_params(input_data), quantiles=quantiles, at_least=at_least,
+                         max_count=max_count, include_pmf=include_pmf)
 
 if __name__ == "__main__":
     # 测试 ZINB 预测器
@@ -391,6 +465,11 @@ if __name__ == "__main__":
         print(f"Arrivals (IN): {result['arrivals'][0]}")
         print(f"Departures (OUT): {result['departures'][0]}")
         
+        # 校验闭式 scorer 与 statsmodels 结果一致
+        from zinb_scorer import check_parity
+        diff = check_parity(predictor, pd.DataFrame([test_data]))
+        print(f"Scorer parity (max abs diff): {diff:.3e}")
+        
         print("\n" + "=" * 60)
         print("✓ Test successful!")
         print("=" * 60)
@@ -1,6 +1,12 @@
+import sys
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from geo_features import PointIndex, haversine_m
+
 # 读取两个文件
 feature_df = pd.read_csv('data/feature.csv', keep_default_na=False)
 station_features_df = pd.read_csv('data/2024_data/station_features_2024.csv')
@@ -10,11 +16,16 @@ print(f'station_features_2024.csv 有 {len(station_features_df)} 行')
 
 # 预处理：创建站名索引以提高匹配效率
 name_index = {}
-for idx, station_row in station_features_df.iterrows():
-    station_name = str(station_row['station_name']).strip().lower()
-    if station_name not in name_index:
-        name_index[station_name] = []
-    name_index[station_name].append(idx)
+for idx, station_name in enumerate(station_features_df['station_name'].astype(str).str.strip().str.lower()):
+    name_index.setdefault(station_name, []).append(idx)
+
+# 经纬度空间索引（haversine BallTree），只建一次
+station_index = PointIndex(station_features_df, lat_col='lat', lon_col='lng')
+station_lat = station_features_df['lat'].to_numpy(dtype=float)
+station_lng = station_features_df['lng'].to_numpy(dtype=float)
+
+# 经纬度匹配的距离阈值（米），约等于原来的 0.001 度
+MAX_MATCH_DISTANCE_M = 111
 
 # 匹配函数：通过站名和经纬度
 def find_match(row):
@@ -25,44 +36,21 @@ def find_match(row):
     
     # 第一步：优先精确匹配站名
     if name_lower in name_index:
-        # 如果有多个同名站点，选择经纬度最近的
+        # 如果有多个同名站点，选择距离最近的
         candidates = name_index[name_lower]
         if len(candidates) == 1:
             return candidates[0]
-        else:
-            # 多个同名站点，选择经纬度最近的
-            best_idx = None
-            min_distance = float('inf')
-            for idx in candidates:
-                station_row = station_features_df.iloc[idx]
-                station_lat = float(station_row['lat'])
-                station_lng = float(station_row['lng'])
-                lat_diff = abs(station_lat - lat)
-                lng_diff = abs(station_lng - lng)
-                distance = np.sqrt(lat_diff**2 + lng_diff**2)
-                if distance < min_distance:
-                    min_distance = distance
-                    best_idx = idx
-            return best_idx
-    
-    # 第二步：如果站名不匹配，通过经纬度匹配（距离阈值约0.001度，约111米）
-    best_match = None
-    min_distance = float('inf')
-    
-    for idx, station_row in station_features_df.iterrows():
-        station_lat = float(station_row['lat'])
-        station_lng = float(station_row['lng'])
-        
-        # 计算经纬度距离（度）
-        lat_diff = abs(station_lat - lat)
-        lng_diff = abs(station_lng - lng)
-        distance = np.sqrt(lat_diff**2 + lng_diff**2)
-        
-        if distance < min_distance and distance < 0.001:
-            min_distance = distance
-            best_match = idx
+        distances = haversine_m(lat, lng, station_lat[candidates], station_lng[candidates])
+        return candidates[int(np.argmin(distances))]
     
-    return best_match
+    # 第二步：如果站名不匹配，通过经纬度匹配最近的站点（阈值约111米）
+    if np.isnan(lat) or np.isnan(lng) or len(station_index) == 0:
+        return None
+    distances, positions = station_index.nearest([lat], [lng], k=1)
+    if distances[0, 0] >= MAX_MATCH_DISTANCE_M:
+        return None
+    # PointIndex 会跳过缺失坐标的行，换算回 station_features_df 的位置
+    return int(station_index.positions[positions[0, 0]])
 
 # 更新数据
 print('\n开始匹配和更新数据...')
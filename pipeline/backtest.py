@@ -0,0 +1,352 @@
+"""
+Rolling-origin backtests over the training panel
+
+The notebooks score models with train_test_split(..., random_state=42), which
+trains on hours that come after the hours it tests on and yields a single
+number. This module replays monthly retraining instead:
+
+    fold k: train on the months before M_k (expanding, or the last
+            --train-months), test on every hour of M_k
+
+and reports MAE / RMSE overall, per fold, per station, per hour of day and per
+horizon (days since the fold's origin, i.e. how accuracy decays as the model
+ages between monthly refits). Lag features (last_day_*) are the observed
+counts 24 hours earlier, as at serving time.
+
+Each fold's standardized design (all numeric panel columns, scaled with the
+fold's training statistics) is cached under --cache-dir keyed on the manifest
+digests of the months it covers, so trying another model or feature set reuses
+every fold. Folds x models run in parallel in a spawn process pool that
+memory-maps the cached arrays.
+
+Models:
+    zinb    ZINB on NB_FEATURES / INFL_FEATURES (or --nb-features / --infl-features)
+    nb      NB GLM on NB_GLM_FEATURES with --alpha
+    naive   same hour yesterday (last_day_in / last_day_out)
+
+Usage:
+    python pipeline/backtest.py --state-dir data/training --models zinb,nb,naive --folds 12 \
+        -o data/backtest.csv
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "flask"))
+from bike_time import NS_PER_HOUR
+from train_incremental import (DEFAULT_STATE_DIR, DEFAULT_TOP_STATIONS, INFL_FEATURES, MAXITER, NB_FEATURES,
+                               NB_GLM_FEATURES, TrainingState, load_panel, select_stations, zinb_mean)
+from trip_ingest import write_frame
+
+
+DEFAULT_CACHE_DIR = Path("data/backtest_cache")
+FOLD_CACHE_VERSION = 2   # 2: top stations chosen from the fold's training months
+MODELS = ("zinb", "nb", "naive")
+HEADS = ("in", "out")
+DEFAULT_ALPHA = 1e-4    # nb_with_boosting.ipynb
+BREAKDOWNS = ("fold", "station_id", "hour_of_day", "horizon_day")
+
+# Not model inputs
+META_COLUMNS = ("in", "out", "year_month", "epoch_hour", "station_id")
+
+
+def plan_folds(months, n_folds=12, train_months=0, min_train_months=1):
+    """
+    Rolling-origin folds over sorted YYYYMM months.
+
+    Returns:
+        list of (test month, [train months])
+    """
+    months = sorted(months)
+    folds = []
+    for i in range(min_train_months, len(months)):
+        train = months[:i] if not train_months else months[max(0, i - train_months):i]
+        folds.append((months[i], train))
+    return folds[-n_folds:] if n_folds else folds
+
+
+def fold_key(test_month, train, top_stations, manifest):
+    """
+    Cache key: the months' source / weather digests, the station table, and the split.
+    The top-station set is a function of the training months' rows alone (see
+    write_fold), so those digests plus the selection rule determine it.
+    """
+    months = manifest["months"]
+    payload = {
+        "version": FOLD_CACHE_VERSION,
+        "panel_version": manifest.get("panel_version"),
+        "stations": manifest.get("stations"),
+        "top_stations": top_stations,
+        "station_selection": "train_months",
+        "test": test_month,
+        "months": {m: [months[m].get("sha256"), months[m].get("weather_sha256")] for m in train + [test_month]},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def write_fold(rows, test_month, train, fold_dir, top_stations=DEFAULT_TOP_STATIONS):
+    """
+    Restrict the panel to the fold's months and to the `top_stations` busiest
+    stations over its training months (no look-ahead into the test month or
+    later), then impute, standardize with training statistics and write the
+    fold to `fold_dir`.
+    """
+    fold_rows = np.isin(rows["year_month"], [int(m) for m in train + [test_month]])
+    rows = {name: values[fold_rows] for name, values in rows.items()}
+    rows = select_stations(rows, top_stations, within=np.isin(rows["year_month"], [int(m) for m in train]))
+    month = rows["year_month"]
+    train_mask = np.isin(month, [int(m) for m in train])
+    test_mask = month == int(test_month)
+    columns = sorted(c for c, v in rows.items() if c not in META_COLUMNS and v.dtype.kind in "fiu")
+
+    X = np.column_stack([rows[c].astype(np.float64) for c in columns])
+    required = [columns.index(c) for c in set(NB_FEATURES + INFL_FEATURES)]
+    complete = np.isfinite(X[:, required]).all(axis=1)
+    train_mask &= complete
+    test_mask &= complete
+
+    X_train, X_test = X[train_mask], X[test_mask]
+    medians = np.nanmedian(X_train, axis=0) if len(X_train) else np.full(len(columns), np.nan)
+    keep = np.isfinite(medians)
+    columns = [c for c, k in zip(columns, keep) if k]
+    X_train, X_test, medians = X_train[:, keep], X_test[:, keep], medians[keep]
+    for part in (X_train, X_test):
+        missing = ~np.isfinite(part)
+        part[missing] = np.take(medians, np.nonzero(missing)[1])
+    mean, scale = X_train.mean(axis=0), X_train.std(axis=0)
+    constant = [c for c, s in zip(columns, scale) if s == 0]
+    scale[scale == 0] = 1.0
+
+    tmp = fold_dir.with_name(fold_dir.name + f".tmp{os.getpid()}")
+    tmp.mkdir(parents=True, exist_ok=True)
+    for name, part in (("X_train", X_train), ("X_test", X_test)):
+        out = np.lib.format.open_memmap(tmp / f"{name}.npy", mode="w+", dtype=np.float64,
+                                        shape=part.shape, fortran_order=True)
+        out[:] = (part - mean) / scale
+        out.flush()
+        del out
+    origin = pd.Timestamp(f"{test_month[:4]}-{test_month[4:]}-01").value // NS_PER_HOUR
+    arrays = {
+        "y_train": np.column_stack([rows["in"][train_mask], rows["out"][train_mask]]).astype(np.float64),
+        "y_test": np.column_stack([rows["in"][test_mask], rows["out"][test_mask]]).astype(np.float64),
+        "mean": mean, "scale": scale,
+        "station_id": rows["station_id"][test_mask].astype(str),
+        "hour_of_day": rows["hour_of_day"][test_mask].astype(np.int64),
+        "horizon_day": (rows["epoch_hour"][test_mask] - origin) // 24 + 1,
+    }
+    for name, array in arrays.items():
+        np.save(tmp / f"{name}.npy", array)
+    (tmp / "fold.json").write_text(json.dumps({
+        "test": test_month, "train": train, "columns": columns, "constant": constant,
+        "stations": sorted(np.unique(rows["station_id"]).astype(str).tolist()),
+        "n_train": int(train_mask.sum()), "n_test": int(test_mask.sum()),
+    }))
+    if fold_dir.exists():
+        # Another run wrote the same fold first; its contents are identical
+        for path in tmp.iterdir():
+            path.unlink()
+        tmp.rmdir()
+    else:
+        tmp.rename(fold_dir)
+
+
+def prepare_folds(state_dir, folds, cache_dir, top_stations):
+    """
+    Ensure every fold is cached; loads the panel only if some fold is missing.
+
+    Returns:
+        list of fold directories, in fold order
+    """
+    manifest = TrainingState(state_dir).manifest
+    dirs = [Path(cache_dir) / f"{test}-{fold_key(test, train, top_stations, manifest)}" for test, train in folds]
+    missing = [(fold, d) for fold, d in zip(folds, dirs) if not (d / "fold.json").exists()]
+    if missing:
+        rows = load_panel(state_dir)
+        for (test, train), fold_dir in missing:
+            t0 = time.perf_counter()
+            write_fold(rows, test, train, fold_dir, top_stations)
+            print(f"  ✓ fold {test}: cached design ({time.perf_counter() - t0:.1f}s)")
+    print(f"  {len(folds) - len(missing)} of {len(folds)} folds from cache ({cache_dir})")
+    return dirs
+
+
+def _load(fold_dir, name):
+    return np.load(Path(fold_dir) / f"{name}.npy", mmap_mode="r")
+
+
+def _columns(meta, features):
+    missing = [f for f in features if f not in meta["columns"]]
+    if missing:
+        raise ValueError(f"fold {meta['test']} has no columns {missing}")
+    return [meta["columns"].index(f) for f in features]
+
+
+def fit_fold(fold_dir, model, head, options):
+    """
+    Worker: fit `model` for one head on a cached fold and predict its test month.
+
+    Returns:
+        tuple: (fold_dir, model, head, predictions, seconds)
+    """
+    warnings.simplefilter("ignore")
+    t0 = time.perf_counter()
+    meta = json.loads((Path(fold_dir) / "fold.json").read_text())
+    h = HEADS.index(head)
+    X_train, X_test = _load(fold_dir, "X_train"), _load(fold_dir, "X_test")
+
+    def design(X, features):
+        # A feature that is constant over the training window (e.g. month with
+        # one training month) is all zeros after scaling and only adds a singular direction
+        idx = _columns(meta, [f for f in features if f not in meta["constant"]])
+        return np.column_stack([np.ones(len(X)), np.asarray(X[:, idx])])
+
+    y = np.asarray(_load(fold_dir, "y_train")[:, h])
+    if model == "naive":
+        idx = _columns(meta, [f"last_day_{head}"])[0]
+        mean, scale = _load(fold_dir, "mean"), _load(fold_dir, "scale")
+        pred = np.asarray(X_test[:, idx]) * scale[idx] + mean[idx]
+    elif model == "zinb":
+        from statsmodels.discrete.count_model import ZeroInflatedNegativeBinomialP
+
+        nb, infl = options.get("nb_features", NB_FEATURES), options.get("infl_features", INFL_FEATURES)
+        fitted = ZeroInflatedNegativeBinomialP(y, design(X_train, nb), exog_infl=design(X_train, infl), p=2).fit(
+            method="bfgs", maxiter=MAXITER, disp=False, skip_hessian=True)
+        pred = zinb_mean(np.asarray(fitted.params), design(X_test, nb), design(X_test, infl))
+    elif model == "nb":
+        import statsmodels.api as sm
+
+        features = options.get("glm_features", NB_GLM_FEATURES)
+        family = sm.families.NegativeBinomial(alpha=options.get("alpha", DEFAULT_ALPHA))
+        fitted = sm.GLM(y, design(X_train, features), family=family).fit(maxiter=100)
+        pred = fitted.predict(design(X_test, features))
+    else:
+        raise ValueError(f"Unknown model '{model}'. Choose from {MODELS}")
+    return str(fold_dir), model, head, np.asarray(pred, dtype=np.float64), time.perf_counter() - t0
+
+
+def score(fold_dirs, results):
+    """
+    Error table: one row per (model, head, breakdown, key) with n, MAE, RMSE.
+    """
+    frames = []
+    for fold_dir, model, head, pred, _ in results:
+        if pred is None:
+            continue
+        meta = json.loads((Path(fold_dir) / "fold.json").read_text())
+        frames.append(pd.DataFrame({
+            "model": model, "head": head, "fold": meta["test"],
+            "station_id": np.asarray(_load(fold_dir, "station_id")),
+            "hour_of_day": np.asarray(_load(fold_dir, "hour_of_day")),
+            "horizon_day": np.asarray(_load(fold_dir, "horizon_day")),
+            "error": pred - np.asarray(_load(fold_dir, "y_test")[:, HEADS.index(head)]),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=["model", "head", "breakdown", "key", "n", "mae", "rmse"])
+    errors = pd.concat(frames, ignore_index=True)
+    errors["abs"] = errors["error"].abs()
+    errors["sq"] = errors["error"] ** 2
+
+    tables = []
+    for breakdown in ("overall",) + BREAKDOWNS:
+        keys = ["model", "head"] + ([] if breakdown == "overall" else [breakdown])
+        grouped = errors.groupby(keys, sort=True).agg(n=("abs", "size"), mae=("abs", "mean"), sq=("sq", "mean"))
+        grouped = grouped.reset_index()
+        grouped["rmse"] = np.sqrt(grouped.pop("sq"))
+        grouped["key"] = grouped.pop(breakdown).astype(str) if breakdown != "overall" else "all"
+        grouped["breakdown"] = breakdown
+        tables.append(grouped)
+    return pd.concat(tables, ignore_index=True)[["model", "head", "breakdown", "key", "n", "mae", "rmse"]]
+
+
+def backtest(state_dir=DEFAULT_STATE_DIR, models=MODELS, heads=HEADS, n_folds=12, train_months=0,
+             cache_dir=DEFAULT_CACHE_DIR, top_stations=DEFAULT_TOP_STATIONS, workers=None, options=None):
+    """
+    Run every model on every fold and return the error table.
+    """
+    options = options or {}
+    manifest = TrainingState(state_dir).manifest
+    folds = plan_folds(manifest["months"], n_folds, train_months)
+    if not folds:
+        raise ValueError(f"Need at least two months in {state_dir} for a backtest")
+    fold_dirs = prepare_folds(state_dir, folds, cache_dir, top_stations)
+
+    tasks = [(d, m, h) for d in fold_dirs for m in models for h in heads]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    print(f"  {len(tasks)} fits ({len(folds)} folds x {len(models)} models x {len(heads)} heads), "
+          f"{workers} workers")
+    if workers <= 1:
+        results = [_run(d, m, h, options) for d, m, h in tasks]
+    else:
+        # Each worker runs single-threaded BLAS; the pool provides the parallelism
+        for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ.setdefault(var, "1")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(_run, *zip(*tasks), [options] * len(tasks)))
+    for fold_dir, model, head, pred, seconds in results:
+        if pred is None:
+            print(f"  ⚠ {Path(fold_dir).name} {model} {head}: {seconds}")
+    return score(fold_dirs, results)
+
+
+def _run(fold_dir, model, head, options):
+    try:
+        return fit_fold(fold_dir, model, head, options)
+    except Exception as e:
+        return str(fold_dir), model, head, None, f"failed: {e}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the ZINB / NB models")
+    parser.add_argument("--state-dir", default=str(DEFAULT_STATE_DIR),
+                        help="Training state from train_incremental.py")
+    parser.add_argument("-o", "--output", default="data/backtest.csv", help="Error table (.csv or .parquet)")
+    parser.add_argument("--models", default=",".join(MODELS), help=f"Comma-separated subset of {MODELS}")
+    parser.add_argument("--heads", default="in,out")
+    parser.add_argument("--folds", type=int, default=12, help="Number of most recent test months (0 = all)")
+    parser.add_argument("--train-months", type=int, default=0,
+                        help="Sliding training window in months (0 = expanding)")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR), help="Fold design cache")
+    parser.add_argument("--top-stations", type=int, default=DEFAULT_TOP_STATIONS,
+                        help="Backtest the N busiest stations (0 = all)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA, help="NB GLM dispersion")
+    parser.add_argument("--nb-features", default=None, help="Comma-separated ZINB NB features")
+    parser.add_argument("--infl-features", default=None, help="Comma-separated ZINB inflation features")
+    args = parser.parse_args()
+
+    options = {"alpha": args.alpha}
+    if args.nb_features:
+        options["nb_features"] = args.nb_features.split(",")
+    if args.infl_features:
+        options["infl_features"] = args.infl_features.split(",")
+
+    print("=" * 60)
+    print(f"Backtesting {args.models} on {args.state_dir}...")
+    print("=" * 60)
+    t0 = time.perf_counter()
+    table = backtest(args.state_dir, tuple(args.models.split(",")), tuple(args.heads.split(",")), args.folds,
+                     args.train_months, args.cache_dir, args.top_stations, args.workers, options)
+    write_frame(table, args.output)
+
+    overall = table[table["breakdown"] == "overall"]
+    for _, row in overall.iterrows():
+        print(f"  {row['model']:>6} {row['head']:>3}: MAE {row['mae']:.3f}  RMSE {row['rmse']:.3f}  (n={row['n']:,})")
+    by_fold = table[table["breakdown"] == "fold"].pivot_table(index="key", columns=["model", "head"], values="mae")
+    if len(by_fold):
+        print("\n  MAE per fold:")
+        print(by_fold.round(3).to_string())
+    print(f"\n✓ Backtest written to {args.output} ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
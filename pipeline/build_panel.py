@@ -0,0 +1,116 @@
+"""
+Parallel per-month station-hour panel builder
+
+Fans monthly trip files out to a process pool, aggregates each month into
+sparse IN/OUT station-hour counts with trip_ingest.TripAggregator, then
+reduces the partial aggregates into one panel.
+
+Month boundaries: each trip is counted where it actually happens, i.e. a trip
+starting 01-31 23:50 and ending 02-01 00:10 adds an OUT to the January hour
+and an IN to the February hour, even though it only appears in the January
+file. Counts are keyed on absolute epoch hours, so the reduce step simply sums
+them, and lag features are computed after the reduce on the merged grid.
+
+Usage:
+    python pipeline/build_panel.py data/2023_data/Bluebikes/*-bluebikes-tripdata.csv \
+        data/2024_data/*-bluebikes-tripdata.csv -o data/hourly_panel.csv --workers 32 \
+        --weather data/2023_data/Weather/*-weather.csv data/2024_data/Weather/*-weather.csv
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from trip_ingest import DEFAULT_CHUNKSIZE, TripAggregator, write_frame
+from weather import join_weather, load_weather
+
+
+def aggregate_month(path, chunksize=DEFAULT_CHUNKSIZE, cache_dir=None):
+    """
+    Worker: aggregate a single monthly trip file.
+
+    Returns:
+        tuple: (path, TripAggregator, seconds)
+    """
+    t0 = time.perf_counter()
+    aggregator = TripAggregator(chunksize=chunksize, cache_dir=cache_dir).add_file(path)
+    aggregator.outs.compact()
+    aggregator.ins.compact()
+    return path, aggregator, time.perf_counter() - t0
+
+
+def reduce_aggregates(aggregators):
+    """
+    Merge per-month aggregates pairwise (tree reduction) into one.
+    """
+    aggregators = list(aggregators)
+    if not aggregators:
+        raise ValueError("No aggregates to reduce")
+    while len(aggregators) > 1:
+        merged = []
+        for i in range(0, len(aggregators) - 1, 2):
+            merged.append(aggregators[i].merge(aggregators[i + 1]))
+        if len(aggregators) % 2:
+            merged.append(aggregators[-1])
+        aggregators = merged
+    return aggregators[0]
+
+
+def build_panel(paths, workers=None, chunksize=DEFAULT_CHUNKSIZE, cache_dir=None):
+    """
+    Aggregate `paths` in parallel and return the reduced TripAggregator.
+    """
+    paths = sorted(str(p) for p in paths)
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+
+    if workers <= 1:
+        results = [aggregate_month(path, chunksize, cache_dir) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(aggregate_month, paths, [chunksize] * len(paths),
+                                    [cache_dir] * len(paths)))
+
+    for path, aggregator, seconds in results:
+        print(f"  ✓ {Path(path).name}: {aggregator.n_trips:,} trips ({seconds:.1f}s)")
+
+    # Results come back in file order, so station codes are deterministic
+    return reduce_aggregates(aggregator for _, aggregator, _ in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the station-hour panel with a process pool")
+    parser.add_argument("paths", nargs="+", help="Monthly *-bluebikes-tripdata.csv files")
+    parser.add_argument("-o", "--output", default="data/hourly_panel.csv",
+                        help="Output path (.csv or .parquet)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--cache-dir", default=None,
+                        help="Read trips from this Parquet cache when fresh (see trip_cache.py)")
+    parser.add_argument("--sparse", action="store_true",
+                        help="Write only active station-hours (no full grid or lags)")
+    parser.add_argument("--weather", nargs="*", default=[],
+                        help="Monthly *-weather.csv files to join onto each station-hour")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Aggregating {len(args.paths)} trip files with {args.workers or os.cpu_count()} workers...")
+    print("=" * 60)
+    t0 = time.perf_counter()
+    aggregator = build_panel(args.paths, args.workers, args.chunksize, args.cache_dir)
+
+    if args.sparse:
+        frame = aggregator.hourly_counts()
+    else:
+        frame = aggregator.to_panel()
+    if args.weather:
+        frame = join_weather(frame, load_weather(args.weather, args.cache_dir))
+
+    write_frame(frame, args.output)
+    print(f"✓ {aggregator.n_trips:,} trips, {len(aggregator.stations)} stations, "
+          f"{len(frame):,} rows -> {args.output} ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Build the per-station feature table served by flask/station_store.py
+
+One row per Bluebikes station with its coordinates, geo features
+(geo_features.py) and a baseline for the `last_day_in` / `last_day_out`
+model inputs, used when a request carries no history: the station's mean
+hourly IN / OUT count over the panel.
+
+The ZINB needs subway_distance_m and mbta_stops_250m, so the MBTA stop files
+(--subway, --bus; from download_dataset.py under data/2023_data/Features) are
+required unless --merge supplies the distances. --merge keeps the columns and
+stations of an existing table that this build does not produce (e.g. the
+hand-collected dist_business / dist_residential / restaurant_count).
+
+Usage:
+    python pipeline/build_station_table.py --panel data/hourly_panel.csv \
+        --subway data/2023_data/Features/Rapid_Transit_Stops.csv data/2023_data/Features/Commuter_Rail_Stops.csv \
+        --bus data/2023_data/Features/Bus_Stops.csv --colleges data/2023_data/Features/Universities.csv \
+        --merge flask/station_features.csv -o flask/station_features.csv
+"""
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from geo_features import COLLEGE_COLUMNS, DEFAULT_RADIUS_M, STOP_COLUMNS, PointIndex
+
+
+PANEL_COLUMNS = ["station_id", "station_name", "latitude", "longitude", "in", "out"]
+# Each pair: either column lets the server derive the ZINB station inputs
+# (station_store.derive_distance_features)
+REQUIRED_COLUMNS = [("subway_distance_m", "dist_subway_m"), ("mbta_stops_250m", "dist_bus_m")]
+
+
+def read_table(path, columns=None):
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns, dtype={"station_id": "string"})
+
+
+def station_baselines(panel):
+    """
+    Per-station coordinates and mean hourly IN / OUT counts.
+    """
+    stations = panel.groupby("station_id", sort=True).agg(
+        station_name=("station_name", "first"),
+        station_lat=("latitude", "first"),
+        station_lng=("longitude", "first"),
+        last_day_in=("in", "mean"),
+        last_day_out=("out", "mean"),
+    )
+    return stations.reset_index()
+
+
+def add_geo_features(stations, subway=None, bus=None, colleges=None, radius_m=DEFAULT_RADIUS_M):
+    """
+    Nearest-distance and radius-count columns in the naming the server uses.
+    """
+    lat, lng = stations["station_lat"], stations["station_lng"]
+    if subway is not None:
+        index = PointIndex(subway, STOP_COLUMNS["lat"], STOP_COLUMNS["lon"])
+        stations["dist_subway_m"] = index.nearest(lat, lng)[0][:, 0]
+        stations["subway_distance_m"] = stations["dist_subway_m"]
+        stations["mbta_stops_250m"] = index.count_within(lat, lng, radius_m)
+    if bus is not None:
+        index = PointIndex(bus, STOP_COLUMNS["lat"], STOP_COLUMNS["lon"])
+        stations["dist_bus_m"] = index.nearest(lat, lng)[0][:, 0]
+    if colleges is not None:
+        index = PointIndex(colleges, COLLEGE_COLUMNS["lat"], COLLEGE_COLUMNS["lon"])
+        stations["dist_university_m"] = index.nearest(lat, lng)[0][:, 0]
+    return stations
+
+
+def merge_existing(stations, existing):
+    """
+    Fill what this build lacks from an existing table, matched on station_id:
+    missing columns and NaN cells are taken over, stations absent from the
+    panel are appended. Freshly built values win.
+    """
+    existing = existing.drop_duplicates("station_id").set_index("station_id")
+    merged = stations.set_index("station_id")
+    merged = merged.combine_first(existing)
+    columns = list(stations.columns.drop("station_id")) + [c for c in existing.columns if c not in stations.columns]
+    return merged[columns].rename_axis("station_id").reset_index()
+
+
+def missing_inputs(stations):
+    return [" or ".join(pair) for pair in REQUIRED_COLUMNS if not any(c in stations.columns for c in pair)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the station feature table for the Flask backend")
+    parser.add_argument("--panel", required=True, help="Station-hour panel from build_panel.py (.csv or .parquet)")
+    parser.add_argument("--subway", nargs="*", default=[], help="MBTA rapid transit / commuter rail stop CSVs")
+    parser.add_argument("--bus", nargs="*", default=[], help="MBTA bus stop CSVs")
+    parser.add_argument("--colleges", default=None, help="Colleges and universities CSV")
+    parser.add_argument("--merge", default=None,
+                        help="Existing station table whose other columns / stations are kept (may equal -o)")
+    parser.add_argument("-o", "--output", default="flask/station_features.csv")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Building station feature table from {args.panel}...")
+    print("=" * 60)
+    t0 = time.perf_counter()
+    stations = station_baselines(read_table(args.panel, PANEL_COLUMNS))
+    stations = stations.dropna(subset=["station_lat", "station_lng"]).reset_index(drop=True)
+
+    def concat(paths):
+        return pd.concat([pd.read_csv(p) for p in paths], ignore_index=True) if paths else None
+
+    stations = add_geo_features(
+        stations,
+        subway=concat(args.subway),
+        bus=concat(args.bus),
+        colleges=pd.read_csv(args.colleges) if args.colleges else None,
+    )
+    if args.merge:
+        if Path(args.merge).exists():
+            stations = merge_existing(stations, read_table(args.merge))
+        else:
+            print(f"⚠ {args.merge} not found; nothing merged")
+    missing = missing_inputs(stations)
+    if missing:
+        raise SystemExit(f"✗ The table would lack {missing}, which the ZINB needs; "
+                         "pass --subway / --bus (MBTA stop CSVs) or --merge a table that has them")
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if output.suffix == ".parquet":
+        stations.to_parquet(output, index=False)
+    else:
+        stations.to_csv(output, index=False, float_format="%.4f")
+    print(f"✓ {len(stations)} stations -> {output} ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
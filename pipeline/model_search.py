@@ -0,0 +1,380 @@
+"""
+Parallel feature-subset / hyperparameter search for the ZINB and NB models
+
+Replaces hand-picking `nb_features` / `infl_features` (ZINB_with_feature.ipynb)
+and the alpha / boosting settings and `for t in range(1, 40)` threshold sweep
+(nb_with_boosting.ipynb) with a search over a process pool:
+
+    zinb   feature subsets around the served NB / inflation sets (drop one, add
+           one, optional random subsets), per head
+    nb     NB GLM alpha grid x feature subsets, plus GradientBoostingRegressor
+           residual boosting settings on the full feature set
+
+Rows come from the training state written by train_incremental.py; the last
+--valid-months months are held out. The imputed design matrix is written once
+to .npy files and memory-mapped read-only by every worker, so tasks only carry
+a small config dict.
+
+Early abandonment: each candidate is first fitted on a --rung-fraction
+subsample of the training rows. If its validation score there is worse than
+the best subsample score seen so far in its group (kind, head) by more than
+--abandon-margin, it is recorded as abandoned without the full fit.
+
+Every candidate also gets the notebook's threshold sweep: the prediction
+threshold t in 1..39 that maximizes F1 for "count >= --threshold".
+
+Winning ZINB subsets are reported only; serving uses the fixed NB_FEATURES /
+INFL_FEATURES in flask/zinb_predictor.py.
+
+Usage:
+    python pipeline/model_search.py --state-dir data/training --workers 32 -o data/model_search.csv
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from train_incremental import (DEFAULT_STATE_DIR, DEFAULT_TOP_STATIONS, INFL_FEATURES, NB_FEATURES,
+                               NB_GLM_FEATURES, fit_failure, load_panel, select_stations, zinb_mean)
+from trip_ingest import write_frame
+
+
+# Extra columns each ZINB part may add to the served sets
+NB_EXTRA = ["is_weekend", "day_of_week", "is_night", "precipitation", "avg_temp"]
+INFL_EXTRA = ["start_hour", "is_weekend", "day_of_week", "subway_distance_m", "mbta_stops_250m"]
+
+ALPHAS = (1e-4, 0.01, 0.1, 0.5, 1.0)
+BOOST_GRID = {"n_estimators": (100, 300), "learning_rate": (0.05, 0.1), "max_depth": (2, 3)}
+THRESHOLDS = np.arange(1, 40)
+METRICS = ("mae", "rmse", "nll", "f1")
+ZINB_MAXITER = 1000
+
+# Worker state: memory-mapped design matrices, set by _init_worker
+_SHARED = {}
+
+
+def build_candidates(columns, heads=("in", "out"), alphas=ALPHAS, n_random=0, seed=0):
+    """
+    Candidate configs for every kind / head.
+
+    Returns:
+        list of dict: {kind, head, ...}; features are lists of column names
+    """
+    candidates = []
+    rng = np.random.default_rng(seed)
+    nb_pool = [c for c in NB_FEATURES + NB_EXTRA if c in columns]
+    infl_pool = [c for c in INFL_FEATURES + INFL_EXTRA if c in columns]
+
+    subsets = [(NB_FEATURES, INFL_FEATURES)]
+    subsets += [([f for f in NB_FEATURES if f != drop], INFL_FEATURES) for drop in NB_FEATURES]
+    subsets += [(NB_FEATURES, [f for f in INFL_FEATURES if f != drop]) for drop in INFL_FEATURES]
+    subsets += [(NB_FEATURES + [add], INFL_FEATURES) for add in nb_pool if add not in NB_FEATURES]
+    subsets += [(NB_FEATURES, INFL_FEATURES + [add]) for add in infl_pool if add not in INFL_FEATURES]
+    for _ in range(n_random):
+        nb = [f for f in nb_pool if rng.random() < 0.5] or [nb_pool[0]]
+        infl = [f for f in infl_pool if rng.random() < 0.5] or [infl_pool[0]]
+        subsets.append((nb, infl))
+
+    glm_features = [f for f in NB_GLM_FEATURES if f in columns]
+    glm_subsets = [glm_features] + [[f for f in glm_features if f != drop] for drop in glm_features]
+    boosts = [dict(zip(BOOST_GRID, values)) for values in product(*BOOST_GRID.values())]
+
+    for head in heads:
+        seen = set()
+        for nb, infl in subsets:
+            key = (tuple(nb), tuple(infl))
+            if key not in seen:
+                seen.add(key)
+                candidates.append({"kind": "zinb", "head": head, "nb_features": nb, "infl_features": infl})
+        if not glm_features:
+            continue
+        for alpha, features in product(alphas, glm_subsets):
+            candidates.append({"kind": "nb", "head": head, "features": features, "alpha": alpha, "boost": None})
+        for alpha, boost in product(alphas, boosts):
+            candidates.append({"kind": "nb", "head": head, "features": glm_features, "alpha": alpha,
+                               "boost": boost})
+    return candidates
+
+
+def threshold_sweep(y_true, y_pred, threshold, thresholds=THRESHOLDS):
+    """
+    F1 of (y_pred >= t) against (y_true >= threshold) for every t at once.
+
+    Returns:
+        tuple: (best t, best F1)
+    """
+    positive = y_true >= threshold
+    order = np.sort(y_pred)
+    pos_sorted = np.sort(y_pred[positive])
+    predicted = len(order) - np.searchsorted(order, thresholds, side="left")
+    true_pos = len(pos_sorted) - np.searchsorted(pos_sorted, thresholds, side="left")
+    denom = predicted + positive.sum()
+    f1 = np.divide(2.0 * true_pos, denom, out=np.zeros(len(thresholds)), where=denom > 0)
+    best = int(np.argmax(f1))
+    return int(thresholds[best]), float(f1[best])
+
+
+def _init_worker(work_dir, columns, group_keys, best, lock):
+    warnings.simplefilter("ignore")
+    work_dir = Path(work_dir)
+    _SHARED.update({
+        "columns": {c: i for i, c in enumerate(columns)},
+        "groups": {key: i for i, key in enumerate(group_keys)},
+        "best": best,
+        "lock": lock,
+    })
+    for name in ("X_train", "X_valid", "y_train", "y_valid", "rung_rows", "mean", "scale"):
+        _SHARED[name] = np.load(work_dir / f"{name}.npy", mmap_mode="r")
+
+
+def _design(split, features, rows=None, standardize=False):
+    idx = [_SHARED["columns"][f] for f in features]
+    X = _SHARED[split]
+    X = np.asarray(X[:, idx] if rows is None else X[rows][:, idx], dtype=np.float64)
+    if standardize:
+        X = (X - _SHARED["mean"][idx]) / _SHARED["scale"][idx]
+    return np.column_stack([np.ones(len(X)), X])
+
+
+def _fit_predict(config, rows):
+    """
+    Fit one candidate on training `rows` (None = all) and predict the validation set.
+
+    Returns:
+        tuple: (validation predictions, validation NLL or nan)
+    """
+    head = 0 if config["head"] == "in" else 1
+    y = np.asarray(_SHARED["y_train"][:, head] if rows is None else _SHARED["y_train"][rows, head])
+    y_valid = np.asarray(_SHARED["y_valid"][:, head])
+
+    if config["kind"] == "zinb":
+        from statsmodels.discrete.count_model import ZeroInflatedNegativeBinomialP
+
+        Xn = _design("X_train", config["nb_features"], rows, standardize=True)
+        Xi = _design("X_train", config["infl_features"], rows, standardize=True)
+        fitted = ZeroInflatedNegativeBinomialP(y, Xn, exog_infl=Xi, p=2).fit(
+            method="bfgs", maxiter=ZINB_MAXITER, disp=False, skip_hessian=True)
+        # Non-converged fits (e.g. fopt = nan) have finite params but nonsense predictions
+        failure = fit_failure(fitted)
+        if failure is not None:
+            raise ValueError(f"fit failed ({failure})")
+        params = np.asarray(fitted.params, dtype=np.float64)
+        Xn_valid = _design("X_valid", config["nb_features"], standardize=True)
+        Xi_valid = _design("X_valid", config["infl_features"], standardize=True)
+        valid_model = ZeroInflatedNegativeBinomialP(y_valid, Xn_valid, exog_infl=Xi_valid, p=2)
+        return zinb_mean(params, Xn_valid, Xi_valid), -valid_model.loglike(params) / len(y_valid)
+
+    import statsmodels.api as sm
+
+    family = sm.families.NegativeBinomial(alpha=config["alpha"])
+    X = _design("X_train", config["features"], rows)
+    X_valid = _design("X_valid", config["features"])
+    fitted = sm.GLM(y, X, family=family).fit(maxiter=100)
+    pred = fitted.predict(X_valid)
+    if config["boost"] is None:
+        return pred, -family.loglike(y_valid, pred) / len(y_valid)
+
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    boost = GradientBoostingRegressor(loss="squared_error", random_state=0, **config["boost"])
+    boost.fit(X[:, 1:], y - fitted.predict(X))
+    return np.clip(pred + boost.predict(X_valid[:, 1:]), 0, None), np.nan
+
+
+def _score(pred, nll, head, threshold):
+    y_valid = np.asarray(_SHARED["y_valid"][:, 0 if head == "in" else 1])
+    best_t, f1 = threshold_sweep(y_valid, pred, threshold)
+    return {
+        "mae": float(np.mean(np.abs(pred - y_valid))),
+        "rmse": float(np.sqrt(np.mean((pred - y_valid) ** 2))),
+        "nll": float(nll),
+        "f1": f1,
+        "best_threshold": best_t,
+    }
+
+
+def evaluate(config, metric="mae", threshold=4, abandon_margin=0.05):
+    """
+    Worker: subsample rung, early-abandonment check, then the full fit.
+
+    Returns:
+        dict: config fields, status, metrics, seconds
+    """
+    t0 = time.perf_counter()
+    sign = -1.0 if metric == "f1" else 1.0   # lower is better internally
+    group = _SHARED["groups"][(config["kind"], config["head"])]
+    best, lock = _SHARED["best"], _SHARED["lock"]
+    result = {"kind": config["kind"], "head": config["head"], "status": "done"}
+    try:
+        rung = _score(*_fit_predict(config, np.asarray(_SHARED["rung_rows"])), config["head"], threshold)
+        result["rung_" + metric] = rung[metric]
+        value = sign * rung[metric]
+        with lock:
+            leader = best[2 * group]
+            if np.isfinite(value) and value < leader:
+                best[2 * group] = value
+        if np.isfinite(leader) and value > leader + abandon_margin * abs(leader):
+            result["status"] = "abandoned"
+        else:
+            full = _score(*_fit_predict(config, None), config["head"], threshold)
+            result.update(full)
+            with lock:
+                best[2 * group + 1] = min(best[2 * group + 1], sign * full[metric])
+    except Exception as e:
+        result["status"] = f"failed: {e}"
+    result["seconds"] = round(time.perf_counter() - t0, 2)
+    return result
+
+
+def write_design(rows, work_dir, valid_months, rung_fraction, seed=0):
+    """
+    Impute, split and write the shared design to `work_dir` as .npy files.
+
+    Returns:
+        list: column names in matrix order
+    """
+    month_key = rows["year_month"]
+    months = np.unique(month_key)
+    if len(months) <= valid_months:
+        raise ValueError(f"Need more than {valid_months} months of panel rows, found {len(months)}")
+    valid = np.isin(month_key, months[-valid_months:])
+
+    columns = sorted(c for c, v in rows.items()
+                     if v.dtype.kind in "fiu" and c not in ("in", "out", "year_month", "epoch_hour"))
+    X = np.column_stack([rows[c].astype(np.float64) for c in columns])
+    required = [columns.index(c) for c in set(NB_FEATURES + INFL_FEATURES)]
+    complete = np.isfinite(X[:, required]).all(axis=1)
+    X, valid = X[complete], valid[complete]
+    y = np.column_stack([rows["in"], rows["out"]])[complete].astype(np.float64)
+
+    medians = np.nanmedian(X[~valid], axis=0)
+    missing = ~np.isfinite(X)
+    X[missing] = np.take(np.nan_to_num(medians), np.nonzero(missing)[1])
+    keep = [i for i, c in enumerate(columns) if np.isfinite(medians[i])]
+    columns, X = [columns[i] for i in keep], X[:, keep]
+
+    train = ~valid
+    mean, scale = X[train].mean(axis=0), X[train].std(axis=0)
+    scale[scale == 0] = 1.0
+    n_train = int(train.sum())
+    rung_rows = np.sort(np.random.default_rng(seed).permutation(n_train)[:max(1, int(n_train * rung_fraction))])
+
+    work_dir = Path(work_dir)
+    for name, array in (("X_train", X[train]), ("X_valid", X[valid])):
+        out = np.lib.format.open_memmap(work_dir / f"{name}.npy", mode="w+", dtype=np.float64,
+                                        shape=array.shape, fortran_order=True)
+        out[:] = array
+        out.flush()
+        del out
+    for name, array in (("y_train", y[train]), ("y_valid", y[valid]), ("rung_rows", rung_rows),
+                        ("mean", mean), ("scale", scale)):
+        np.save(work_dir / f"{name}.npy", array)
+    return columns
+
+
+def search(state_dir=DEFAULT_STATE_DIR, workers=None, heads=("in", "out"), metric="mae",
+           threshold=4, valid_months=1, top_stations=DEFAULT_TOP_STATIONS, rung_fraction=0.25,
+           abandon_margin=0.05, n_random=0, kinds=("zinb", "nb"), seed=0):
+    """
+    Run the search and return the ranked results table.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {METRICS}")
+    rows = select_stations(load_panel(state_dir), top_stations)
+
+    with tempfile.TemporaryDirectory(prefix="model_search_") as work_dir:
+        columns = write_design(rows, work_dir, valid_months, rung_fraction, seed)
+        del rows
+        candidates = [c for c in build_candidates(columns, heads, n_random=n_random, seed=seed)
+                      if c["kind"] in kinds]
+        group_keys = sorted({(c["kind"], c["head"]) for c in candidates})
+        workers = max(1, min(workers or os.cpu_count() or 1, len(candidates)))
+        print(f"  {len(candidates)} candidates, {len(columns)} columns, {workers} workers")
+
+        # Each worker runs single-threaded BLAS; the pool provides the parallelism
+        for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ.setdefault(var, "1")
+        context = multiprocessing.get_context("spawn")
+        best = context.Array("d", [np.inf] * (2 * len(group_keys)), lock=False)
+        lock = context.Lock()
+        init_args = (work_dir, columns, group_keys, best, lock)
+        args = (metric, threshold, abandon_margin)
+
+        if workers <= 1:
+            _init_worker(*init_args)
+            results = [evaluate(c, *args) for c in candidates]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=_init_worker, initargs=init_args) as pool:
+                results = list(pool.map(evaluate, candidates, *[[a] * len(candidates) for a in args],
+                                        chunksize=1))
+
+    table = pd.DataFrame(results)
+    table["config"] = [describe(c) for c in candidates]
+    ascending = metric != "f1"
+    table["_order"] = table["status"].map({"done": 0, "abandoned": 1}).fillna(2)
+    table = table.sort_values(["kind", "head", "_order", metric if metric in table else "status"],
+                              ascending=[True, True, True, ascending], na_position="last")
+    table["rank"] = table.groupby(["kind", "head"]).cumcount() + 1
+    return table.drop(columns="_order").reset_index(drop=True)
+
+
+def describe(config):
+    if config["kind"] == "zinb":
+        return f"nb=[{'+'.join(config['nb_features'])}] infl=[{'+'.join(config['infl_features'])}]"
+    text = f"alpha={config['alpha']:g} features=[{'+'.join(config['features'])}]"
+    if config["boost"]:
+        text += " boost=" + ",".join(f"{k}={v}" for k, v in config["boost"].items())
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel ZINB / NB feature-subset and hyperparameter search")
+    parser.add_argument("--state-dir", default=str(DEFAULT_STATE_DIR),
+                        help="Training state from train_incremental.py")
+    parser.add_argument("-o", "--output", default="data/model_search.csv", help="Ranked results (.csv or .parquet)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--heads", default="in,out", help="Comma-separated heads to search")
+    parser.add_argument("--kinds", default="zinb,nb", help="Comma-separated model kinds to search")
+    parser.add_argument("--metric", choices=METRICS, default="mae", help="Ranking / abandonment metric")
+    parser.add_argument("--threshold", type=int, default=4, help="High-demand count for the F1 sweep")
+    parser.add_argument("--valid-months", type=int, default=1, help="Trailing months held out for validation")
+    parser.add_argument("--top-stations", type=int, default=DEFAULT_TOP_STATIONS,
+                        help="Search on the N busiest stations (0 = all)")
+    parser.add_argument("--rung-fraction", type=float, default=0.25,
+                        help="Training fraction for the early-abandonment rung")
+    parser.add_argument("--abandon-margin", type=float, default=0.05,
+                        help="Abandon candidates this much worse than the rung leader")
+    parser.add_argument("--random", type=int, default=0, help="Extra random ZINB feature subsets")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Searching ZINB / NB configurations from {args.state_dir}...")
+    print("=" * 60)
+    t0 = time.perf_counter()
+    table = search(args.state_dir, args.workers, tuple(args.heads.split(",")), args.metric, args.threshold,
+                   args.valid_months, args.top_stations, args.rung_fraction, args.abandon_margin,
+                   args.random, tuple(args.kinds.split(",")), args.seed)
+    write_frame(table, args.output)
+
+    counts = table["status"].where(table["status"].isin(["done", "abandoned"]), "failed").value_counts()
+    print(f"✓ {len(table)} candidates in {time.perf_counter() - t0:.1f}s "
+          f"({counts.get('done', 0)} fitted, {counts.get('abandoned', 0)} abandoned, "
+          f"{counts.get('failed', 0)} failed) -> {args.output}")
+    for (kind, head), group in table.groupby(["kind", "head"]):
+        print(f"\n  {kind.upper()} {head.upper()} (by {args.metric}):")
+        for _, row in group.head(3).iterrows():
+            print(f"    {row['rank']:>3}. {args.metric}={row.get(args.metric, np.nan):.4f}  {row['config']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Per-station ZINB model bank
+
+Fits the global ZINB over every station in the training panel, then one ZINB
+per station (or per cluster with --group-column) starting from the global
+coefficients, in the global model's standardized feature space. Columns that
+are constant within a group (the station attributes) fold into its intercept.
+Each fit is shrunk toward the global one by the group's trip volume,
+
+    θ_group = λ θ_fit + (1 - λ) θ_global,   λ = trips / (trips + --prior-trips)
+
+(dispersion in log space) and groups with fewer than --min-trips trips keep
+the global fit. Every slot shares one set of scaler statistics, so
+flask/model_bank.py folds the whole bank into one stacked weight array.
+
+Usage:
+    python pipeline/train_bank.py --state-dir data/training -o data/training/zinb_bank.npz
+    python pipeline/train_bank.py --stations flask/station_features.csv --group-column cluster
+    python pipeline/train_bank.py --holdout-months 1    # compare against the global fit
+"""
+import argparse
+import multiprocessing
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from train_incremental import (DEFAULT_STATE_DIR, INFL_FEATURES, NB_FEATURES, TrainingState, _standardize,
+                               fit_failure, fit_zinb, load_panel, select_stations)
+
+
+DEFAULT_MIN_TRIPS = 200
+DEFAULT_PRIOR_TRIPS = 500
+GROUP_MAXITER = 200
+GLOBAL_KEY = "__global__"
+
+
+def _absorb_constants(coef, X, keep):
+    """
+    Move the contribution of columns dropped from X (constant within the
+    group) into the intercept, so `coef` predicts the same on the group.
+    """
+    coef = np.array(coef, dtype=np.float64)
+    coef[0] += X[0, ~keep] @ coef[~keep]
+    coef[~keep] = 0.0
+    return coef
+
+
+def fit_group(Xn, Xi, y, global_params, maxiter=GROUP_MAXITER):
+    """
+    ZINB for one group, warm-started from the global parameters.
+
+    Args:
+        Xn, Xi: group rows of the global standardized designs (constant first)
+        y: counts
+        global_params: global ZeroInflatedNegativeBinomialP params (inflate_*, exog, alpha)
+
+    Returns:
+        tuple: (fitted params, global params with the group's constants absorbed), full width
+    """
+    from statsmodels.discrete.count_model import ZeroInflatedNegativeBinomialP
+
+    k_infl = Xi.shape[1]
+    keep_n = np.concatenate([[True], Xn[:, 1:].std(axis=0) > 0])
+    keep_i = np.concatenate([[True], Xi[:, 1:].std(axis=0) > 0])
+    gamma = _absorb_constants(global_params[:k_infl], Xi, keep_i)
+    beta = _absorb_constants(global_params[k_infl:-1], Xn, keep_n)
+    anchor = np.concatenate([gamma, beta, global_params[-1:]])
+
+    start = np.concatenate([gamma[keep_i], beta[keep_n], global_params[-1:]])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        model = ZeroInflatedNegativeBinomialP(y, Xn[:, keep_n], exog_infl=Xi[:, keep_i], p=2)
+        fitted = model.fit(start_params=start, method="bfgs", maxiter=maxiter, disp=False, skip_hessian=True)
+    failure = fit_failure(fitted)
+    params = np.asarray(fitted.params, dtype=np.float64)
+    if failure is None and params[-1] <= 0:
+        failure = f"non-positive dispersion ({params[-1]})"
+    if failure is not None:
+        raise ValueError(f"group fit failed ({failure})")
+
+    full = np.zeros_like(anchor)
+    full[:k_infl][keep_i] = params[:keep_i.sum()]
+    full[k_infl:-1][keep_n] = params[keep_i.sum():-1]
+    full[-1] = params[-1]
+    return full, anchor
+
+
+def shrink(params, anchor, weight):
+    """
+    weight * params + (1 - weight) * anchor, with the dispersion blended in log space.
+    """
+    blended = weight * params + (1 - weight) * anchor
+    blended[-1] = np.exp(weight * np.log(params[-1]) + (1 - weight) * np.log(anchor[-1]))
+    return blended
+
+
+def _fit_slot(key, Xn, Xi, targets, global_params, prior_trips, maxiter):
+    """
+    Worker: fit both heads of one group. Returns (key, params dict or None, stats).
+    """
+    t0 = time.perf_counter()
+    params, stats = {}, {"rows": len(Xn)}
+    try:
+        for head, y in targets.items():
+            fitted, anchor = fit_group(Xn, Xi, y, global_params[head], maxiter)
+            weight = y.sum() / (y.sum() + prior_trips)
+            params[head] = shrink(fitted, anchor, weight)
+            stats[f"shrinkage_{head}"] = round(float(weight), 3)
+    except (ValueError, np.linalg.LinAlgError) as e:
+        return key, None, dict(stats, error=str(e))
+    stats["seconds"] = round(time.perf_counter() - t0, 2)
+    return key, params, stats
+
+
+def group_keys(rows, stations_path=None, group_column=None):
+    """
+    Bank group of every row: its station id, or the station's `group_column`
+    value in the station table (missing -> global fit).
+    """
+    station_ids = rows["station_id"].astype(str)
+    if group_column is None:
+        return station_ids
+    if stations_path is None:
+        raise ValueError("--group-column needs --stations")
+    table = pd.read_csv(stations_path, dtype={"station_id": "string"}).drop_duplicates("station_id")
+    if group_column not in table.columns:
+        raise ValueError(f"{stations_path} has no '{group_column}' column")
+    groups = table.set_index("station_id")[group_column].reindex(np.unique(station_ids))
+    mapping = {sid: (GLOBAL_KEY if value != value else f"{group_column}={value}") for sid, value in groups.items()}
+    return np.array([mapping[sid] for sid in station_ids])
+
+
+def bank_mean(bank, Xn, Xi, slots, head):
+    """
+    E[y] per row from each row's slot, in the shared standardized space.
+    """
+    h = ("in", "out").index(head)
+    mu = np.exp(np.einsum("nk,nk->n", Xn, bank["beta"][slots, h]))
+    return mu / (1.0 + np.exp(np.einsum("nk,nk->n", Xi, bank["gamma"][slots, h])))
+
+
+def fit_bank(rows, previous=None, keys=None, min_trips=DEFAULT_MIN_TRIPS, prior_trips=DEFAULT_PRIOR_TRIPS,
+             workers=None, maxiter=GROUP_MAXITER):
+    """
+    Global fit plus one shrunk fit per group with enough trips. Raises
+    ValueError if the global fit fails (see fit_failure); a failed group fit
+    falls back to the global slot.
+
+    Args:
+        rows: panel rows (load_panel)
+        previous: the "zinb" entry of the training state's coefficients.json, to warm-start
+            the global fit
+        keys: group key per row (default: station_id)
+
+    Returns:
+        tuple: (bank dict of arrays, per-slot stats list)
+    """
+    keys = rows["station_id"].astype(str) if keys is None else keys
+    t0 = time.perf_counter()
+    _, coefficients, global_stats = fit_zinb(rows, previous)
+    print(f"  global fit: {len(keys):,} rows, {time.perf_counter() - t0:.1f}s")
+    nb_mean, nb_scale = np.asarray(coefficients["nb_mean"]), np.asarray(coefficients["nb_scale"])
+    infl_mean, infl_scale = np.asarray(coefficients["infl_mean"]), np.asarray(coefficients["infl_scale"])
+    Xn = _standardize(np.column_stack([rows[f] for f in NB_FEATURES]), nb_mean, nb_scale)
+    Xi = _standardize(np.column_stack([rows[f] for f in INFL_FEATURES]), infl_mean, infl_scale)
+    global_params = {head: np.asarray(coefficients[head]) for head in ("in", "out")}
+
+    group_names, inverse = np.unique(keys, return_inverse=True)
+    trips = np.bincount(inverse, weights=rows["in"] + rows["out"], minlength=len(group_names))
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[order], np.arange(len(group_names) + 1))
+    tasks = []
+    for g, name in enumerate(group_names):
+        if name == GLOBAL_KEY or trips[g] < min_trips:
+            continue
+        idx = order[bounds[g]:bounds[g + 1]]
+        tasks.append((name, Xn[idx], Xi[idx], {head: rows[head][idx] for head in ("in", "out")},
+                      global_params, prior_trips, maxiter))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))
+    print(f"  {len(tasks)} of {len(group_names)} groups have >= {min_trips} trips; {workers} workers")
+    t0 = time.perf_counter()
+    if workers <= 1:
+        results = [_fit_slot(*task) for task in tasks]
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            results = list(pool.map(_fit_slot, *zip(*tasks), chunksize=max(1, len(tasks) // (4 * workers))))
+    print(f"  group fits: {time.perf_counter() - t0:.1f}s")
+
+    k_infl = len(INFL_FEATURES) + 1
+    slot_params = [global_params]
+    slot_keys, slot_stats = [GLOBAL_KEY], [dict(global_stats["in"], rows=len(keys))]
+    for name, params, stats in results:
+        if params is None:
+            print(f"  ⚠ {name}: {stats['error']}; using the global fit")
+            continue
+        slot_keys.append(name)
+        slot_params.append(params)
+        slot_stats.append(stats)
+    slot_of = {name: s for s, name in enumerate(slot_keys)}
+
+    station_ids = rows["station_id"].astype(str)
+    station_names, first = np.unique(station_ids, return_index=True)
+    station_slot = np.array([slot_of.get(keys[i], 0) for i in first], dtype=np.int64)
+    mapped = station_slot > 0
+
+    stack = lambda part: np.array([[p[head][part] for head in ("in", "out")] for p in slot_params])
+    bank = {
+        "nb_features": np.array(NB_FEATURES), "infl_features": np.array(INFL_FEATURES),
+        "links": np.array(["logit", "logit"]),
+        "gamma": stack(slice(0, k_infl)), "beta": stack(slice(k_infl, -1)), "alpha": stack(-1),
+        "nb_mean": nb_mean, "nb_scale": nb_scale, "infl_mean": infl_mean, "infl_scale": infl_scale,
+        "station_ids": station_names[mapped], "station_slot": station_slot[mapped],
+        "slot_keys": np.array(slot_keys),
+    }
+    return bank, slot_stats
+
+
+def evaluate(bank, rows, keys=None):
+    """
+    MAE of the global fit (slot 0) and of the bank on `rows`, per head.
+    """
+    Xn = _standardize(np.column_stack([rows[f] for f in NB_FEATURES]), bank["nb_mean"], bank["nb_scale"])
+    Xi = _standardize(np.column_stack([rows[f] for f in INFL_FEATURES]), bank["infl_mean"], bank["infl_scale"])
+    keys = rows["station_id"].astype(str) if keys is None else keys
+    slot_of = {name: s for s, name in enumerate(bank["slot_keys"])}
+    slots = np.array([slot_of.get(k, 0) for k in keys], dtype=np.int64)
+    scores = {}
+    for head in ("in", "out"):
+        scores[f"{head}_global"] = float(np.mean(np.abs(bank_mean(bank, Xn, Xi, np.zeros_like(slots), head) - rows[head])))
+        scores[f"{head}_bank"] = float(np.mean(np.abs(bank_mean(bank, Xn, Xi, slots, head) - rows[head])))
+    return scores
+
+
+def save_bank(bank, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, **bank)
+    tmp.replace(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--state-dir", default=str(DEFAULT_STATE_DIR), help="Training state from train_incremental.py")
+    parser.add_argument("-o", "--output", default=None, help="Bank file (default: <state-dir>/zinb_bank.npz)")
+    parser.add_argument("--stations", help="Station table holding --group-column")
+    parser.add_argument("--group-column", help="Station table column to pool stations by (e.g. a cluster id)")
+    parser.add_argument("--top-stations", type=int, default=0, help="Restrict to the N busiest stations (0 = all)")
+    parser.add_argument("--min-trips", type=int, default=DEFAULT_MIN_TRIPS,
+                        help="Groups with fewer trips keep the global fit")
+    parser.add_argument("--prior-trips", type=float, default=DEFAULT_PRIOR_TRIPS,
+                        help="Trips at which a group fit gets half weight against the global fit")
+    parser.add_argument("--holdout-months", type=int, default=0,
+                        help="Fit without the last N months and report their MAE (the bank is still written)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--maxiter", type=int, default=GROUP_MAXITER)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Fitting per-station ZINB model bank...")
+    print("=" * 60)
+    state = TrainingState(args.state_dir)
+    rows = select_stations(load_panel(args.state_dir), args.top_stations)
+    keys = group_keys(rows, args.stations, args.group_column)
+
+    holdout = None
+    if args.holdout_months:
+        months = np.unique(rows["year_month"])
+        if args.holdout_months >= len(months):
+            raise SystemExit(f"--holdout-months {args.holdout_months} leaves no training months")
+        test = rows["year_month"] >= months[-args.holdout_months]
+        holdout = ({name: values[test] for name, values in rows.items()}, keys[test])
+        rows, keys = {name: values[~test] for name, values in rows.items()}, keys[~test]
+
+    t0 = time.perf_counter()
+    try:
+        bank, slot_stats = fit_bank(rows, state.coefficients().get("zinb"), keys, args.min_trips,
+                                    args.prior_trips, args.workers, args.maxiter)
+    except ValueError as e:
+        raise SystemExit(f"✗ Global {e}")
+    output = args.output or Path(args.state_dir) / "zinb_bank.npz"
+    save_bank(bank, output)
+
+    print("\n" + "=" * 60)
+    print(f"✓ Wrote {output}: {len(bank['slot_keys'])} slots (slot 0 = global), "
+          f"{len(bank['station_ids'])} stations mapped in {time.perf_counter() - t0:.1f}s")
+    print(f"  size: {os.path.getsize(output):,} bytes")
+    for label, (eval_rows, eval_keys) in [("train", (rows, keys))] + ([("holdout", holdout)] if holdout else []):
+        scores = evaluate(bank, eval_rows, eval_keys)
+        print(f"  {label} MAE  IN {scores['in_global']:.4f} -> {scores['in_bank']:.4f}   "
+              f"OUT {scores['out_global']:.4f} -> {scores['out_bank']:.4f}  (global -> bank)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
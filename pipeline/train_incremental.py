@@ -0,0 +1,649 @@
+"""
+Incremental ZINB / NB retraining
+
+Replaces re-running ZINB_with_feature.ipynb over every month on each refresh.
+Each stage persists its output under --state-dir, one file per month:
+
+    aggregates/YYYYMM.npz   stage 1: sparse IN/OUT station-hour counts of one trip file
+    panel/YYYYMM.npz        stage 2: model rows (features + targets) for the hours of that month
+    coefficients.json       stage 3: fitted parameters and the scaler statistics they assume
+    manifest.json           processed months (source SHA-256), fit history
+
+A new YYYYMM-bluebikes-tripdata.csv is aggregated on its own. Its panel rows
+need the previous month's aggregate only for the 24-hour lags at the start of
+the month and for trips that ended after midnight on the 1st, so older months
+are never re-read. The fit then starts from the previous coefficients,
+re-expressed for the updated feature scaling, and converges in a handful of
+iterations instead of a cold start.
+
+Usage:
+    python pipeline/train_incremental.py data/2024_data/*-bluebikes-tripdata.csv \
+        --weather data/2024_data/Weather/*-weather.csv \
+        --stations flask/station_features.csv -o flask/zinb_models.pkl
+    python pipeline/train_incremental.py ... --nb-boost-output flask/nb_boost_model.pkl
+"""
+import argparse
+import json
+import pickle
+import re
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "flask"))
+from bike_time import NS_PER_HOUR
+from station_store import derive_distance_features
+from trip_cache import file_digest
+from trip_ingest import DEFAULT_CHUNKSIZE, TripAggregator
+from weather import load_weather
+
+
+STATE_VERSION = 1
+# Bump when build_month_rows changes; panels are then rebuilt from the stored aggregates
+PANEL_VERSION = 2
+DEFAULT_STATE_DIR = Path("data/training")
+LAG_HOURS = 24
+MAX_COUNT = 50          # same outlier filter as the notebook
+DEFAULT_TOP_STATIONS = 20
+MAXITER = 1000
+# Residual booster of nb_with_boosting.ipynb
+BOOST_PARAMS = {"n_estimators": 300, "learning_rate": 0.1, "max_depth": 3}
+
+# Must match NB_FEATURES / INFL_FEATURES in flask/zinb_predictor.py
+NB_FEATURES = ["month", "start_hour", "end_hour", "subway_distance_m", "mbta_stops_250m",
+               "last_day_in", "last_day_out"]
+INFL_FEATURES = ["is_night", "precipitation", "avg_temp", "last_day_in", "last_day_out"]
+
+# Feature order of the NB GLM served by flask/model_loader.py (day_of_week 0 = Monday)
+NB_GLM_FEATURES = ["hour_of_day", "day_of_week", "month", "is_weekend", "station_lat", "station_lng",
+                   "dist_subway_m", "dist_bus_m", "dist_university_m", "dist_business",
+                   "dist_residential", "restaurant_count"]
+
+ZINB_STATION_COLUMNS = ["subway_distance_m", "mbta_stops_250m"]
+OPTIONAL_STATION_COLUMNS = ["station_lat", "station_lng", "dist_subway_m", "dist_bus_m",
+                            "dist_university_m", "dist_business", "dist_residential", "restaurant_count"]
+STATION_ALIASES = {"latitude": "station_lat", "longitude": "station_lng"}
+
+MONTH_PATTERN = re.compile(r"(\d{6})-bluebikes-tripdata")
+WEATHER_PATTERN = re.compile(r"(\d{6})-weather")
+
+
+def month_key(path, pattern=MONTH_PATTERN):
+    match = pattern.search(Path(path).name)
+    if not match:
+        raise ValueError(f"{path}: expected a YYYYMM-prefixed file name")
+    return match.group(1)
+
+
+def previous_month(key):
+    year, month = int(key[:4]), int(key[4:])
+    return f"{year - 1}12" if month == 1 else f"{year}{month - 1:02d}"
+
+
+def month_hours(key):
+    """
+    [first, last] epoch hours of a YYYYMM month.
+    """
+    start = pd.Timestamp(f"{key[:4]}-{key[4:]}-01")
+    end = start + pd.offsets.MonthBegin(1)
+    return start.value // NS_PER_HOUR, end.value // NS_PER_HOUR - 1
+
+
+# ---------------------------------------------------------------------------
+# Stage 1: per-month aggregates
+# ---------------------------------------------------------------------------
+
+def save_aggregate(aggregator, path):
+    meta = aggregator.stations.to_frame()
+    out_keys, out_counts = aggregator.outs.compact().keys, aggregator.outs.counts
+    in_keys, in_counts = aggregator.ins.compact().keys, aggregator.ins.counts
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        path,
+        station_id=meta["station_id"].astype(str).to_numpy(dtype=str),
+        station_name=meta["station_name"].fillna("").astype(str).to_numpy(dtype=str),
+        latitude=meta["latitude"].to_numpy(dtype=np.float64),
+        longitude=meta["longitude"].to_numpy(dtype=np.float64),
+        out_keys=out_keys, out_counts=out_counts,
+        in_keys=in_keys, in_counts=in_counts,
+        n_trips=np.int64(aggregator.n_trips),
+    )
+
+
+def load_aggregate(path):
+    with np.load(path, allow_pickle=False) as data:
+        aggregator = TripAggregator()
+        aggregator.stations.ids = pd.Index(data["station_id"].astype(object), dtype=object)
+        aggregator.stations._meta = [
+            (name or pd.NA, lat, lng)
+            for name, lat, lng in zip(data["station_name"].tolist(), data["latitude"], data["longitude"])
+        ]
+        aggregator.outs.keys, aggregator.outs.counts = data["out_keys"], data["out_counts"]
+        aggregator.ins.keys, aggregator.ins.counts = data["in_keys"], data["in_counts"]
+        aggregator.n_trips = int(data["n_trips"])
+    return aggregator
+
+
+# ---------------------------------------------------------------------------
+# Stage 2: per-month model rows
+# ---------------------------------------------------------------------------
+
+def read_station_table(path):
+    """
+    Station attributes indexed by station_id. subway_distance_m / mbta_stops_250m
+    come from dist_subway_m / dist_bus_m where the table lacks them, exactly as
+    the server derives them (station_store.derive_distance_features).
+    """
+    table = pd.read_csv(path, dtype={"station_id": "string"})
+    for alias, column in STATION_ALIASES.items():
+        if column not in table.columns and alias in table.columns:
+            table[column] = table[alias]
+    table = derive_distance_features(table)
+    missing = [c for c in ZINB_STATION_COLUMNS if c not in table.columns]
+    if missing:
+        raise ValueError(f"{path} is missing {missing}; build it with pipeline/build_station_table.py")
+    columns = ZINB_STATION_COLUMNS + [c for c in OPTIONAL_STATION_COLUMNS
+                                      if c in table.columns and c not in ZINB_STATION_COLUMNS]
+    return table.drop_duplicates("station_id").set_index("station_id")[columns].astype(np.float64)
+
+
+def build_month_rows(key, aggregator, stations, weather):
+    """
+    Model rows for every station-hour of month `key`.
+
+    Args:
+        aggregator: counts covering the month and the 24 hours before it
+        stations: station attributes indexed by station_id (read_station_table)
+        weather: WeatherTable (weather.load_weather)
+
+    Returns:
+        dict: column -> ndarray, hour-major (row = hour * n_stations + station)
+    """
+    first, last = month_hours(key)
+    hours, ins, outs = aggregator.dense_counts(start_hour=first - LAG_HOURS, end_hour=last)
+
+    ids = aggregator.stations.ids.to_numpy().astype(str)
+    attrs = stations.reindex(ids)
+    known = attrs[ZINB_STATION_COLUMNS].notna().all(axis=1).to_numpy()
+    ids, attrs = ids[known], attrs[known]
+    ins, outs = ins[:, known], outs[:, known]
+    n_hours, n_stations = ins.shape[0] - LAG_HOURS, len(ids)
+
+    timestamps = pd.DatetimeIndex(hours[LAG_HOURS:] * NS_PER_HOUR)
+    start_hour = timestamps.hour.to_numpy()
+    day_of_week = timestamps.dayofweek.to_numpy()
+    weather_values = weather.lookup(hours[LAG_HOURS:] * NS_PER_HOUR)
+    per_hour = {
+        "month": timestamps.month.to_numpy(),
+        "start_hour": start_hour,
+        "end_hour": (start_hour + 1) % 24,
+        "is_night": ((start_hour >= 22) | (start_hour <= 4)).astype(np.int64),
+        "hour_of_day": start_hour,
+        "day_of_week": day_of_week,
+        "is_weekend": (day_of_week >= 5).astype(np.int64),
+        "precipitation": weather_values[:, 0],
+        "avg_temp": weather_values[:, 1],
+    }
+    rows = {name: np.repeat(values.astype(np.float64), n_stations) for name, values in per_hour.items()}
+    for column in attrs.columns:
+        rows[column] = np.tile(attrs[column].to_numpy(), n_hours)
+    rows["in"] = ins[LAG_HOURS:].ravel()
+    rows["out"] = outs[LAG_HOURS:].ravel()
+    rows["last_day_in"] = ins[:-LAG_HOURS].ravel().astype(np.float64)
+    rows["last_day_out"] = outs[:-LAG_HOURS].ravel().astype(np.float64)
+    rows["station_id"] = np.tile(ids, n_hours)
+    rows["epoch_hour"] = np.repeat(hours[LAG_HOURS:], n_stations)
+
+    keep = ((rows["in"] <= MAX_COUNT) & (rows["out"] <= MAX_COUNT)
+            & (rows["last_day_in"] <= MAX_COUNT) & (rows["last_day_out"] <= MAX_COUNT))
+    return {name: values[keep] for name, values in rows.items()}
+
+
+def load_rows(paths):
+    parts = []
+    for path in paths:
+        with np.load(path, allow_pickle=False) as data:
+            parts.append({name: data[name] for name in data.files})
+            parts[-1]["year_month"] = np.full(len(data["in"]), int(Path(path).stem))
+    columns = set.intersection(*(set(p) for p in parts))
+    return {name: np.concatenate([p[name] for p in parts]) for name in columns}
+
+
+def load_panel(state_dir=DEFAULT_STATE_DIR):
+    """
+    All stored panel rows (plus year_month) of a training state.
+    """
+    panels = sorted((Path(state_dir) / "panel").glob("*.npz"))
+    if not panels:
+        raise ValueError(f"No panel rows in {state_dir}; run pipeline/train_incremental.py first")
+    return load_rows(panels)
+
+
+# ---------------------------------------------------------------------------
+# Stage 3: warm-started fits
+# ---------------------------------------------------------------------------
+
+def select_stations(rows, top, within=None):
+    """
+    Restrict rows to the `top` busiest stations (0 = all), as the notebook does.
+    Activity is counted only over rows where the boolean mask `within` is set
+    (e.g. a backtest fold's training months); default all rows.
+    """
+    if not top:
+        return rows
+    ids, inverse = np.unique(rows["station_id"], return_inverse=True)
+    weights = rows["in"] + rows["out"]
+    if within is not None:
+        weights = np.where(within, weights, 0)
+    activity = np.bincount(inverse, weights=weights, minlength=len(ids))
+    chosen = np.zeros(len(ids), dtype=bool)
+    chosen[np.argsort(-activity, kind="stable")[:top]] = True
+    keep = chosen[inverse]
+    return {name: values[keep] for name, values in rows.items()}
+
+
+def rescale_params(coef, old_mean, old_scale, new_mean, new_scale):
+    """
+    Re-express `const + ((x - old_mean) / old_scale) · w` on new scaler
+    statistics, so a warm start predicts exactly what the previous model did.
+    """
+    coef = np.asarray(coef, dtype=np.float64)
+    w = coef[1:] / np.asarray(old_scale)
+    const = coef[0] + np.dot(w, np.asarray(new_mean) - np.asarray(old_mean))
+    return np.concatenate([[const], w * np.asarray(new_scale)])
+
+
+def _standardize(X, mean, scale):
+    return np.column_stack([np.ones(len(X)), (X - mean) / scale])
+
+
+def _scaler(mean, scale, n_samples):
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    scaler.mean_, scaler.scale_, scaler.var_ = mean, scale, scale ** 2
+    scaler.n_features_in_, scaler.n_samples_seen_ = len(mean), n_samples
+    return scaler
+
+
+def zinb_mean(params, Xn, Xi):
+    """
+    E[y] = (1 - expit(Xi · γ)) * exp(Xn · β) for a ZeroInflatedNegativeBinomialP
+    parameter vector (inflate_*, exog, alpha).
+    """
+    k_infl = Xi.shape[1]
+    gamma, beta = params[:k_infl], params[k_infl:k_infl + Xn.shape[1]]
+    return np.exp(Xn @ beta) / (1.0 + np.exp(Xi @ gamma))
+
+
+def fit_failure(fitted):
+    """
+    Why a statsmodels MLE fit must not be used (non-finite parameters, no
+    convergence, non-finite objective), or None if it is usable.
+    """
+    retvals = getattr(fitted, "mle_retvals", None) or {}
+    if not np.all(np.isfinite(np.asarray(fitted.params, dtype=np.float64))):
+        return "non-finite parameters"
+    if not retvals.get("converged", True):
+        return f"no convergence (warnflag {retvals.get('warnflag')})"
+    if not np.isfinite(retvals.get("fopt", 0.0)):
+        return f"non-finite objective ({retvals.get('fopt')})"
+    return None
+
+
+def fit_zinb(rows, previous=None, maxiter=MAXITER):
+    """
+    Fit the IN and OUT ZINB models, warm-started from `previous` coefficients.
+    Raises ValueError if either head fails (see fit_failure), before the
+    caller writes anything.
+
+    Returns:
+        tuple: (results dict head -> statsmodels results, coefficients dict, stats dict)
+    """
+    from statsmodels.discrete.count_model import ZeroInflatedNegativeBinomialP
+
+    Xn_raw = np.column_stack([rows[f] for f in NB_FEATURES])
+    Xi_raw = np.column_stack([rows[f] for f in INFL_FEATURES])
+    nb_mean, nb_scale = Xn_raw.mean(axis=0), Xn_raw.std(axis=0)
+    infl_mean, infl_scale = Xi_raw.mean(axis=0), Xi_raw.std(axis=0)
+    nb_scale[nb_scale == 0] = 1.0
+    infl_scale[infl_scale == 0] = 1.0
+    Xn = _standardize(Xn_raw, nb_mean, nb_scale)
+    Xi = _standardize(Xi_raw, infl_mean, infl_scale)
+
+    warm = (previous is not None and previous.get("nb_features") == NB_FEATURES
+            and previous.get("infl_features") == INFL_FEATURES)
+    results, stats = {}, {}
+    coefficients = {
+        "nb_features": NB_FEATURES, "infl_features": INFL_FEATURES,
+        "nb_mean": nb_mean.tolist(), "nb_scale": nb_scale.tolist(),
+        "infl_mean": infl_mean.tolist(), "infl_scale": infl_scale.tolist(),
+    }
+    k_infl = Xi.shape[1]
+    for head in ("in", "out"):
+        start = None
+        if warm:
+            old = np.asarray(previous[head])
+            start = np.concatenate([
+                rescale_params(old[:k_infl], previous["infl_mean"], previous["infl_scale"], infl_mean, infl_scale),
+                rescale_params(old[k_infl:-1], previous["nb_mean"], previous["nb_scale"], nb_mean, nb_scale),
+                old[-1:],
+            ])
+        t0 = time.perf_counter()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            model = ZeroInflatedNegativeBinomialP(rows[head], Xn, exog_infl=Xi, p=2)
+            # Serving only needs params; the numerical Hessian for standard errors
+            # would cost more than the optimization itself
+            fitted = model.fit(start_params=start, method="bfgs", maxiter=maxiter, disp=False,
+                               skip_hessian=True)
+        failure = fit_failure(fitted)
+        if failure is not None:
+            raise ValueError(f"ZINB {head.upper()} fit failed ({failure}); the previous model was left in place")
+        params = np.asarray(fitted.params, dtype=np.float64)
+        results[head] = fitted
+        coefficients[head] = params.tolist()
+        stats[head] = {
+            "warm_start": start is not None,
+            "gradient_calls": int(fitted.mle_retvals.get("gcalls", -1)),
+            "converged": bool(fitted.mle_retvals.get("converged", False)),
+            "seconds": round(time.perf_counter() - t0, 2),
+            "mae": float(np.mean(np.abs(zinb_mean(params, Xn, Xi) - rows[head]))),
+        }
+    return results, coefficients, stats
+
+
+def fit_nb_glm(rows, previous=None):
+    """
+    Warm-started NB GLM for arrivals in the layout flask/model_loader.py loads
+    (imputer + model + alpha + feature_names). Skipped when the station table
+    lacks its feature columns.
+    """
+    import statsmodels.api as sm
+    from sklearn.impute import SimpleImputer
+
+    missing = [f for f in NB_GLM_FEATURES if f not in rows]
+    if missing:
+        return None, None, {"skipped": f"station table has no {missing}"}
+
+    alpha = previous.get("alpha", 1.0) if previous else 1.0
+    imputer = SimpleImputer(strategy="median").fit(np.column_stack([rows[f] for f in NB_GLM_FEATURES]))
+    X = sm.add_constant(imputer.transform(np.column_stack([rows[f] for f in NB_GLM_FEATURES])),
+                        has_constant="add")
+    start = None
+    if previous and previous.get("feature_names") == NB_GLM_FEATURES:
+        start = np.asarray(previous["params"], dtype=np.float64)
+
+    t0 = time.perf_counter()
+    model = sm.GLM(rows["in"], X, family=sm.families.NegativeBinomial(alpha=alpha))
+    fitted = model.fit(start_params=start, maxiter=100)
+    payload = {"model": fitted, "imputer": imputer, "alpha": alpha, "feature_names": NB_GLM_FEATURES}
+    coefficients = {"params": np.asarray(fitted.params).tolist(), "alpha": alpha,
+                    "feature_names": NB_GLM_FEATURES}
+    stats = {
+        "warm_start": start is not None,
+        "iterations": int(fitted.fit_history.get("iteration", -1)),
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+    return payload, coefficients, stats
+
+
+def fit_nb_boost(rows, previous=None, boost_params=BOOST_PARAMS):
+    """
+    Two-stage model of nb_with_boosting.ipynb for both heads, in the layout
+    flask/boosted_predictor.py loads: a warm-started NB GLM per head plus a
+    GradientBoostingRegressor on its residuals (trees always refit).
+
+    Returns:
+        tuple: (pickle payload or None, coefficients dict, stats dict)
+    """
+    import statsmodels.api as sm
+    from sklearn.ensemble import GradientBoostingRegressor
+    from sklearn.impute import SimpleImputer
+
+    missing = [f for f in NB_GLM_FEATURES if f not in rows]
+    if missing:
+        return None, None, {"skipped": f"station table has no {missing}"}
+
+    alpha = previous.get("alpha", 1.0) if previous else 1.0
+    raw = np.column_stack([rows[f] for f in NB_GLM_FEATURES])
+    imputer = SimpleImputer(strategy="median").fit(raw)
+    X_imputed = imputer.transform(raw)
+    X = sm.add_constant(X_imputed, has_constant="add")
+    warm = previous and previous.get("feature_names") == NB_GLM_FEATURES
+    models, boosters, params, stats = {}, {}, {}, {}
+    for head in ("in", "out"):
+        start = np.asarray(previous["params"][head], dtype=np.float64) if warm else None
+        t0 = time.perf_counter()
+        models[head] = sm.GLM(rows[head], X, family=sm.families.NegativeBinomial(alpha=alpha)).fit(
+            start_params=start, maxiter=100)
+        glm_seconds = time.perf_counter() - t0
+        residual = rows[head] - models[head].predict(X)
+        boosters[head] = GradientBoostingRegressor(loss="squared_error", random_state=0, **boost_params).fit(
+            X_imputed, residual)
+        params[head] = np.asarray(models[head].params).tolist()
+        stats[head] = {
+            "warm_start": start is not None,
+            "iterations": int(models[head].fit_history.get("iteration", -1)),
+            "glm_seconds": round(glm_seconds, 2),
+            "boost_seconds": round(time.perf_counter() - t0 - glm_seconds, 2),
+        }
+    payload = {"imputer": imputer, "alpha": alpha, "feature_names": NB_GLM_FEATURES,
+               "models": models, "boosters": boosters}
+    coefficients = {"params": params, "alpha": alpha, "feature_names": NB_GLM_FEATURES}
+    return payload, coefficients, stats
+
+
+# ---------------------------------------------------------------------------
+# Orchestration
+# ---------------------------------------------------------------------------
+
+class TrainingState:
+    """
+    Stage artifacts and manifest under one directory.
+    """
+
+    def __init__(self, state_dir=DEFAULT_STATE_DIR):
+        self.dir = Path(state_dir)
+        self.manifest_path = self.dir / "manifest.json"
+        self.coefficients_path = self.dir / "coefficients.json"
+        if self.manifest_path.exists():
+            self.manifest = json.loads(self.manifest_path.read_text())
+            if self.manifest.get("version") != STATE_VERSION:
+                raise ValueError(f"{self.manifest_path} has state version {self.manifest.get('version')}, "
+                                 f"expected {STATE_VERSION}; rebuild with a fresh --state-dir")
+        else:
+            self.manifest = {"version": STATE_VERSION, "months": {}, "stations": None, "fits": []}
+
+    def aggregate_path(self, key):
+        return self.dir / "aggregates" / f"{key}.npz"
+
+    def panel_path(self, key):
+        return self.dir / "panel" / f"{key}.npz"
+
+    def coefficients(self):
+        if self.coefficients_path.exists():
+            return json.loads(self.coefficients_path.read_text())
+        return {}
+
+    def _write_json(self, path, payload):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload, indent=2))
+        tmp.replace(path)
+
+    def save(self, coefficients=None):
+        if coefficients is not None:
+            self._write_json(self.coefficients_path, coefficients)
+        self._write_json(self.manifest_path, self.manifest)
+
+
+def update(paths, weather_paths, stations_path, state_dir=DEFAULT_STATE_DIR, output=None,
+           nb_output=None, top_stations=DEFAULT_TOP_STATIONS, cache_dir=None, cold=False,
+           refit=False, chunksize=DEFAULT_CHUNKSIZE, nb_boost_output=None):
+    """
+    Bring the training state up to date with `paths` and refit if anything changed.
+
+    Returns:
+        dict: summary of the run (months aggregated / rebuilt, fit stats)
+    """
+    state = TrainingState(state_dir)
+    months = state.manifest["months"]
+    sources = {month_key(p): Path(p) for p in paths}
+    weather_by_month = {month_key(p, WEATHER_PATTERN): Path(p) for p in weather_paths}
+    summary = {"aggregated": [], "panels": [], "fit": None}
+
+    # Stage 1: aggregate new or changed trip files only
+    changed = set()
+    for key in sorted(sources):
+        digest = file_digest(sources[key])
+        entry = months.get(key)
+        if entry and entry["sha256"] == digest and state.aggregate_path(key).exists():
+            continue
+        t0 = time.perf_counter()
+        aggregator = TripAggregator(chunksize=chunksize, cache_dir=cache_dir).add_file(sources[key])
+        save_aggregate(aggregator, state.aggregate_path(key))
+        months[key] = {"source": sources[key].name, "sha256": digest, "trips": aggregator.n_trips,
+                       "aggregate_seconds": round(time.perf_counter() - t0, 1)}
+        changed.add(key)
+        summary["aggregated"].append(key)
+        print(f"  ✓ {key}: aggregated {aggregator.n_trips:,} trips ({months[key]['aggregate_seconds']}s)")
+
+    # Stage 2: rows for changed months, months whose lag source changed, and
+    # months whose weather or station attributes changed
+    stations_digest = file_digest(stations_path)
+    stations_changed = state.manifest.get("stations") != stations_digest
+    panels_stale = state.manifest.get("panel_version") != PANEL_VERSION
+    stations = read_station_table(stations_path)
+    rebuild = set()
+    for key, entry in months.items():
+        weather_path = weather_by_month.get(key)
+        weather_digest = file_digest(weather_path) if weather_path else None
+        if (key in changed or previous_month(key) in changed or stations_changed or panels_stale
+                or entry.get("weather_sha256") != weather_digest or not state.panel_path(key).exists()):
+            rebuild.add(key)
+            entry["weather_sha256"] = weather_digest
+
+    no_weather = sorted(k for k in rebuild if k not in weather_by_month)
+    if no_weather:
+        print(f"⚠ No weather file for {', '.join(no_weather)}; their rows will be dropped from the fit")
+    for key in sorted(rebuild):
+        t0 = time.perf_counter()
+        aggregator = TripAggregator()
+        prev = previous_month(key)
+        if prev in months and state.aggregate_path(prev).exists():
+            aggregator.merge(load_aggregate(state.aggregate_path(prev)))
+        aggregator.merge(load_aggregate(state.aggregate_path(key)))
+        weather = load_weather([p for k, p in weather_by_month.items() if k in (prev, key)], cache_dir)
+        rows = build_month_rows(key, aggregator, stations, weather)
+        state.panel_path(key).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(state.panel_path(key), **rows)
+        months[key]["rows"] = int(len(rows["in"]))
+        months[key]["panel_seconds"] = round(time.perf_counter() - t0, 1)
+        summary["panels"].append(key)
+        print(f"  ✓ {key}: {len(rows['in']):,} panel rows ({months[key]['panel_seconds']}s)")
+    state.manifest["stations"] = stations_digest
+    state.manifest["panel_version"] = PANEL_VERSION
+    state.save()
+
+    if not (rebuild or refit or cold):
+        print("✓ Training state is up to date; nothing to refit")
+        return summary
+
+    # Stage 3: warm-started fit over all months
+    t0 = time.perf_counter()
+    rows = load_rows([state.panel_path(k) for k in sorted(months)])
+    rows = select_stations(rows, top_stations)
+    complete = np.all([np.isfinite(rows[f]) for f in set(NB_FEATURES + INFL_FEATURES)], axis=0)
+    if not complete.all():
+        print(f"⚠ Dropping {(~complete).sum():,} rows with missing features (e.g. no weather file)")
+        rows = {name: values[complete] for name, values in rows.items()}
+    if len(rows["in"]) == 0:
+        raise ValueError("No complete training rows; check the weather files and station table")
+
+    previous = {} if cold else state.coefficients()
+    results, zinb_coefficients, zinb_stats = fit_zinb(rows, previous.get("zinb"))
+    coefficients = {"zinb": zinb_coefficients}
+    fit = {"months": sorted(months), "rows": int(len(rows["in"])), "zinb": zinb_stats}
+    if nb_output:
+        nb_payload, nb_coefficients, fit["nb"] = fit_nb_glm(rows, previous.get("nb"))
+        if nb_payload is not None:
+            coefficients["nb"] = nb_coefficients
+            with open(nb_output, "wb") as f:
+                pickle.dump(nb_payload, f)
+    if nb_boost_output:
+        boost_payload, boost_coefficients, fit["nb_boost"] = fit_nb_boost(rows, previous.get("nb_boost"))
+        if boost_payload is not None:
+            coefficients["nb_boost"] = boost_coefficients
+            with open(nb_boost_output, "wb") as f:
+                pickle.dump(boost_payload, f)
+    for kind in ("nb", "nb_boost"):
+        if kind not in coefficients and kind in previous:
+            coefficients[kind] = previous[kind]
+    fit["seconds"] = round(time.perf_counter() - t0, 1)
+    fit["fitted_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+    if output:
+        zc = zinb_coefficients
+        with open(output, "wb") as f:
+            pickle.dump({
+                "model_in": results["in"],
+                "model_out": results["out"],
+                "scaler_nb": _scaler(np.asarray(zc["nb_mean"]), np.asarray(zc["nb_scale"]), fit["rows"]),
+                "scaler_infl": _scaler(np.asarray(zc["infl_mean"]), np.asarray(zc["infl_scale"]), fit["rows"]),
+            }, f)
+    state.manifest["fits"].append(fit)
+    state.save(coefficients)
+    summary["fit"] = fit
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally update the training panel and refit ZINB / NB")
+    parser.add_argument("paths", nargs="+", help="Monthly *-bluebikes-tripdata.csv files (old and new)")
+    parser.add_argument("--weather", nargs="*", default=[], help="Monthly *-weather.csv files")
+    parser.add_argument("--stations", default="flask/station_features.csv",
+                        help="Station table from build_station_table.py")
+    parser.add_argument("--state-dir", default=str(DEFAULT_STATE_DIR))
+    parser.add_argument("-o", "--output", default="flask/zinb_models.pkl",
+                        help="ZINB pickle for `make export-model`")
+    parser.add_argument("--nb-output", default=None, help="Also refit the NB GLM into this pickle")
+    parser.add_argument("--nb-boost-output", default=None,
+                        help="Also refit the NB GLM + residual boosting model (both heads) into this pickle "
+                             "(e.g. flask/nb_boost_model.pkl)")
+    parser.add_argument("--top-stations", type=int, default=DEFAULT_TOP_STATIONS,
+                        help="Train on the N busiest stations (0 = all)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Read trips / weather from this Parquet cache when fresh (see trip_cache.py)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--refit", action="store_true", help="Refit even if no month changed")
+    parser.add_argument("--cold", action="store_true", help="Ignore previous coefficients (full refit)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Updating training state in {args.state_dir}...")
+    print("=" * 60)
+    t0 = time.perf_counter()
+    summary = update(args.paths, args.weather, args.stations, args.state_dir, args.output,
+                     args.nb_output, args.top_stations, args.cache_dir, args.cold, args.refit,
+                     args.chunksize, args.nb_boost_output)
+    fit = summary["fit"]
+    if fit:
+        for head, stats in fit["zinb"].items():
+            print(f"  ZINB {head.upper()}: {stats['gradient_calls']} gradient calls "
+                  f"({'warm' if stats['warm_start'] else 'cold'} start, {stats['seconds']}s), "
+                  f"MAE {stats['mae']:.3f}")
+        if "nb" in fit:
+            print(f"  NB GLM: {fit['nb']}")
+        if "nb_boost" in fit:
+            print(f"  NB + boosting: {fit['nb_boost']}")
+        print(f"✓ Refit on {fit['rows']:,} rows from {len(fit['months'])} months -> {args.output}")
+    print(f"✓ Done in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
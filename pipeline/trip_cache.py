@@ -0,0 +1,252 @@
+"""
+Parquet cache for raw trip and weather files
+
+Converts each monthly CSV once into a typed, zstd-compressed, column-pruned
+Parquet file. A JSON manifest next to the Parquet file records the source
+file's SHA-256, size and mtime; the cache is only used while the source
+still matches, otherwise loaders fall back to parsing the CSV.
+
+Loaders read just the columns they ask for through a memory-mapped
+ParquetFile, in record batches, so the CSV parsing cost is paid once.
+
+Usage:
+    python pipeline/trip_cache.py data/2023_data/Bluebikes/*-bluebikes-tripdata.csv \
+        --weather data/2023_data/Weather/*-weather.csv --cache-dir data/cache
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "flask"))
+from bike_time import detect_layout
+from trip_ingest import DEFAULT_CHUNKSIZE, read_trip_chunks
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = Path("data/cache")
+COMPRESSION = "zstd"
+TIME_COLUMNS = ("start_time", "stop_time")
+
+
+def file_digest(path, block_size=1 << 20):
+    """
+    SHA-256 of a file, streamed in 1 MB blocks.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_paths(source, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Return (parquet path, manifest path) for a source CSV.
+    """
+    cache_dir = Path(cache_dir)
+    parquet = cache_dir / f"{Path(source).stem}.parquet"
+    return parquet, parquet.with_suffix(".parquet.json")
+
+
+def _source_stat(source):
+    st = os.stat(source)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def is_fresh(source, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    True when the cached Parquet file was built from the current contents
+    of `source`. Size + mtime are checked first; the hash is only recomputed
+    when they differ (e.g. after a re-download of identical data).
+    """
+    parquet, manifest_path = cache_paths(source, cache_dir)
+    if not (parquet.exists() and manifest_path.exists()):
+        return False
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        return False
+    if manifest.get("version") != CACHE_VERSION:
+        return False
+
+    stat = _source_stat(source)
+    if stat == {"size": manifest.get("size"), "mtime_ns": manifest.get("mtime_ns")}:
+        return True
+    if stat["size"] != manifest.get("size") or file_digest(source) != manifest.get("sha256"):
+        return False
+    # Same bytes, new mtime: refresh the manifest so the next check is cheap
+    manifest.update(stat)
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+    return True
+
+
+def _write_manifest(source, manifest_path, kind, columns):
+    manifest = {
+        "version": CACHE_VERSION,
+        "kind": kind,
+        "source": str(source),
+        "sha256": file_digest(source),
+        "columns": columns,
+        **_source_stat(source),
+    }
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+
+
+def _typed_trip_chunk(chunk, layout):
+    """
+    Parse timestamp columns once so cached files store typed timestamps.
+    """
+    fmt = "ISO8601" if layout == "iso" else "mixed"
+    for col in TIME_COLUMNS:
+        values = chunk[col].str.strip().str.replace("\u200b", "", regex=False)
+        chunk[col] = pd.to_datetime(values, format=fmt, errors="coerce").astype("datetime64[s]")
+    return chunk
+
+
+def convert_trips(source, cache_dir=DEFAULT_CACHE_DIR, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Convert a trip CSV to Parquet chunk by chunk (bounded memory).
+
+    Returns:
+        Path: the Parquet file
+    """
+    if not HAS_PYARROW:
+        raise ImportError("pyarrow is required to build the Parquet cache")
+    parquet, manifest_path = cache_paths(source, cache_dir)
+    parquet.parent.mkdir(parents=True, exist_ok=True)
+    tmp = parquet.with_suffix(".parquet.tmp")
+
+    writer = None
+    layout = None
+    try:
+        for chunk in read_trip_chunks(source, chunksize):
+            if layout is None:
+                layout = detect_layout(chunk["start_time"])
+            table = pa.Table.from_pandas(_typed_trip_chunk(chunk, layout), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema, compression=COMPRESSION)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp, parquet)
+    _write_manifest(source, manifest_path, "trips", pq.ParquetFile(parquet).schema_arrow.names)
+    return parquet
+
+
+def convert_weather(source, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Convert a monthly weather CSV (small) to Parquet with typed columns.
+    """
+    if not HAS_PYARROW:
+        raise ImportError("pyarrow is required to build the Parquet cache")
+    parquet, manifest_path = cache_paths(source, cache_dir)
+    parquet.parent.mkdir(parents=True, exist_ok=True)
+
+    df = pd.read_csv(source, skipinitialspace=True)
+    df.columns = df.columns.str.strip()
+    if "date" in df.columns:
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    if "precipitation" in df.columns:
+        # 'T' = trace amount, same handling as transform_weather_data
+        df["precipitation"] = pd.to_numeric(df["precipitation"].replace("T", "0.0"), errors="coerce")
+    df.to_parquet(parquet, index=False, compression=COMPRESSION)
+    _write_manifest(source, manifest_path, "weather", list(df.columns))
+    return parquet
+
+
+def ensure_cached(source, cache_dir=DEFAULT_CACHE_DIR, kind="trips"):
+    """
+    Build (or rebuild) the cache entry for `source` if it is missing or stale.
+
+    Returns:
+        bool: True if a conversion was run
+    """
+    if is_fresh(source, cache_dir):
+        return False
+    if kind == "weather":
+        convert_weather(source, cache_dir)
+    else:
+        convert_trips(source, cache_dir)
+    return True
+
+
+def iter_trip_chunks(source, columns=None, cache_dir=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Yield trip chunks with canonical column names, from the Parquet cache
+    when it is fresh, otherwise from the CSV.
+
+    Cached chunks carry datetime64 `start_time` / `stop_time`; CSV chunks
+    carry the raw strings. bike_time.parse_hour_bucket accepts both.
+
+    Args:
+        source: path to the original CSV
+        columns: optional list of canonical columns to read
+        cache_dir: cache directory, or None to always read the CSV
+    """
+    if cache_dir is not None and HAS_PYARROW and is_fresh(source, cache_dir):
+        parquet, _ = cache_paths(source, cache_dir)
+        pf = pq.ParquetFile(parquet, memory_map=True)
+        if columns is not None:
+            columns = [c for c in columns if c in pf.schema_arrow.names]
+        for batch in pf.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    for chunk in read_trip_chunks(source, chunksize):
+        yield chunk[[c for c in columns if c in chunk.columns]] if columns is not None else chunk
+
+
+def read_weather(source, cache_dir=None):
+    """
+    Load a weather file from the cache when fresh, otherwise from CSV.
+    """
+    if cache_dir is not None and HAS_PYARROW and is_fresh(source, cache_dir):
+        parquet, _ = cache_paths(source, cache_dir)
+        return pd.read_parquet(parquet, memory_map=True)
+    df = pd.read_csv(source, skipinitialspace=True)
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert trip/weather CSVs to a Parquet cache")
+    parser.add_argument("paths", nargs="*", help="Monthly *-bluebikes-tripdata.csv files")
+    parser.add_argument("--weather", nargs="*", default=[], help="Monthly *-weather.csv files")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR))
+    args = parser.parse_args()
+
+    if not HAS_PYARROW:
+        print("✗ pyarrow is not installed; loaders will keep reading CSV")
+        return
+
+    print("=" * 60)
+    print(f"Updating Parquet cache in {args.cache_dir}...")
+    print("=" * 60)
+    jobs = [(p, "trips") for p in sorted(args.paths)] + [(p, "weather") for p in sorted(args.weather)]
+    for path, kind in jobs:
+        t0 = time.perf_counter()
+        if ensure_cached(path, args.cache_dir, kind):
+            parquet, _ = cache_paths(path, args.cache_dir)
+            ratio = os.path.getsize(path) / max(os.path.getsize(parquet), 1)
+            print(f"  ✓ {Path(path).name} -> {parquet.name} "
+                  f"({time.perf_counter() - t0:.1f}s, {ratio:.1f}x smaller)")
+        else:
+            print(f"  - {Path(path).name} is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""
+Out-of-core Bluebikes trip ingestion
+
+Streams monthly trip CSVs in chunks with narrow dtypes, floors start/end
+times to the hour and counts OUT (undocks) / IN (docks) per station-hour
+incrementally. Partial aggregates are merged as flat integer keys, so memory
+is bounded by the number of distinct station-hours rather than the number of
+trips. Replaces `load_raw_data` / `transform_data` in ZINB_with_feature.ipynb
+and the `pd.concat` loader in nb_with_boosting.ipynb.
+
+Usage:
+    python pipeline/trip_ingest.py data/2023_data/Bluebikes/*-bluebikes-tripdata.csv \
+        -o data/hourly_panel.csv
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "flask"))
+from bike_time import NS_PER_HOUR, detect_layout, parse_hour_bucket
+
+
+DEFAULT_CHUNKSIZE = 500_000
+MAX_TRIP_HOURS = 24
+
+# Station codes occupy the low bits of a station-hour key: key = hour << 20 | code
+STATION_BITS = 20
+STATION_MASK = (1 << STATION_BITS) - 1
+
+# Canonical column names -> names used by the 2023+ and pre-2023 exports
+COLUMN_ALIASES = {
+    "start_time": ["started_at", "starttime"],
+    "stop_time": ["ended_at", "stoptime"],
+    "start_station_id": ["start_station_id", "start station id"],
+    "end_station_id": ["end_station_id", "end station id"],
+    "start_station_name": ["start_station_name", "start station name"],
+    "end_station_name": ["end_station_name", "end station name"],
+    "start_station_latitude": ["start_lat", "start station latitude"],
+    "start_station_longitude": ["start_lng", "start station longitude"],
+    "end_station_latitude": ["end_lat", "end station latitude"],
+    "end_station_longitude": ["end_lng", "end station longitude"],
+}
+COLUMN_DTYPES = {
+    "start_time": "string",
+    "stop_time": "string",
+    "start_station_id": "string",
+    "end_station_id": "string",
+    "start_station_name": "string",
+    "end_station_name": "string",
+    "start_station_latitude": "float32",
+    "start_station_longitude": "float32",
+    "end_station_latitude": "float32",
+    "end_station_longitude": "float32",
+}
+
+USE_COLUMNS = list(COLUMN_ALIASES)
+
+PANEL_COLUMNS = [
+    "timestart", "timeend",
+    "station_name",
+    "month", "day_of_week", "start_hour", "end_hour", "is_night",
+    "station_id", "latitude", "longitude",
+    "in", "out",
+    "last_hour_in", "last_hour_out",
+    "last_two_hour_in", "last_two_hour_out",
+    "last_three_hour_in", "last_three_hour_out",
+]
+
+
+def resolve_columns(csv_path):
+    """
+    Map canonical column names to the header of `csv_path`.
+
+    Returns:
+        dict: source column -> canonical column
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns
+    stripped = {c.strip(): c for c in header}
+    mapping = {}
+    for canonical, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in stripped:
+                mapping[stripped[alias]] = canonical
+                break
+    missing = {"start_time", "stop_time", "start_station_id", "end_station_id"} - set(mapping.values())
+    if missing:
+        raise ValueError(f"{csv_path}: missing required columns {sorted(missing)}")
+    return mapping
+
+
+def read_trip_chunks(csv_path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Yield DataFrame chunks of a trip CSV with canonical names and narrow dtypes.
+    Only the columns needed for station-hour counts are read.
+    """
+    mapping = resolve_columns(csv_path)
+    dtypes = {src: COLUMN_DTYPES[dst] for src, dst in mapping.items()}
+    reader = pd.read_csv(
+        csv_path,
+        usecols=list(mapping),
+        dtype=dtypes,
+        chunksize=chunksize,
+        skipinitialspace=True,
+    )
+    for chunk in reader:
+        yield chunk.rename(columns=mapping)
+
+
+class StationIndex:
+    """
+    Grows a stable station_id -> int32 code mapping across chunks and files,
+    and keeps the first-seen name / coordinates for each station.
+    """
+
+    def __init__(self):
+        self.ids = pd.Index([], dtype=object)
+        self._meta = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode(self, station_ids, names=None, lats=None, lngs=None):
+        """
+        Return int32 codes for `station_ids`, registering unseen stations.
+        """
+        values = station_ids.to_numpy(dtype=object)
+        codes = self.ids.get_indexer(values)
+        unseen = codes < 0
+        if unseen.any():
+            new_ids, first = np.unique(values[unseen].astype(str), return_index=True)
+            rows = np.flatnonzero(unseen)[first]
+            self.ids = self.ids.append(pd.Index(new_ids, dtype=object))
+            if len(self.ids) > STATION_MASK:
+                raise OverflowError("Too many stations for the station-hour key layout")
+            for row in rows:
+                self._meta.append((
+                    names.iloc[row] if names is not None else pd.NA,
+                    lats.iloc[row] if lats is not None else np.nan,
+                    lngs.iloc[row] if lngs is not None else np.nan,
+                ))
+            codes = self.ids.get_indexer(values)
+        return codes.astype(np.int32)
+
+    def to_frame(self):
+        meta = pd.DataFrame(self._meta, columns=["station_name", "latitude", "longitude"])
+        meta.insert(0, "station_id", self.ids.to_numpy())
+        return meta
+
+
+class HourlyCounts:
+    """
+    Sparse station-hour counter stored as sorted int64 keys + counts.
+    Partial aggregates are buffered and compacted once they grow past
+    `compact_every` entries so memory stays bounded.
+    """
+
+    def __init__(self, compact_every=5_000_000):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self._pending = []
+        self._pending_len = 0
+        self.compact_every = compact_every
+
+    def add(self, hours, codes):
+        """
+        Count one event per (hour, station code) pair.
+        """
+        keys = (hours.astype(np.int64) << STATION_BITS) | codes.astype(np.int64)
+        uniq, counts = np.unique(keys, return_counts=True)
+        self.add_counts(uniq, counts)
+
+    def add_counts(self, keys, counts):
+        self._pending.append((keys, counts))
+        self._pending_len += len(keys)
+        if self._pending_len >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        if not self._pending:
+            return self
+        keys = np.concatenate([self.keys] + [k for k, _ in self._pending])
+        counts = np.concatenate([self.counts] + [c for _, c in self._pending])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts, minlength=len(self.keys)).astype(np.int64)
+        self._pending = []
+        self._pending_len = 0
+        return self
+
+    def merge(self, other, code_map=None):
+        """
+        Add another counter's totals into this one.
+
+        Args:
+            other: HourlyCounts
+            code_map: optional array remapping `other`'s station codes
+                      into this counter's station index
+        """
+        other.compact()
+        keys = other.keys
+        if code_map is not None:
+            hours = keys >> STATION_BITS
+            codes = code_map[keys & STATION_MASK]
+            keys = (hours << STATION_BITS) | codes.astype(np.int64)
+        self.add_counts(keys, other.counts)
+        return self
+
+    def split(self):
+        """
+        Return (hours, station codes, counts) arrays.
+        """
+        self.compact()
+        return self.keys >> STATION_BITS, (self.keys & STATION_MASK).astype(np.int32), self.counts
+
+
+class TripAggregator:
+    """
+    Incremental IN/OUT station-hour aggregation over any number of trip files
+    """
+
+    def __init__(self, chunksize=DEFAULT_CHUNKSIZE, max_trip_hours=MAX_TRIP_HOURS, cache_dir=None):
+        self.chunksize = chunksize
+        self.cache_dir = cache_dir
+        self.max_trip_hours = max_trip_hours
+        self.stations = StationIndex()
+        self.outs = HourlyCounts()
+        self.ins = HourlyCounts()
+        self.n_trips = 0
+
+    def add_chunk(self, chunk, layout=None):
+        """
+        Count one chunk of trips.
+
+        Args:
+            chunk: DataFrame with canonical column names
+            layout: timestamp layout from bike_time.detect_layout (None = detect)
+        """
+        # Same cleaning as transform_data: drop incomplete rows and trips > 24h
+        chunk = chunk.dropna()
+        start = parse_hour_bucket(chunk["start_time"], layout)
+        stop = parse_hour_bucket(chunk["stop_time"], layout)
+        keep = (start >= 0) & (stop >= 0) & (stop - start <= self.max_trip_hours)
+        if not keep.all():
+            chunk = chunk[keep]
+            start, stop = start[keep], stop[keep]
+        if chunk.empty:
+            return
+
+        out_codes = self.stations.encode(
+            chunk["start_station_id"], chunk.get("start_station_name"),
+            chunk.get("start_station_latitude"), chunk.get("start_station_longitude"))
+        in_codes = self.stations.encode(
+            chunk["end_station_id"], chunk.get("end_station_name"),
+            chunk.get("end_station_latitude"), chunk.get("end_station_longitude"))
+
+        self.outs.add(start, out_codes)
+        self.ins.add(stop, in_codes)
+        self.n_trips += len(chunk)
+
+    def add_file(self, csv_path):
+        """
+        Stream one trip file, from the Parquet cache when `cache_dir` is set
+        and the cache entry is fresh.
+        """
+        from trip_cache import iter_trip_chunks
+
+        layout = None
+        for chunk in iter_trip_chunks(csv_path, USE_COLUMNS, self.cache_dir, self.chunksize):
+            # Timestamp layout is fixed per export, so detect it once per file
+            if layout is None:
+                layout = detect_layout(chunk["start_time"])
+            self.add_chunk(chunk, layout)
+        return self
+
+    def merge(self, other):
+        """
+        Fold another aggregator (e.g. from a different month) into this one.
+        """
+        meta = other.stations.to_frame()
+        code_map = self.stations.encode(
+            meta["station_id"], meta["station_name"], meta["latitude"], meta["longitude"])
+        self.outs.merge(other.outs, code_map)
+        self.ins.merge(other.ins, code_map)
+        self.n_trips += other.n_trips
+        return self
+
+    def hourly_counts(self):
+        """
+        Sparse station-hour counts: one row per station-hour with any activity.
+
+        Returns:
+            DataFrame: timestart, station_id, in, out
+        """
+        out_h, out_c, out_n = self.outs.split()
+        in_h, in_c, in_n = self.ins.split()
+        frame = pd.merge(
+            pd.DataFrame({"hour": out_h, "station_code": out_c, "out": out_n}),
+            pd.DataFrame({"hour": in_h, "station_code": in_c, "in": in_n}),
+            on=["hour", "station_code"], how="outer",
+        ).fillna({"in": 0, "out": 0})
+        frame["in"] = frame["in"].astype("int32")
+        frame["out"] = frame["out"].astype("int32")
+        frame["timestart"] = pd.to_datetime(frame.pop("hour").to_numpy() * NS_PER_HOUR)
+        frame["station_id"] = self.stations.ids.to_numpy()[frame.pop("station_code").to_numpy()]
+        return frame[["timestart", "station_id", "in", "out"]]
+
+    def dense_counts(self, start_hour=None, end_hour=None):
+        """
+        Dense (hours × stations) IN and OUT count matrices.
+
+        Returns:
+            tuple: (hours, ins, outs) where hours is an int64 array of epoch hours
+        """
+        out_h, out_c, out_n = self.outs.split()
+        in_h, in_c, in_n = self.ins.split()
+        all_h = np.concatenate([out_h, in_h])
+        if start_hour is None:
+            start_hour = int(all_h.min()) if len(all_h) else 0
+        if end_hour is None:
+            end_hour = int(all_h.max()) if len(all_h) else -1
+        hours = np.arange(start_hour, end_hour + 1, dtype=np.int64)
+        shape = (len(hours), len(self.stations))
+
+        def scatter(h, c, n):
+            grid = np.zeros(shape, dtype=np.int32)
+            m = (h >= start_hour) & (h <= end_hour)
+            np.add.at(grid, (h[m] - start_hour, c[m]), n[m])
+            return grid
+
+        return hours, scatter(in_h, in_c, in_n), scatter(out_h, out_c, out_n)
+
+    def to_panel(self, lags=(1, 2, 3)):
+        """
+        Full station × hour panel in the layout produced by transform_data.
+        Lag features are shifted on the dense grid, so they stay correct across
+        file (month) boundaries.
+        """
+        hours, ins, outs = self.dense_counts()
+        n_hours, n_stations = ins.shape
+
+        timestart = pd.to_datetime(np.repeat(hours, n_stations) * NS_PER_HOUR)
+        stations = self.stations.to_frame()
+        panel = pd.DataFrame({
+            "timestart": timestart,
+            "station_id": np.tile(stations["station_id"].to_numpy(), n_hours),
+            "station_name": np.tile(stations["station_name"].to_numpy(), n_hours),
+            "latitude": np.tile(stations["latitude"].to_numpy(), n_hours),
+            "longitude": np.tile(stations["longitude"].to_numpy(), n_hours),
+            "in": ins.ravel(),
+            "out": outs.ravel(),
+        })
+        panel["timeend"] = panel["timestart"] + pd.Timedelta(hours=1)
+
+        start_hour = panel["timestart"].dt.hour.astype("int8")
+        panel["month"] = panel["timestart"].dt.month.astype("int8")
+        panel["day_of_week"] = (panel["timestart"].dt.dayofweek + 1).astype("int8")  # 1=Monday, 7=Sunday
+        panel["start_hour"] = start_hour
+        panel["end_hour"] = panel["timeend"].dt.hour.astype("int8")
+        panel["is_night"] = ((start_hour >= 22) | (start_hour <= 4)).astype("int8")
+
+        names = {1: "last_hour", 2: "last_two_hour", 3: "last_three_hour"}
+        for lag in lags:
+            for col, grid in (("in", ins), ("out", outs)):
+                shifted = np.zeros_like(grid)
+                shifted[lag:] = grid[:-lag]
+                panel[f"{names.get(lag, f'lag{lag}')}_{col}"] = shifted.ravel()
+
+        columns = [c for c in PANEL_COLUMNS if c in panel.columns]
+        columns += [c for c in panel.columns if c not in columns]
+        return panel[columns]
+
+
+def aggregate_files(paths, chunksize=DEFAULT_CHUNKSIZE, cache_dir=None):
+    """
+    Stream `paths` through a single TripAggregator.
+    """
+    aggregator = TripAggregator(chunksize=chunksize, cache_dir=cache_dir)
+    for path in paths:
+        t0 = time.perf_counter()
+        trips_before = aggregator.n_trips
+        aggregator.add_file(path)
+        print(f"  ✓ {Path(path).name}: {aggregator.n_trips - trips_before:,} trips "
+              f"({time.perf_counter() - t0:.1f}s)")
+    return aggregator
+
+
+def write_frame(df, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the station-hour IN/OUT panel from trip CSVs")
+    parser.add_argument("paths", nargs="+", help="Monthly *-bluebikes-tripdata.csv files")
+    parser.add_argument("-o", "--output", default="data/hourly_panel.csv",
+                        help="Output path (.csv or .parquet)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--cache-dir", default=None,
+                        help="Read trips from this Parquet cache when fresh (see trip_cache.py)")
+    parser.add_argument("--sparse", action="store_true",
+                        help="Write only active station-hours (no full grid or lags)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Aggregating {len(args.paths)} trip files...")
+    print("=" * 60)
+    aggregator = aggregate_files(sorted(args.paths), args.chunksize, args.cache_dir)
+
+    if args.sparse:
+        frame = aggregator.hourly_counts()
+    else:
+        frame = aggregator.to_panel()
+
+    write_frame(frame, args.output)
+    print(f"✓ {aggregator.n_trips:,} trips, {len(aggregator.stations)} stations, "
+          f"{len(frame):,} rows -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
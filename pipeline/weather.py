@@ -0,0 +1,37 @@
+"""
+Weather join for training panels
+
+The loader and lookup live in flask/weather_store.py, so training rows and
+served requests see the same weather for the same hour. This module puts
+flask/ on the import path for pipeline scripts and reads the monthly
+files through the Parquet cache (trip_cache.read_weather).
+
+Usage:
+    from weather import join_weather, load_weather
+    panel = join_weather(panel, load_weather(paths, cache_dir))
+"""
+import sys
+from pathlib import Path
+
+from trip_cache import read_weather
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "flask"))
+from weather_store import WEATHER_COLUMNS, WeatherTable  # noqa: E402
+
+
+def load_weather(paths, cache_dir=None):
+    """
+    WeatherTable over the given *-weather.csv files.
+    """
+    return WeatherTable.from_frames([read_weather(path, cache_dir) for path in sorted(paths)])
+
+
+def join_weather(frame, table, time_column="timestart"):
+    """
+    Add precipitation / avg_temp for each row's `time_column` (NaN where no record covers it).
+    """
+    values = table.lookup(frame[time_column].to_numpy(dtype="datetime64[ns]"))
+    frame = frame.copy()
+    for j, name in enumerate(WEATHER_COLUMNS):
+        frame[name] = values[:, j]
+    return frame
@@ -7,6 +7,7 @@ echo "=========================================="
 # Test 1: Check if Flask is running
 echo -e "\n1️⃣ Testing Flask health endpoint..."
 curl -s http://localhost:5000/health | python3 -m json.tool || echo "❌ Flask is not running on port 5000"
+curl -s http://localhost:5000/ready | python3 -m json.tool || echo "❌ Model is not loaded yet"
 
 # Test 2: Test prediction endpoint
 echo -e "\n\n2️⃣ Testing prediction endpoint..."
@@ -27,6 +28,48 @@ curl -s -X POST http://localhost:5000/predict \
     "restaurant_count": 15
   }]' | python3 -m json.tool || echo "❌ Prediction endpoint failed"
 
+# Test 3: Test batch grid endpoint
+echo -e "\n\n3️⃣ Testing batch forecast endpoint..."
+curl -s -X POST http://localhost:5000/predict/batch \
+  -H "Content-Type: application/json" \
+  -d '{
+    "stations": [{
+      "station_id": "M32006",
+      "station_lat": 42.36,
+      "station_lng": -71.06,
+      "dist_subway_m": 100,
+      "dist_bus_m": 50,
+      "dist_university_m": 200,
+      "dist_business": 300,
+      "dist_residential": 400,
+      "restaurant_count": 15
+    }],
+    "start": "2024-06-01T00:00",
+    "hours": 3
+  }' | python3 -m json.tool || echo "❌ Batch endpoint failed"
+
+# Test 4: Test predictive distribution endpoint
+echo -e "\n\n4️⃣ Testing distribution endpoint..."
+curl -s -X POST http://localhost:5000/predict/distribution \
+  -H "Content-Type: application/json" \
+  -d '{
+    "rows": [{"station_id": "M32006", "timestamp": "2024-06-04T17:00"}],
+    "quantiles": [0.5, 0.9],
+    "at_least": [5, 10],
+    "max_count": 40
+  }' | python3 -m json.tool || echo "❌ Distribution endpoint failed"
+
+# Test 5: Test inventory simulation endpoint
+echo -e "\n\n5️⃣ Testing inventory simulation endpoint..."
+curl -s -X POST http://localhost:5000/simulate \
+  -H "Content-Type: application/json" \
+  -d '{
+    "stations": [{"station_id": "M32006", "inventory": 7, "capacity": 19}],
+    "start": "2024-06-04T06:00",
+    "hours": 6,
+    "samples": 1000
+  }' | python3 -m json.tool || echo "❌ Simulation endpoint failed"
+
 echo -e "\n=========================================="
 echo "✓ Tests complete"
 echo "=========================================="
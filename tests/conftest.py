@@ -0,0 +1,10 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Same layout the pipeline scripts assume: flask/ modules and pipeline/ modules
+# are imported by file name
+for directory in ("flask", "pipeline"):
+    if str(ROOT / directory) not in sys.path:
+        sys.path.append(str(ROOT / directory))
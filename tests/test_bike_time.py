@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+from bike_time import INVALID, parse_hour_bucket
+
+
+def test_non_ascii_row_after_detection_sample():
+    # The layout is detected from the first rows; a later '\u200b' must not
+    # break the fixed-offset path for the whole column
+    series = pd.Series(["2023-04-01 08:15:42"] * 1500 + ["2023-04-01 09:15:42\u200b", "2023-04-01 1é0:00:00"])
+    buckets = parse_hour_bucket(series)
+    expected = pd.Timestamp("2023-04-01 08:00").value // 3_600_000_000_000
+    assert (buckets[:1500] == expected).all()
+    assert buckets[1500] == expected + 1
+    assert buckets[1501] == INVALID
+
+
+def test_iso_layouts_match_pandas():
+    series = pd.Series(["2023-04-01 08:15:42", "2019-01-01 00:09:13.7980", "2023-04-01 8:15:42",
+                        "2024-02-29 23:59:59", None])
+    buckets = parse_hour_bucket(series)
+    reference = pd.to_datetime(series, format="mixed").dt.floor("h")
+    assert np.array_equal(buckets[:4], reference[:4].to_numpy(dtype="datetime64[h]").astype(np.int64))
+    assert buckets[4] == INVALID
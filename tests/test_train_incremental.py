@@ -0,0 +1,27 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from station_store import StationStore
+from train_incremental import ZINB_STATION_COLUMNS, read_station_table
+
+
+STATION_TABLE = Path(__file__).resolve().parent.parent / "flask" / "station_features.csv"
+
+
+def test_read_station_table_on_committed_csv():
+    table = read_station_table(STATION_TABLE)
+    assert list(table.columns[:len(ZINB_STATION_COLUMNS)]) == ZINB_STATION_COLUMNS
+    assert table[ZINB_STATION_COLUMNS].notna().all().all()
+    assert table.index.is_unique
+
+
+def test_station_table_matches_served_features():
+    # Training and serving must derive subway_distance_m / mbta_stops_250m alike
+    table = read_station_table(STATION_TABLE)
+    store = StationStore.from_frame(pd.read_csv(STATION_TABLE, dtype={"station_id": "string"}))
+    rows = store.lookup(station_ids=table.index.to_numpy())
+    for column in ZINB_STATION_COLUMNS:
+        served = store.values[rows, store.column_index[column]]
+        np.testing.assert_array_equal(served, table[column].to_numpy())